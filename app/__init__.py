@@ -4,6 +4,7 @@ from flask_login import LoginManager
 from flask_bcrypt import Bcrypt
 from flask_cors import CORS
 from flask_migrate import Migrate
+from sqlalchemy import text
 from .config import Config
 
 # Initialize extensions
@@ -22,6 +23,30 @@ def create_app():
 
     migrate = Migrate(app, db)
 
+    # One rule set for every table; strategy and house-edge tables are derived from it once
+    from .rules import create_rules
+    app.extensions['rules'] = create_rules(app.config)
+
+    # Live game state kept out of the database between actions
+    from .live_state import create_state_store
+    app.extensions['live_state'] = create_state_store(app.config)
+
+    # bcrypt runs on its own worker processes so logins cannot stall game requests
+    from .password_hashing import create_password_hasher
+    app.extensions['password_hasher'] = create_password_hasher(app.config)
+
+    # Background simulation jobs share one process pool, created on first use, and a few driver threads
+    from .sim_jobs import create_job_manager
+    app.extensions['sim_jobs'] = create_job_manager(app.config)
+
+    # Old finished sessions move out of the hot table in the background
+    from .archive import create_archiver
+    app.extensions['session_archiver'] = create_archiver(app)
+
+    # Shared multi-seat tables run as actors on their own event loop, started on first use
+    from .tables import create_table_server
+    app.extensions['tables'] = create_table_server(app)
+
     with app.app_context():
         from .models import User, GameSession
 
@@ -40,14 +65,26 @@ def create_app():
     # Import and register blueprints
     from .auth_routes import auth
     from .routes import main
+    from .table_routes import tables
     app.register_blueprint(auth, url_prefix="/api/auth")  # Authentication routes
     app.register_blueprint(main, url_prefix="/api/main")  # Main app routes
+    app.register_blueprint(tables, url_prefix="/api/tables")  # Shared multi-seat tables
+
+    # Request latency, SQL and pool stats and simulator throughput at /api/metrics
+    from .metrics import init_metrics
+    init_metrics(app, db)
+
+    # flask hands export/simulate/query for the columnar hand-record store, flask sessions archive
+    from .cli import hands_cli
+    app.cli.add_command(hands_cli)
+    from .archive import sessions_cli
+    app.cli.add_command(sessions_cli)
 
     # Test route for sanity checking
     @app.route("/api/health", methods=["GET"])
     def health_check():
         try:
-            db.session.execute("SELECT 1")  # Test database connection
+            db.session.execute(text("SELECT 1"))  # Test database connection
             return {"status": "OK", "message": "API is healthy!"}, 200
         except Exception as e:
             return {"status": "ERROR", "message": str(e)}, 500
@@ -58,4 +95,4 @@ def create_app():
 @login_manager.user_loader
 def load_user(user_id):
     from .models import User
-    return User.query.get(int(user_id))
+    return db.session.get(User, int(user_id))
@@ -0,0 +1,145 @@
+"""Moving finished game sessions from the hot table to the archive.
+
+game_sessions only takes inserts of finished hands, so it grows for ever
+unless old rows leave it. Sessions older than ARCHIVE_AFTER_DAYS are moved to
+game_sessions_archive in batches, each batch one INSERT ... SELECT plus DELETE
+in a single transaction, so a row is always in exactly one of the two tables
+under its original id. Per-user totals live in user_stats and the ledger and
+are not touched; history reads span both tables (see history.py).
+
+The move runs on a background thread every ARCHIVE_INTERVAL seconds once the
+app has served its first request, or on demand with flask sessions archive.
+The same loop purges idempotency keys older than IDEMPOTENCY_KEY_HOURS.
+"""
+import threading
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, insert, select, union_all
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .idempotency import DEFAULT_KEY_HOURS, purge_keys
+from .models import SESSION_COLUMNS, ArchivedGameSession, GameSession
+
+ARCHIVE_BATCH_SIZE = 1000
+
+
+def archive_sessions(older_than, batch_size=ARCHIVE_BATCH_SIZE, max_batches=None):
+    """Move sessions played before older_than (a datetime) to the archive; returns how many moved.
+
+    Stops after max_batches batches if given. If another process archives
+    the same rows first, the clashing batch is rolled back and this run ends.
+    """
+    moved = 0
+    batches = 0
+    # The newest session always stays hot: SQLite would otherwise reuse ids of an emptied table
+    newest = select(func.max(GameSession.id)).scalar_subquery()
+    while max_batches is None or batches < max_batches:
+        ids = db.session.execute(
+            select(GameSession.id).where(GameSession.timestamp < older_than, GameSession.id < newest)
+            .order_by(GameSession.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        columns = [getattr(GameSession, name) for name in SESSION_COLUMNS]
+        try:
+            db.session.execute(insert(ArchivedGameSession).from_select(
+                SESSION_COLUMNS, select(*columns).where(GameSession.id.in_(ids)),
+            ))
+            db.session.execute(delete(GameSession).where(GameSession.id.in_(ids)))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            break
+        moved += len(ids)
+        batches += 1
+    return moved
+
+
+def all_sessions(*names):
+    """Subquery of the named columns over hot and archived sessions together."""
+    return union_all(*(
+        select(*(getattr(model, name) for name in names)) for model in (GameSession, ArchivedGameSession)
+    )).subquery()
+
+
+def find_session(session_id):
+    """The GameSession or ArchivedGameSession with this id, or None."""
+    return db.session.get(GameSession, session_id) or db.session.get(ArchivedGameSession, session_id)
+
+
+class SessionArchiver:
+    """Runs archive_sessions on a daemon thread every interval seconds (0 disables it)."""
+
+    def __init__(self, app, interval, after_days, batch_size=ARCHIVE_BATCH_SIZE, key_hours=DEFAULT_KEY_HOURS):
+        self.app = app
+        self.interval = interval
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.key_hours = key_hours
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def ensure_started(self):
+        if self._thread is not None or not self.interval:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name='session-archiver')
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self):
+        with self.app.app_context():
+            return archive_sessions(datetime.utcnow() - timedelta(days=self.after_days), self.batch_size)
+
+    def purge_once(self):
+        with self.app.app_context():
+            return purge_keys(datetime.utcnow() - timedelta(hours=self.key_hours))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                moved = self.run_once()
+            except Exception:
+                self.app.logger.exception("Archiving game sessions failed")
+            else:
+                if moved:
+                    self.app.logger.info("Archived %d game sessions", moved)
+            try:
+                purged = self.purge_once()
+            except Exception:
+                self.app.logger.exception("Purging idempotency keys failed")
+                continue
+            if purged:
+                self.app.logger.info("Purged %d idempotency keys", purged)
+
+
+def create_archiver(app):
+    archiver = SessionArchiver(app, app.config.get('ARCHIVE_INTERVAL', 0), app.config.get('ARCHIVE_AFTER_DAYS', 30),
+                               key_hours=app.config.get('IDEMPOTENCY_KEY_HOURS', DEFAULT_KEY_HOURS))
+    app.before_request(archiver.ensure_started)
+    return archiver
+
+
+sessions_cli = AppGroup('sessions', help="Maintain the game_sessions tables.")
+
+
+@sessions_cli.command('archive')
+@click.option('--older-than-days', type=float, default=None, help="Defaults to the ARCHIVE_AFTER_DAYS setting.")
+@click.option('--batch-size', default=ARCHIVE_BATCH_SIZE, show_default=True)
+def archive_command(older_than_days, batch_size):
+    """Move finished sessions older than the threshold to the archive table and purge expired idempotency keys."""
+    if older_than_days is None:
+        older_than_days = current_app.config.get('ARCHIVE_AFTER_DAYS', 30)
+    moved = archive_sessions(datetime.utcnow() - timedelta(days=older_than_days), batch_size)
+    click.echo(f"Archived {moved} game sessions.")
+    key_hours = current_app.config.get('IDEMPOTENCY_KEY_HOURS', DEFAULT_KEY_HOURS)
+    purged = purge_keys(datetime.utcnow() - timedelta(hours=key_hours))
+    click.echo(f"Purged {purged} idempotency keys.")
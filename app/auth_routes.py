@@ -1,10 +1,18 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_login import login_user, logout_user, login_required
-from . import db, bcrypt
+from . import db
+from .ledger import open_account
 from .models import User
+from .password_hashing import HashingOverloaded
 
 auth = Blueprint('auth', __name__)
 
+
+def _overloaded():
+    response = jsonify({"error": "Server busy, please retry shortly."})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 # Registration Route
 @auth.route('/register', methods=['POST'])
 def register():
@@ -21,9 +29,14 @@ def register():
         return jsonify({"error": "Username already exists"}), 400
 
     # Hash the password and save the new user
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    try:
+        hashed_password = current_app.extensions['password_hasher'].hash(password)
+    except HashingOverloaded:
+        return _overloaded()
     new_user = User(username=username, password_hash=hashed_password)
     db.session.add(new_user)
+    db.session.flush()
+    open_account(new_user)
     db.session.commit()
 
     return jsonify({"message": "User registered successfully!"}), 201
@@ -41,7 +54,19 @@ def login():
 
     # Retrieve user and check credentials
     user = User.query.filter_by(username=username).first()
-    if user and bcrypt.check_password_hash(user.password_hash, password):
+    hasher = current_app.extensions['password_hasher']
+    try:
+        valid = user is not None and hasher.check(user.password_hash, password)
+    except HashingOverloaded:
+        return _overloaded()
+    if valid:
+        # Upgrade hashes made at an outdated cost while we have the plain password
+        if hasher.needs_rehash(user.password_hash):
+            try:
+                user.password_hash = hasher.hash(password)
+                db.session.commit()
+            except HashingOverloaded:
+                pass  # Try again on a later login
         login_user(user)
         return jsonify({"message": "Logged in successfully!", "user": user.username}), 200
 
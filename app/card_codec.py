@@ -0,0 +1,168 @@
+"""Compact binary encoding for hands, shoes and live games.
+
+A card is one byte holding its rank code (see cards.py), so a hand is as many
+bytes as it has cards and a 6-deck shoe is 312 bytes plus a 14-byte header.
+Unlike pickle, decoding never executes anything from the stored data.
+
+A hand log is the replayable record of one hand: the shoe's decks, shuffle
+seed and position when the hand was dealt, the dealer's soft-17 rule, then one
+byte per player action. A table log records a hand from a shared-table round
+the same way, adding how many seats played, which of them this was and which
+of its hands, and then the actions of every seat in the order they were taken.
+"""
+import struct
+
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+from .cards import RANKS
+from .hand import Hand
+from .shoe import Shoe
+
+FORMAT_VERSION = 2
+HAND_LOG_VERSION = 4
+# The first hand log version whose split action deals both hands their second card
+SPLIT_DEALS_VERSION = 4
+TABLE_LOG_VERSION = 0x81  # The high bit keeps table logs apart from hand logs
+
+_SHOE_HEADER = struct.Struct('<BBHHq')  # version, decks, position, cut card, shuffle seed
+_HAND_LOG_HEADER = struct.Struct('<BBqHB')  # version, decks, shuffle seed, position, dealer hits soft 17 (versions 3-4)
+_HAND_LOG_HEADER_V2 = struct.Struct('<BBqH')  # Logs written before the dealer rule was recorded (S17)
+# version, decks, shuffle seed, position, dealer hits soft 17, seats playing, this seat, this hand
+_TABLE_LOG_HEADER = struct.Struct('<BBqHBBBB')
+_GAME_HEADER = struct.Struct('<BIIB')  # version, user id, bet, doubled-down flag
+_SEGMENT = struct.Struct('<H')
+_MISSING = 0xFFFF
+_VALID_CODES = bytes(range(len(RANKS)))
+
+
+def encode_cards(cards):
+    """Encode a Hand or a list of rank strings as one byte per card."""
+    if isinstance(cards, Hand):
+        return bytes(cards.codes)
+    return bytes(RANKS.index(card) for card in cards)
+
+
+def decode_cards(data):
+    """Decode bytes from encode_cards into a Hand."""
+    if bytes(data).translate(None, _VALID_CODES):
+        raise ValueError("Invalid card code in encoded hand.")
+    return Hand.from_codes(data)
+
+
+def encode_shoe(shoe):
+    return _SHOE_HEADER.pack(FORMAT_VERSION, shoe.decks, shoe.position, shoe.cut_card, shoe.seed) + bytes(shoe.cards)
+
+
+def decode_shoe(data):
+    version, decks, position, cut_card, seed = _SHOE_HEADER.unpack_from(data)
+    cards = data[_SHOE_HEADER.size:]
+    if version != FORMAT_VERSION or len(cards) != 52 * decks or position > len(cards):
+        raise ValueError("Invalid encoded shoe.")
+    if cards.translate(None, _VALID_CODES):
+        raise ValueError("Invalid card code in encoded shoe.")
+    return Shoe.from_state(decks, cut_card, cards, position, seed)
+
+
+def encode_hand_log_header(shoe, dealer_hits_soft_17=False):
+    """Start a hand log at the shoe's current shuffle and position."""
+    return _HAND_LOG_HEADER.pack(HAND_LOG_VERSION, shoe.decks, shoe.seed, shoe.position, dealer_hits_soft_17)
+
+
+def decode_hand_log(data):
+    """Return (decks, seed, position, dealer hits soft 17, action codes) from a hand log."""
+    version = data[0] if data else None
+    if version in (3, HAND_LOG_VERSION):
+        header = _HAND_LOG_HEADER
+        _, decks, seed, position, dealer_hits_soft_17 = header.unpack_from(data)
+    elif version == FORMAT_VERSION:
+        header = _HAND_LOG_HEADER_V2
+        _, decks, seed, position = header.unpack_from(data)
+        dealer_hits_soft_17 = 0
+    else:
+        raise ValueError("Invalid hand log.")
+    if not decks or position > 52 * decks or dealer_hits_soft_17 > 1:
+        raise ValueError("Invalid hand log.")
+    return decks, seed, position, bool(dealer_hits_soft_17), bytes(data[header.size:])
+
+
+def encode_table_log(decks, seed, position, dealer_hits_soft_17, players, seat, hand, actions):
+    """A table log for hand number hand of seat (counted among the players seats dealt in) in a round."""
+    return _TABLE_LOG_HEADER.pack(
+        TABLE_LOG_VERSION, decks, seed, position, dealer_hits_soft_17, players, seat, hand,
+    ) + bytes(actions)
+
+
+def is_table_log(data):
+    return bool(data) and data[0] == TABLE_LOG_VERSION
+
+
+def decode_table_log(data):
+    """Return (decks, seed, position, dealer hits soft 17, players, seat, hand, action codes) from a table log."""
+    if not is_table_log(data) or len(data) < _TABLE_LOG_HEADER.size:
+        raise ValueError("Invalid table log.")
+    _, decks, seed, position, dealer_hits_soft_17, players, seat, hand = _TABLE_LOG_HEADER.unpack_from(data)
+    if not decks or position > 52 * decks or dealer_hits_soft_17 > 1 or seat >= players:
+        raise ValueError("Invalid table log.")
+    return decks, seed, position, bool(dealer_hits_soft_17), players, seat, hand, bytes(data[_TABLE_LOG_HEADER.size:])
+
+
+def _pack_segment(data):
+    if data is None:
+        return _SEGMENT.pack(_MISSING)
+    return _SEGMENT.pack(len(data)) + data
+
+
+def _unpack_segment(data, offset):
+    (length,) = _SEGMENT.unpack_from(data, offset)
+    offset += _SEGMENT.size
+    if length == _MISSING:
+        return None, offset
+    return data[offset:offset + length], offset + length
+
+
+def encode_live_game(game):
+    """Encode a live_state.LiveGame: shoe, hands, hand log, bet and flags."""
+    parts = [_GAME_HEADER.pack(FORMAT_VERSION, game.user_id, game.bet, game.doubled_down)]
+    parts.append(_pack_segment(encode_shoe(game.shoe)))
+    for hand in (game.player_hand, game.dealer_hand, game.split_hand):
+        parts.append(_pack_segment(encode_cards(hand) if hand is not None else None))
+    parts.append(_pack_segment(bytes(game.hand_log) if game.hand_log is not None else None))
+    return b''.join(parts)
+
+
+def decode_live_game(data):
+    from .live_state import LiveGame
+
+    version, user_id, bet, doubled_down = _GAME_HEADER.unpack_from(data)
+    if version != FORMAT_VERSION:
+        raise ValueError("Invalid encoded game.")
+    offset = _GAME_HEADER.size
+    shoe_data, offset = _unpack_segment(data, offset)
+    game = LiveGame(user_id, shoe=decode_shoe(shoe_data))
+    game.bet = bet
+    game.doubled_down = bool(doubled_down)
+    hands = []
+    for _ in range(3):
+        hand_data, offset = _unpack_segment(data, offset)
+        hands.append(decode_cards(hand_data) if hand_data is not None else None)
+    game.player_hand, game.dealer_hand, game.split_hand = hands
+    hand_log, offset = _unpack_segment(data, offset)
+    game.hand_log = bytearray(hand_log) if hand_log is not None else None
+    return game
+
+
+class CardList(TypeDecorator):
+    """Column type storing a Hand (or list of rank strings) as one byte per card."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return encode_cards(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return decode_cards(value)
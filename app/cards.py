@@ -0,0 +1,57 @@
+"""Integer card encodings shared by the simulators and strategy engines."""
+
+# Rank strings in the same order as the card_values dictionaries
+RANKS = ('2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A')
+RANK_CODES = {rank: code for code, rank in enumerate(RANKS)}
+
+# Point value of each rank code, counting aces as one
+POINTS = (2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 1)
+
+# Numeric engines work on point values 1-10 (ace = 1); per-value arrays are
+# indexed by value - 1, so slot 0 is the ace and slot 9 every ten-valued card
+VALUE_LABELS = ('A', '2', '3', '4', '5', '6', '7', '8', '9', '10')
+ONE_DECK_VALUE_COUNTS = (4, 4, 4, 4, 4, 4, 4, 4, 4, 16)
+
+# Player hand classes: hard 4-21, soft 12-21, then pairs of A..10
+HARD_MIN, HARD_MAX = 4, 21
+SOFT_MIN, SOFT_MAX = 12, 21
+HARD_BASE = 0
+SOFT_BASE = HARD_BASE + HARD_MAX - HARD_MIN + 1
+PAIR_BASE = SOFT_BASE + SOFT_MAX - SOFT_MIN + 1
+NUM_CLASSES = PAIR_BASE + 10
+
+HAND_CLASS_LABELS = (
+    [f"hard {total}" for total in range(HARD_MIN, HARD_MAX + 1)]
+    + [f"soft {total}" for total in range(SOFT_MIN, SOFT_MAX + 1)]
+    + [f"pair {label}" for label in VALUE_LABELS]
+)
+
+
+def point_value(rank):
+    """Return the point value (ace = 1) of a rank string."""
+    return POINTS[RANK_CODES[rank]]
+
+
+def hand_total(hard_total, has_ace):
+    """Return (best total, soft flag) for a hard total with or without an ace."""
+    if has_ace and hard_total <= 11:
+        return hard_total + 10, True
+    return hard_total, False
+
+
+def hand_class(total, soft, pair_value=None):
+    """Return the hand class index for a total, or for a pair of pair_value.
+
+    Raises ValueError for a total or pair the strategy tables have no row for.
+    """
+    if pair_value is not None:
+        if not 1 <= pair_value <= 10:
+            raise ValueError(f"No hand class for a pair of {pair_value}.")
+        return PAIR_BASE + pair_value - 1
+    if soft:
+        if not SOFT_MIN <= total <= SOFT_MAX:
+            raise ValueError(f"No hand class for soft {total}.")
+        return SOFT_BASE + total - SOFT_MIN
+    if not HARD_MIN <= total <= HARD_MAX:
+        raise ValueError(f"No hand class for hard {total}.")
+    return HARD_BASE + total - HARD_MIN
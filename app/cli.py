@@ -0,0 +1,153 @@
+"""flask commands for the hand-record store: flask hands export/simulate/query."""
+import json
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import select
+
+from . import db
+from .archive import all_sessions
+from .card_codec import decode_hand_log, is_table_log
+from .cards import POINTS
+from .counting import SYSTEMS, simulate_counting
+from .game_logic import (
+    LOG_DOUBLE, LOG_DOUBLE_FIRST, LOG_DOUBLE_SPLIT, LOG_HIT, LOG_SPLIT, LOG_STAND, LOG_SURRENDER, _deal_opening,
+)
+from .hand_store import ACTION_CODES, KEY_RANGES, HandBuffer, HandStore
+from .models import SESSION_COLUMNS, LedgerEntry
+from .rules import RuleSet, get_rules
+from .shoe import Shoe
+from .simulation import simulate
+from .tables import table_opening
+
+# Played hands are read from the database this many sessions at a time
+EXPORT_BATCH = 10_000
+# Simulated hands are recorded this many at a time
+SIMULATE_BATCH = 1_000_000
+
+# First logged action of a played hand, as a hand-record action
+_LOGGED_ACTIONS = {
+    LOG_HIT: 'hit',
+    LOG_STAND: 'stand',
+    LOG_DOUBLE: 'double',
+    LOG_SPLIT: 'split',
+    LOG_SURRENDER: 'surrender',
+}
+# Logged actions that each add one initial bet to the round's stake
+_STAKE_ACTIONS = (LOG_SPLIT, LOG_DOUBLE, LOG_DOUBLE_FIRST, LOG_DOUBLE_SPLIT)
+
+hands_cli = AppGroup('hands', help="Record hands into a columnar hand store and query it.")
+
+
+def export_sessions(store, rules, batch_size=EXPORT_BATCH):
+    """Append every finished game session not yet in store, oldest first; returns how many were added.
+
+    Archived sessions are included. The opening cards come from replaying the
+    session's hand log, the result from its payout in the ledger. A table
+    round is one row per hand, each with its seat's opening cards. Sessions
+    without a hand log (autoplay and older rows) have no cards to record and
+    are skipped. The last exported session id is kept in the store's meta, so
+    runs pick up where they stopped.
+    """
+    buffer = HandBuffer(store, block_rows=batch_size)
+    last_id = store.meta.get('last_session_id', 0)
+    added = 0
+    while True:
+        sessions = all_sessions(*SESSION_COLUMNS)
+        rows = db.session.execute(select(sessions, LedgerEntry.amount).outerjoin(
+            LedgerEntry, (LedgerEntry.game_session_id == sessions.c.id) & (LedgerEntry.kind == 'payout'),
+        ).where(
+            sessions.c.id > last_id, sessions.c.outcome.isnot(None),
+        ).order_by(sessions.c.id).limit(batch_size)).all()
+        if not rows:
+            break
+        for session in rows:
+            last_id = session.id
+            payout = session.amount
+            if session.hand_log is None:
+                continue
+            if is_table_log(session.hand_log):
+                # One row per table hand: its seat's opening and first action, and the hand's own stake
+                player, dealer, action = table_opening(session.hand_log)
+                initial_bet = session.bet // 2 if session.doubled_down else session.bet
+            else:
+                decks, seed, position, _, actions = decode_hand_log(session.hand_log)
+                player, dealer = _deal_opening(Shoe.from_seed(decks, seed, position))
+                # bet is the total staked over the round's hands: one initial bet per hand plus one per double
+                initial_bet = session.bet // (1 + sum(action in _STAKE_ACTIONS for action in actions))
+                action = _LOGGED_ACTIONS.get(actions[0], 'none') if actions else 'none'
+            if payout is None:
+                payout = session.bet + rules.settle(session.outcome, session.bet)
+            buffer.add(
+                player.value, player.soft, POINTS[player.codes[0]] if player.is_pair else 0,
+                POINTS[dealer.codes[0]], ACTION_CODES[action], float('nan'),
+                (payout - session.bet) / initial_bet if initial_bet else 0.0,
+            )
+            added += 1
+        buffer.flush(meta={'last_session_id': last_id})
+    return added
+
+
+@hands_cli.command('export')
+@click.argument('directory')
+@click.option('--batch-size', default=EXPORT_BATCH, show_default=True, help="Sessions read per query.")
+def export_command(directory, batch_size):
+    """Append played hands from game sessions to the store in DIRECTORY."""
+    store = HandStore(directory)
+    added = export_sessions(store, get_rules(), batch_size)
+    click.echo(f"Exported {added} hands; the store holds {len(store)}.")
+
+
+@hands_cli.command('simulate')
+@click.argument('directory')
+@click.option('--hands', 'n_hands', default=1_000_000, show_default=True, help="Hands to simulate.")
+@click.option('--rules', 'rules_text', default=None, help='Table rules, e.g. "6D H17 3:2 LS" (table rules if omitted).')
+@click.option('--counting', 'system', type=click.Choice(sorted(SYSTEMS)), default=None,
+              help="Play whole shoes with this counting system instead of one fresh shoe per hand.")
+@click.option('--seed', type=int, default=None, help="Seed for a reproducible run.")
+def simulate_command(directory, n_hands, rules_text, system, seed):
+    """Append simulated hands to the store in DIRECTORY."""
+    rules = RuleSet.parse(rules_text, base=get_rules()) if rules_text else get_rules()
+    store = HandStore(directory)
+    if system:
+        result = simulate_counting(n_hands, system=system, rules=rules, seed=seed, store=store)
+    else:
+        result = simulate(n_hands, rules=rules, rng=seed, batch_size=min(SIMULATE_BATCH, max(n_hands, 1)),
+                          store=store)
+    click.echo(f"Recorded {result.hands} hands under {rules.label} (EV {result.ev:+.4f}); "
+               f"the store holds {len(store)}.")
+
+
+def _parse_where(text):
+    """field=value, field=low..high or field=a,b,c, with actions by name."""
+    field, _, value = text.partition('=')
+    if not value:
+        raise click.BadParameter(f"{text!r} is not field=value.")
+    convert = str if field == 'action' else float if field in ('count', 'result') else int
+    try:
+        if '..' in value:
+            low, high = value.split('..')
+            return field, (convert(low), convert(high))
+        if ',' in value:
+            return field, [convert(item) for item in value.split(',')]
+        return field, convert(value)
+    except ValueError:
+        raise click.BadParameter(f"Bad value in {text!r}.") from None
+
+
+@hands_cli.command('query')
+@click.argument('directory')
+@click.option('--by', default='', help=f"Comma-separated fields to group by: {', '.join(KEY_RANGES)}.")
+@click.option('--where', 'conditions', multiple=True,
+              help="Filter such as total=16, upcard=10, count=1..3 or action=hit,stand (repeatable).")
+def query_command(directory, by, conditions):
+    """Print hands, EV and standard deviation per group as JSON lines."""
+    store = HandStore(directory)
+    where = dict(_parse_where(condition) for condition in conditions)
+    try:
+        groups = store.group_by([field for field in by.split(',') if field], where)
+    except ValueError as e:
+        raise click.UsageError(str(e)) from None
+    for group in groups:
+        click.echo(json.dumps(group))
+
@@ -7,6 +7,33 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY')  # Load from .env for security
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URI')  # Database connection
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Live table state: in-process by default, or a redis:// URL shared by all workers
+    LIVE_STATE_URL = os.getenv('LIVE_STATE_URL')
+    LIVE_STATE_TTL = int(os.getenv('LIVE_STATE_TTL', 1800))  # Seconds before an idle hand is dropped
+    # Password hashing: bcrypt cost, worker processes (0 hashes inline) and queue limit before 503s
+    BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 16))
+    # Table rules in RuleSet label form, e.g. "6D H17 3:2 DAS LS SP3" (see rules.py); unset keeps the defaults
+    TABLE_RULES = os.getenv('TABLE_RULES')
+    # Worker processes for background simulation jobs (defaults to the CPU count)
+    SIMULATION_WORKERS = int(os.getenv('SIMULATION_WORKERS', 0)) or None
+    # Simulation jobs running at once, unfinished jobs in all and per user before 503s/429s
+    SIMULATION_MAX_RUNNING = int(os.getenv('SIMULATION_MAX_RUNNING', 2))
+    SIMULATION_MAX_PENDING = int(os.getenv('SIMULATION_MAX_PENDING', 16))
+    SIMULATION_MAX_PER_USER = int(os.getenv('SIMULATION_MAX_PER_USER', 2))
+    # Finished sessions older than ARCHIVE_AFTER_DAYS move to the archive table every ARCHIVE_INTERVAL seconds (0 = never)
+    ARCHIVE_AFTER_DAYS = float(os.getenv('ARCHIVE_AFTER_DAYS', 30))
+    ARCHIVE_INTERVAL = int(os.getenv('ARCHIVE_INTERVAL', 3600))
+    # Hours an Idempotency-Key is kept, i.e. the window in which a retry replays; purged by the same loop
+    IDEMPOTENCY_KEY_HOURS = float(os.getenv('IDEMPOTENCY_KEY_HOURS', 24))
+    # Shared tables: seconds to act before standing, seconds to bet after the first bet, seconds an
+    # empty table stays open, tables per process and open tables one user may create
+    TABLE_TURN_TIMEOUT = float(os.getenv('TABLE_TURN_TIMEOUT', 30))
+    TABLE_BET_WINDOW = float(os.getenv('TABLE_BET_WINDOW', 10))
+    TABLE_IDLE_TIMEOUT = float(os.getenv('TABLE_IDLE_TIMEOUT', 120))
+    MAX_TABLES = int(os.getenv('MAX_TABLES', 5000))
+    MAX_TABLES_PER_USER = int(os.getenv('MAX_TABLES_PER_USER', 2))
     # Allow cookies to be sent in cross-origin requests
     SESSION_COOKIE_SAMESITE = "None"
     SESSION_COOKIE_SECURE = True
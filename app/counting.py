@@ -0,0 +1,443 @@
+"""Card-counting simulator: tag tables, incremental counts, bet ramps and index plays.
+
+Hands are dealt from real shoes to the cut card. A CountingShoe adds each
+card's tag to the running count the moment it is dealt, so the true count is
+available in O(1) for every bet and every decision. The dealer's hole card is
+left out of the count until the round ends, as it would be at the table.
+Results are in betting units and include win rate per 100 hands, standard
+deviation and N0 (hands needed for the expected win to equal one standard
+deviation).
+"""
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .cards import HAND_CLASS_LABELS, POINTS, RANKS, hand_class
+from .hand import ACE, Hand
+from .hand_store import ACTION_CODES, HandBuffer
+from .metrics import record_simulation
+from .rules import RuleSet, strategy_table
+from .shoe import DEFAULT_DECKS, DEFAULT_PENETRATION, Shoe
+from .sim_runner import CHUNK_HANDS, iter_chunk_results
+from .strategy import (
+    DOUBLE_HIT, DOUBLE_STAND, HIT, SPLIT, STAND, SURRENDER_HIT, SURRENDER_STAND,
+)
+
+# Counts are floored before use; results by count are kept for -10..+10
+COUNT_RANGE = 10
+
+
+class CountingSystem:
+    """Tags per point value (ace first). Unbalanced systems bet on the running count."""
+
+    def __init__(self, name, value_tags, balanced=True, pivot=0):
+        self.name = name
+        self.value_tags = tuple(value_tags)
+        self.balanced = balanced
+        self.pivot = pivot
+        # Tags by rank code, so dealing needs one tuple index
+        self.tags = tuple(self.value_tags[POINTS[code] - 1] for code in range(len(RANKS)))
+
+    def initial_count(self, decks):
+        """Running count off the top of a fresh shoe: 0, or pivot - imbalance for unbalanced systems."""
+        if self.balanced:
+            return 0
+        return self.pivot - 4 * sum(self.tags) * decks
+
+
+SYSTEMS = {
+    'hi-lo': CountingSystem('Hi-Lo', (-1, 1, 1, 1, 1, 1, 0, 0, 0, -1)),
+    # Knock-Out: unbalanced by +4 a deck, started at 4 - 4 * decks so the key count is +4
+    'ko': CountingSystem('KO', (-1, 1, 1, 1, 1, 1, 1, 0, 0, -1), balanced=False, pivot=4),
+    'omega-ii': CountingSystem('Omega II', (0, 1, 1, 2, 2, 2, 1, 0, -1, -2)),
+}
+
+
+class CountingShoe(Shoe):
+    """A Shoe that keeps a counting system's running count as cards leave it."""
+
+    def __init__(self, system, decks=DEFAULT_DECKS, penetration=DEFAULT_PENETRATION, seed=None):
+        self.system = system
+        super().__init__(decks, penetration, seed)
+
+    def shuffle(self, seed=None):
+        super().shuffle(seed)
+        self.running_count = self.system.initial_count(self.decks)
+
+    def deal_code(self):
+        code = super().deal_code()
+        self.running_count += self.system.tags[code]
+        return code
+
+    def count(self, hidden=None):
+        """True count (running count for unbalanced systems), ignoring a card not yet seen."""
+        running = self.running_count
+        remaining = len(self.cards) - self.position
+        if hidden is not None:
+            running -= self.system.tags[hidden]
+            remaining += 1
+        if not self.system.balanced:
+            return running
+        # Never divide by less than half a deck
+        return running * 52 / max(remaining, 26)
+
+
+class BetRamp:
+    """Bet units from the floored count: the step for the highest threshold reached."""
+
+    def __init__(self, steps, min_units=1):
+        self.steps = sorted((int(count), units) for count, units in dict(steps).items())
+        self.min_units = min_units
+        if any(units <= 0 for _, units in self.steps) or min_units <= 0:
+            raise ValueError("Bet ramp units must be positive.")
+
+    def units(self, count):
+        units = self.min_units
+        for threshold, step_units in self.steps:
+            if count < threshold:
+                break
+            units = step_units
+        return units
+
+
+# A 1-8 spread on the true count
+DEFAULT_RAMP = {1: 1, 2: 2, 3: 4, 4: 6, 5: 8}
+
+# Illustrious 18 Hi-Lo indices: (hand class, upcard value, index, play at or above, play below);
+# None means the basic strategy play. Insurance is taken at or above INSURANCE_INDEX.
+INSURANCE_INDEX = 3
+ILLUSTRIOUS_18 = (
+    ('hard 16', 10, 0, STAND, HIT),
+    ('hard 15', 10, 4, STAND, None),
+    ('pair 10', 5, 5, SPLIT, None),
+    ('pair 10', 6, 4, SPLIT, None),
+    ('hard 10', 10, 4, DOUBLE_HIT, None),
+    ('hard 12', 3, 2, STAND, HIT),
+    ('hard 12', 2, 3, STAND, HIT),
+    ('hard 11', 1, 1, DOUBLE_HIT, HIT),
+    ('hard 9', 2, 1, DOUBLE_HIT, HIT),
+    ('hard 10', 1, 4, DOUBLE_HIT, HIT),
+    ('hard 9', 7, 3, DOUBLE_HIT, HIT),
+    ('hard 16', 9, 5, STAND, HIT),
+    ('hard 13', 2, -1, STAND, HIT),
+    ('hard 12', 4, 0, STAND, HIT),
+    ('hard 12', 5, -2, STAND, HIT),
+    ('hard 12', 6, -1, STAND, HIT),
+    ('hard 13', 3, -2, STAND, HIT),
+)
+# Fab 4 Hi-Lo late-surrender indices: (hand class, upcard value, surrender at or above). Other
+# hands surrender as basic strategy says, whatever the play indices above would do instead.
+FAB_4 = (
+    ('hard 14', 10, 3),
+    ('hard 15', 10, 0),
+    ('hard 15', 9, 2),
+    ('hard 15', 1, 1),
+)
+# Built-in (play, surrender) indices by system name; each is in that system's own true counts
+INDEX_PLAYS = {'Hi-Lo': (ILLUSTRIOUS_18, FAB_4)}
+
+
+def deviation_table(deviations):
+    """Index deviations by (hand class, upcard value) for one lookup per decision."""
+    classes = {label: cls for cls, label in enumerate(HAND_CLASS_LABELS)}
+    return {(classes[label], upcard): (index, above, below) for label, upcard, index, above, below in deviations}
+
+
+def surrender_table(indices):
+    """Index surrender indices in FAB_4 form by (hand class, upcard value)."""
+    classes = {label: cls for cls, label in enumerate(HAND_CLASS_LABELS)}
+    return {(classes[label], upcard): index for label, upcard, index in indices}
+
+
+class CountingResult:
+    """Net results in betting units, overall and by floored count at the bet."""
+
+    def __init__(self):
+        self.hands = 0
+        self.net = 0.0
+        self.net_squares = 0.0
+        self.initial_bets = 0  # Units bet before doubles and splits
+        self.wagered = 0  # Units bet including doubles, splits and insurance
+        self.count_hands = [0] * (2 * COUNT_RANGE + 1)
+        self.count_net = [0.0] * (2 * COUNT_RANGE + 1)
+        self.outcome_counts = {}  # Hands seen per distinct net result in units
+
+    def add(self, count, units, wagered, net):
+        self.hands += 1
+        self.net += net
+        self.net_squares += net * net
+        self.initial_bets += units
+        self.wagered += wagered
+        slot = min(max(count, -COUNT_RANGE), COUNT_RANGE) + COUNT_RANGE
+        self.count_hands[slot] += 1
+        self.count_net[slot] += net
+        self.outcome_counts[net] = self.outcome_counts.get(net, 0) + 1
+
+    def merge(self, other):
+        self.hands += other.hands
+        self.net += other.net
+        self.net_squares += other.net_squares
+        self.initial_bets += other.initial_bets
+        self.wagered += other.wagered
+        self.count_hands = [a + b for a, b in zip(self.count_hands, other.count_hands)]
+        self.count_net = [a + b for a, b in zip(self.count_net, other.count_net)]
+        for outcome, count in other.outcome_counts.items():
+            self.outcome_counts[outcome] = self.outcome_counts.get(outcome, 0) + count
+        return self
+
+    @property
+    def ev(self):
+        """Expected win per hand, in units."""
+        return self.net / self.hands if self.hands else 0.0
+
+    @property
+    def std_dev(self):
+        """Standard deviation of the per-hand result, in units."""
+        if self.hands < 2:
+            return 0.0
+        variance = (self.net_squares - self.net * self.net / self.hands) / (self.hands - 1)
+        return max(variance, 0.0) ** 0.5
+
+    @property
+    def win_rate_per_100(self):
+        return 100 * self.ev
+
+    @property
+    def std_dev_per_100(self):
+        return 10 * self.std_dev
+
+    @property
+    def n0(self):
+        """Hands for the expected win to equal one standard deviation: (sd / ev)^2."""
+        return (self.std_dev / self.ev) ** 2 if self.ev > 0 else math.inf
+
+    @property
+    def advantage(self):
+        """Net result as a fraction of the initial bets."""
+        return self.net / self.initial_bets if self.initial_bets else 0.0
+
+    def to_dict(self):
+        by_count = {}
+        for slot, hands in enumerate(self.count_hands):
+            if hands:
+                by_count[slot - COUNT_RANGE] = {'hands': hands, 'ev': self.count_net[slot] / hands}
+        return {
+            'hands': self.hands,
+            'ev': self.ev,
+            'std_dev': self.std_dev,
+            'win_rate_per_100': self.win_rate_per_100,
+            'std_dev_per_100': self.std_dev_per_100,
+            'n0': self.n0 if math.isfinite(self.n0) else None,
+            'advantage': self.advantage,
+            'average_bet': self.initial_bets / self.hands if self.hands else 0.0,
+            'wagered': self.wagered,
+            'by_count': by_count,
+        }
+
+
+def _decide(table, deviations, cls, upcard_value, count):
+    deviation = deviations.get((cls, upcard_value))
+    if deviation is not None:
+        index, above, below = deviation
+        action = above if count >= index else below
+        if action is not None:
+            return action
+    return table.lookup(cls, upcard_value)
+
+
+def _play_hand(hand, shoe, table, deviations, upcard_value, hole, rules, split):
+    """Play one player hand with index plays; returns the bet multiplier (1 or 2)."""
+    first_decision = True
+    while hand.hard_total < 21:
+        total, soft = hand.value, hand.soft
+        if total >= 21:
+            break
+        count = math.floor(shoe.count(hole))
+        action = _decide(table, deviations, hand_class(total, soft), upcard_value, count)
+        if action in (DOUBLE_HIT, DOUBLE_STAND):
+            if first_decision and rules.can_double(hand, split):
+                hand.add(shoe.deal_code())
+                return 2
+            action = HIT if action == DOUBLE_HIT else STAND
+        elif action in (SURRENDER_HIT, SURRENDER_STAND):
+            action = HIT if action == SURRENDER_HIT else STAND
+        if action != HIT:
+            break
+        hand.add(shoe.deal_code())
+        first_decision = False
+    return 1
+
+
+def _surrenders(table, surrenders, cls, upcard_value, count):
+    index = surrenders.get((cls, upcard_value))
+    if index is not None:
+        return count >= index
+    return table.lookup(cls, upcard_value) in (SURRENDER_HIT, SURRENDER_STAND)
+
+
+def _play_round(shoe, table, deviations, surrenders, units, rules, insurance, record=None):
+    """Play one round with a peeking dealer; returns (units wagered, net units).
+
+    A hand_store.HandBuffer in record gets the round's opening hand, first
+    decision, true count before the deal and main-bet result (insurance aside).
+    """
+    true_count = shoe.count() if record is not None else None
+    deal = shoe.deal_code
+    player = Hand.from_codes((deal(), deal()))
+    dealer = Hand.from_codes((deal(), deal()))
+    hole = dealer.codes[1]
+    upcard_value = POINTS[dealer.codes[0]]
+    opening = (player.value, player.soft, POINTS[player.codes[0]] if player.is_pair else 0)
+    wagered = units
+    side = 0.0
+
+    if insurance and upcard_value == 1 and math.floor(shoe.count(hole)) >= INSURANCE_INDEX:
+        wagered += units / 2
+        side = units if dealer.is_blackjack else -units / 2
+
+    if dealer.is_blackjack:
+        net, action = (0.0 if player.is_blackjack else -units), 'none'
+    elif player.is_blackjack:
+        net, action = units * rules.blackjack_payout, 'none'
+    elif rules.surrender and _surrenders(table, surrenders, player.hand_class(), upcard_value,
+                                         math.floor(shoe.count(hole))):
+        net, action = -units / 2, 'surrender'
+    else:
+        split_wagered, net, action = _play_out(player, dealer, shoe, table, deviations, units, upcard_value, hole,
+                                               rules)
+        wagered += split_wagered
+    if record is not None:
+        record.add(*opening, upcard_value, ACTION_CODES[action], true_count, net / units)
+    return wagered, side + net
+
+
+def _play_out(player, dealer, shoe, table, deviations, units, upcard_value, hole, rules):
+    """Split, play and settle a round the deal did not end.
+
+    Returns (units wagered beyond the initial bet, net units, first decision).
+    """
+    deal = shoe.deal_code
+    wagered = 0
+    net = 0.0
+
+    # Split as advised, resplitting new pairs up to the rules' limit; split aces are never resplit
+    hands = [player]
+    split_aces = player.codes[0] == ACE
+    splits = 0
+    index = 0
+    while index < len(hands):
+        hand = hands[index]
+        if rules.can_split(hand, splits) and not (splits and split_aces) and _decide(
+                table, deviations, hand.hand_class(), upcard_value, math.floor(shoe.count(hole))) == SPLIT:
+            second = Hand.from_codes((hand.codes[-1],))
+            hand.pop()
+            hand.add(deal())
+            second.add(deal())
+            hands.insert(index + 1, second)
+            splits += 1
+            wagered += units
+            continue
+        index += 1
+
+    multipliers = []
+    split = splits > 0
+    for hand in hands:
+        if split and split_aces:
+            # Split aces get one card each
+            multipliers.append(1)
+            continue
+        multipliers.append(_play_hand(hand, shoe, table, deviations, upcard_value, hole, rules, split))
+    wagered += units * (sum(multipliers) - len(multipliers))
+
+    if not all(hand.is_bust for hand in hands):
+        while rules.dealer_hits(dealer):
+            dealer.add(deal())
+    dealer_value = dealer.value if not dealer.is_bust else 0
+    for hand, multiplier in zip(hands, multipliers):
+        if hand.is_bust or hand.value < dealer_value:
+            net -= units * multiplier
+        elif hand.value > dealer_value:
+            net += units * multiplier
+
+    if split:
+        action = 'split'
+    elif multipliers[0] == 2:
+        action = 'double'
+    else:
+        action = 'hit' if len(player) > 2 else 'stand'
+    return wagered, net, action
+
+
+def simulate_counting(n_hands, system='hi-lo', ramp=None, deviations=True, decks=DEFAULT_DECKS,
+                      penetration=DEFAULT_PENETRATION, dealer_hits_soft_17=False, blackjack_payout=1.5,
+                      double_after_split=True, seed=None, rules=None, store=None):
+    """Play n_hands rounds through whole shoes, betting and deviating by the count.
+
+    system is a SYSTEMS key or a CountingSystem; ramp maps count thresholds to
+    bet units (DEFAULT_RAMP, true-count steps, if None). deviations=True uses the
+    system's own indices from INDEX_PLAYS (for Hi-Lo the Illustrious 18, the
+    insurance index and, with surrender, the Fab 4) and basic strategy for a
+    system without any; pass a list in ILLUSTRIOUS_18 form to use other play
+    indices, or False for basic strategy only. A RuleSet in rules takes
+    the place of decks, dealer_hits_soft_17, blackjack_payout and double_after_split.
+    Every round is also appended to store (a hand_store.HandStore) if given.
+    """
+    if isinstance(system, str):
+        system = SYSTEMS[system]
+    if ramp is None and not system.balanced:
+        raise ValueError(f"{system.name} bets on the running count; give a ramp in running-count steps.")
+    ramp = BetRamp(DEFAULT_RAMP if ramp is None else ramp)
+    if rules is None:
+        rules = RuleSet(decks, dealer_hits_soft_17, blackjack_payout, double_after_split)
+    table = strategy_table(rules)
+    surrenders = ()
+    insurance = False
+    if deviations is True:
+        deviations, surrenders = INDEX_PLAYS.get(system.name, ((), ()))
+        insurance = system.name in INDEX_PLAYS
+    index_plays = deviation_table(deviations or ())
+    surrender_plays = surrender_table(surrenders if rules.surrender else ())
+
+    shoe = CountingShoe(system, rules.decks, penetration, seed)
+    result = CountingResult()
+    record = HandBuffer(store) if store is not None else None
+    for _ in range(n_hands):
+        shoe.reshuffle_if_needed()
+        count = math.floor(shoe.count())
+        units = ramp.units(count)
+        wagered, net = _play_round(shoe, table, index_plays, surrender_plays, units, rules, insurance, record)
+        result.add(count, units, wagered, net)
+    if record is not None:
+        record.flush()
+    return result
+
+
+def _run_counting_chunk(size, seed_sequence, options, first_hand):
+    seed = int(seed_sequence.generate_state(1, np.uint64)[0])
+    return simulate_counting(size, seed=seed, **options)
+
+
+def run_counting(n_hands, seed, workers=None, chunk_hands=CHUNK_HANDS, **options):
+    """Run simulate_counting across worker processes; reproducible for a given seed and chunk size.
+
+    Each chunk starts on a fresh shoe. options are passed to simulate_counting
+    and must be picklable (use a SYSTEMS key rather than a custom system).
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    total = CountingResult()
+    start = time.perf_counter()
+    if workers == 1 or n_hands <= chunk_hands:
+        chunks = iter_chunk_results(None, n_hands, seed, chunk_hands, options, runner=_run_counting_chunk)
+        for result in chunks:
+            total.merge(result)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = iter_chunk_results(pool, n_hands, seed, chunk_hands, options, runner=_run_counting_chunk)
+            for result in chunks:
+                total.merge(result)
+    record_simulation('counting', total.hands, time.perf_counter() - start)
+    return total
@@ -1,5 +1,21 @@
 import random
 from .models import GameSession
+from .cards import POINTS, hand_class
+from .card_codec import SPLIT_DEALS_VERSION, decode_hand_log, encode_hand_log_header
+from .hand import ACE, Hand
+from .ledger import debit
+from .live_state import LiveGame
+from .rules import DEFAULT_RULES
+from .shoe import Shoe
+from .strategy import DOUBLE_HIT, DOUBLE_STAND, HIT, SPLIT, SURRENDER_HIT, SURRENDER_STAND
+
+# Player actions recorded in a hand log, one byte each. LOG_SPLIT deals each
+# of the two hands its second card, the first hand then the split hand, and the
+# first hand plays out before the split hand: LOG_STAND_FIRST and
+# LOG_DOUBLE_FIRST finish the first hand, LOG_STAND and LOG_DOUBLE_SPLIT the
+# split hand and the round.
+(LOG_HIT, LOG_HIT_SPLIT, LOG_STAND, LOG_DOUBLE, LOG_SPLIT, LOG_SURRENDER,
+ LOG_STAND_FIRST, LOG_DOUBLE_FIRST, LOG_DOUBLE_SPLIT) = range(9)
 
 # Card values dictionary
 card_values = {
@@ -14,9 +30,13 @@ def create_deck():
     return deck
 
 def deal_card(deck):
+    if isinstance(deck, Shoe):
+        return deck.deal()
     return deck.pop()
 
 def calculate_hand_value(hand):
+    if isinstance(hand, Hand):
+        return hand.value  # Kept up to date as cards are added
     value = sum(card_values[card] for card in hand)
     # Adjust for aces (count them as 1 instead of 11 if needed)
     aces = hand.count('A')
@@ -26,48 +46,280 @@ def calculate_hand_value(hand):
     return value
 
 def is_bust(hand):
+    if isinstance(hand, Hand):
+        return hand.is_bust
     return calculate_hand_value(hand) > 21
 
 def is_blackjack(hand):
     """Return True if hand is a blackjack (an ace and a 10-value card)."""
+    if isinstance(hand, Hand):
+        return hand.is_blackjack
     return calculate_hand_value(hand) == 21 and len(hand) == 2
 
-def start_game(user, bet_amount):
-    # Check if user has enough bankroll
-    if user.bankroll < bet_amount:
-        raise ValueError("Insufficient bankroll for this bet.")
+def _deal_opening(shoe):
+    player_hand = Hand([shoe.deal_code(), shoe.deal_code()])
+    dealer_hand = Hand([shoe.deal_code(), shoe.deal_code()])
+    return player_hand, dealer_hand
+
+def deal_hands(shoe):
+    """Deal the opening player and dealer hands, reshuffling first if the cut card is out."""
+    shoe.reshuffle_if_needed()
+    return _deal_opening(shoe)
 
-    # Deduct bet from user’s bankroll and create a new game session
-    user.bankroll -= bet_amount
-    game_session = GameSession(user_id=user.id, bet=bet_amount, final_bankroll=user.bankroll)
+def start_game(user, bet_amount, shoe=None, rules=DEFAULT_RULES):
+    # Deduct bet from user’s bankroll (raises InsufficientFunds) and create a new game session
+    balance = debit(user.id, bet_amount, 'bet')
+    game_session = GameSession(user_id=user.id, bet=bet_amount, final_bankroll=balance)
 
-    # Initialize deck and hands
-    deck = create_deck()
-    player_hand = [deal_card(deck), deal_card(deck)]
-    dealer_hand = [deal_card(deck), deal_card(deck)]
+    # Keep dealing from the table's shoe until the cut card comes out
+    if shoe is None:
+        shoe = Shoe(rules.decks)
+    player_hand, dealer_hand = deal_hands(shoe)
 
-    return deck, player_hand, dealer_hand, game_session
+    return shoe, player_hand, dealer_hand, game_session
+
+def play_dealer(dealer_hand, shoe, rules=DEFAULT_RULES):
+    """Dealer draws to 17, hitting soft 17 if the rules say so."""
+    while rules.dealer_hits(dealer_hand):
+        dealer_hand.add(shoe.deal_code())
+    return dealer_hand
 
 def play_turn(player_hand, deck):
     player_hand.append(deal_card(deck))
     return player_hand
 
-def determine_outcome(player_hand, dealer_hand, user, game_session):
-    """Determine the outcome of the game and update bankroll accordingly."""
+def hand_outcome(player_hand, dealer_hand, split=False):
+    """Return "blackjack", "win", "lose" or "tie" for a finished player hand against the dealer.
+
+    A two-card 21 on a split hand is not a blackjack, and a dealer blackjack
+    beats every hand but a player blackjack.
+    """
     player_value = calculate_hand_value(player_hand)
     dealer_value = calculate_hand_value(dealer_hand)
-    
+    player_blackjack = not split and is_blackjack(player_hand)
+
     if player_value > 21:
-        outcome = "lose"
+        return "lose"
+    elif is_blackjack(dealer_hand):
+        return "tie" if player_blackjack else "lose"
+    elif player_blackjack:
+        return "blackjack"
     elif dealer_value > 21 or player_value > dealer_value:
-        outcome = "win"
-        user.bankroll += game_session.bet * 2
+        return "win"
     elif player_value < dealer_value:
-        outcome = "lose"
-    else:
-        outcome = "tie"
-        user.bankroll += game_session.bet
+        return "lose"
+    return "tie"
 
-    # Record outcome in game session and save final bankroll
-    game_session.record_outcome(outcome, user)
+def determine_outcome(player_hand, dealer_hand, user, game_session, rules=DEFAULT_RULES, surrendered=False,
+                      split=False):
+    """Determine the outcome of the game; record_outcome pays it out under the table rules."""
+    outcome = "surrender" if surrendered else hand_outcome(player_hand, dealer_hand, split)
+    game_session.record_outcome(outcome, user, rules)
     return outcome
+
+def settle_game(game, user, game_session, rules=DEFAULT_RULES):
+    """Score every hand of a finished live game, each at its own stake, and pay the round out in one payout.
+
+    Returns the outcome of each hand; game_session.outcome is the round's.
+    """
+    if surrendered(game):
+        outcomes = ["surrender"]
+    else:
+        split = game.split_hand is not None
+        hands = [game.player_hand, game.split_hand] if split else [game.player_hand]
+        outcomes = [hand_outcome(hand, game.dealer_hand, split) for hand in hands]
+    game_session.record_outcomes(outcomes, hand_stakes(game), user, rules)
+    return outcomes
+
+def has_natural(game):
+    """True if the opening deal ends the hand: the dealer peeks, and a blackjack on either side settles it."""
+    return game.player_hand.is_blackjack or game.dealer_hand.is_blackjack
+
+def start_hand(game, rules=DEFAULT_RULES):
+    """Deal a new hand into a live game and start its replay log."""
+    game.shoe.reshuffle_if_needed()
+    game.hand_log = bytearray(encode_hand_log_header(game.shoe, rules.dealer_hits_soft_17))
+    game.player_hand, game.dealer_hand = _deal_opening(game.shoe)
+
+def apply_action(game, action, rules=DEFAULT_RULES):
+    """Play one logged action (LOG_*) on a live game's hands and append it to the hand log."""
+    shoe = game.shoe
+    if action == LOG_HIT:
+        game.player_hand.add(shoe.deal_code())
+    elif action == LOG_HIT_SPLIT:
+        game.split_hand.add(shoe.deal_code())
+        # Busting the split hand ends the round if the first hand is already finished
+        if game.split_hand.is_bust and first_hand_done(game) and not game.player_hand.is_bust:
+            play_dealer(game.dealer_hand, shoe, rules)
+    elif action == LOG_STAND:
+        play_dealer(game.dealer_hand, shoe, rules)
+    elif action == LOG_DOUBLE:
+        # One card, then the dealer only plays if the player did not bust
+        game.player_hand.add(shoe.deal_code())
+        game.doubled_down = True
+        if not game.player_hand.is_bust:
+            play_dealer(game.dealer_hand, shoe, rules)
+    elif action == LOG_SPLIT:
+        game.split_hand = Hand([game.player_hand.pop()])
+        game.player_hand.add(shoe.deal_code())
+        game.split_hand.add(shoe.deal_code())
+    elif action == LOG_SURRENDER:
+        pass  # Half the bet back and no more cards
+    elif action == LOG_STAND_FIRST:
+        pass  # Play moves to the split hand
+    elif action == LOG_DOUBLE_FIRST:
+        game.player_hand.add(shoe.deal_code())
+        game.doubled_down = True
+    elif action == LOG_DOUBLE_SPLIT:
+        game.split_hand.add(shoe.deal_code())
+        if not (game.split_hand.is_bust and game.player_hand.is_bust):
+            play_dealer(game.dealer_hand, shoe, rules)
+    else:
+        raise ValueError(f"Unknown action code {action} in hand log.")
+    game.hand_log.append(action)
+
+def surrendered(game):
+    return bool(game.hand_log) and game.hand_log[-1] == LOG_SURRENDER
+
+def logged_actions(game):
+    """The action codes in a live game's hand log so far."""
+    return decode_hand_log(bytes(game.hand_log))[4]
+
+def first_hand_done(game):
+    """True once the first hand of a split has stood, doubled or bust, so the split hand plays."""
+    if game.split_hand is None:
+        return False
+    if game.player_hand.is_bust:
+        return True
+    actions = logged_actions(game)
+    return LOG_STAND_FIRST in actions or LOG_DOUBLE_FIRST in actions
+
+def split_aces(game):
+    """True if the round split a pair of aces, whose hands get one card each and no more."""
+    return game.split_hand is not None and game.split_hand.codes[0] == ACE
+
+def hand_stakes(game):
+    """The bet on each of a live game's hands: the base bet, twice it on a doubled hand."""
+    stakes = [game.bet * 2 if game.doubled_down else game.bet]
+    if game.split_hand is not None:
+        stakes.append(game.bet * 2 if LOG_DOUBLE_SPLIT in logged_actions(game) else game.bet)
+    return stakes
+
+def replay_hand(hand_log):
+    """Rebuild a hand exactly from its log; returns a LiveGame holding the cards as they were dealt."""
+    decks, seed, position, dealer_hits_soft_17, actions = decode_hand_log(hand_log)
+    rules = DEFAULT_RULES.replace(decks=decks, dealer_hits_soft_17=dealer_hits_soft_17)
+    game = LiveGame(None, shoe=Shoe.from_seed(decks, seed, position))
+    game.hand_log = bytearray(hand_log[:len(hand_log) - len(actions)])
+    game.player_hand, game.dealer_hand = _deal_opening(game.shoe)
+    for action in actions:
+        if action in (LOG_HIT_SPLIT, LOG_STAND_FIRST, LOG_DOUBLE_FIRST, LOG_DOUBLE_SPLIT) and game.split_hand is None:
+            raise ValueError("Hand log plays a split hand that does not exist.")
+        if action == LOG_SPLIT and hand_log[0] < SPLIT_DEALS_VERSION:
+            # Older logs split without dealing; the hands' second cards were logged as hits
+            game.split_hand = Hand([game.player_hand.pop()])
+            game.hand_log.append(action)
+            continue
+        apply_action(game, action, rules)
+    return game
+
+def _play_policy_hand(hand, shoe, table, upcard_value, can_double, rules=DEFAULT_RULES, split=False):
+    """Play one hand by the strategy table; returns the bet multiplier (1 or 2)."""
+    first_decision = True
+    while not hand.is_bust and hand.value < 21:
+        action = table.lookup(hand.hand_class(), upcard_value)
+        if action == SPLIT:
+            # No more splits allowed: play the pair by its total
+            action = table.lookup(hand_class(hand.value, hand.soft), upcard_value)
+        if action in (DOUBLE_HIT, DOUBLE_STAND):
+            if first_decision and can_double and rules.can_double(hand, split):
+                hand.add(shoe.deal_code())
+                return 2
+            action = HIT if action == DOUBLE_HIT else None
+        elif action >= SURRENDER_HIT:
+            # Surrender is only offered on the opening hand; use the fallback play
+            action = HIT if action == SURRENDER_HIT else None
+        if action != HIT:
+            break
+        hand.add(shoe.deal_code())
+        first_decision = False
+    return 1
+
+def auto_play_hand(shoe, table, spare_bets, rules=DEFAULT_RULES):
+    """Play one round by the strategy table, splitting up to the rules' limit and doubling where advised.
+
+    spare_bets is how many extra bets the player can afford for doubles and
+    splits. Returns (player hands, bet multipliers, dealer hand, outcomes).
+    """
+    player_hand, dealer_hand = deal_hands(shoe)
+    upcard_value = POINTS[dealer_hand.codes[0]]
+
+    # The dealer peeks, so naturals settle before the player acts
+    if player_hand.is_blackjack or dealer_hand.is_blackjack:
+        return [player_hand], [1], dealer_hand, [hand_outcome(player_hand, dealer_hand)]
+    if rules.surrender and table.lookup(player_hand.hand_class(), upcard_value) in (SURRENDER_HIT, SURRENDER_STAND):
+        return [player_hand], [1], dealer_hand, ["surrender"]
+
+    # Split as advised, resplitting new pairs until the limit; split aces are never resplit
+    hands = [player_hand]
+    split_aces = player_hand[0] == 'A'
+    splits = 0
+    index = 0
+    while index < len(hands):
+        hand = hands[index]
+        if spare_bets and rules.can_split(hand, splits) and not (splits and split_aces) \
+                and table.lookup(hand.hand_class(), upcard_value) == SPLIT:
+            second = Hand([hand.pop()])
+            hand.add(shoe.deal_code())
+            second.add(shoe.deal_code())
+            hands.insert(index + 1, second)
+            splits += 1
+            spare_bets -= 1
+            continue
+        index += 1
+
+    multipliers = []
+    split = len(hands) > 1
+    for hand in hands:
+        if split and split_aces:
+            # Split aces get one card each
+            multipliers.append(1)
+            continue
+        multiplier = _play_policy_hand(hand, shoe, table, upcard_value, spare_bets > 0, rules, split)
+        spare_bets -= multiplier - 1
+        multipliers.append(multiplier)
+
+    if not all(hand.is_bust for hand in hands):
+        play_dealer(dealer_hand, shoe, rules)
+    outcomes = [hand_outcome(hand, dealer_hand, split) for hand in hands]
+    return hands, multipliers, dealer_hand, outcomes
+
+def auto_play_session(bankroll, bets, hands, table, shoe=None, rules=DEFAULT_RULES):
+    """Play up to hands rounds, cycling through the bet schedule, until the bankroll runs short.
+
+    Returns one result dict per round with the bankroll after settling it.
+    """
+    if shoe is None:
+        shoe = Shoe(rules.decks)
+    results = []
+    for round_number in range(hands):
+        bet = bets[round_number % len(bets)]
+        if bankroll < bet:
+            break
+        player_hands, multipliers, dealer_hand, outcomes = auto_play_hand(
+            shoe, table, (bankroll - bet) // bet, rules)
+
+        net = sum(rules.settle(outcome, bet * multiplier) for multiplier, outcome in zip(multipliers, outcomes))
+        bankroll += net
+
+        results.append({
+            'bet': bet * sum(multipliers),
+            'net': net,
+            'outcome': "win" if net > 0 else "lose" if net < 0 else "tie",
+            'player_hands': player_hands,
+            'dealer_hand': dealer_hand,
+            'outcomes': outcomes,
+            'doubled_down': 2 in multipliers,
+            'bankroll': bankroll,
+        })
+    return results
@@ -0,0 +1,107 @@
+"""Compact blackjack hand that keeps its value up to date as cards are added."""
+from .cards import POINTS, RANK_CODES, RANKS, hand_class, hand_total
+
+ACE = RANK_CODES['A']
+
+
+class Hand:
+    """A hand stored as rank codes with a running hard total and ace count.
+
+    Adding a card is O(1) and so is every value query. Iterating or indexing
+    yields rank strings, so a Hand can stand in for the old list-of-strings
+    hands; to_list() gives the JSON form used by the API.
+    """
+
+    __slots__ = ('codes', 'hard_total', 'aces')
+
+    def __init__(self, cards=()):
+        self.codes = bytearray()
+        self.hard_total = 0
+        self.aces = 0
+        for card in cards:
+            self.add(card)
+
+    @classmethod
+    def from_codes(cls, codes):
+        hand = cls.__new__(cls)
+        hand.codes = bytearray(codes)
+        hand.hard_total = sum(map(POINTS.__getitem__, hand.codes))
+        hand.aces = hand.codes.count(ACE)
+        return hand
+
+    def add(self, card):
+        """Add a card given as a rank string or rank code."""
+        code = RANK_CODES[card] if isinstance(card, str) else card
+        self.codes.append(code)
+        self.hard_total += POINTS[code]
+        if code == ACE:
+            self.aces += 1
+        return self
+
+    append = add
+
+    def pop(self):
+        """Remove and return the last card as a rank string."""
+        code = self.codes.pop()
+        self.hard_total -= POINTS[code]
+        if code == ACE:
+            self.aces -= 1
+        return RANKS[code]
+
+    @property
+    def value(self):
+        """Best total, counting one ace as 11 when that does not bust."""
+        return hand_total(self.hard_total, self.aces)[0]
+
+    @property
+    def soft(self):
+        return hand_total(self.hard_total, self.aces)[1]
+
+    @property
+    def is_blackjack(self):
+        return len(self.codes) == 2 and self.aces == 1 and self.hard_total == 11
+
+    @property
+    def is_bust(self):
+        return self.hard_total > 21
+
+    @property
+    def is_pair(self):
+        return len(self.codes) == 2 and POINTS[self.codes[0]] == POINTS[self.codes[1]]
+
+    def hand_class(self):
+        """Return the strategy hand class (see cards.py); raises ValueError for fewer than two cards."""
+        if len(self.codes) < 2:
+            raise ValueError("A hand needs at least two cards to classify.")
+        if self.is_pair:
+            return hand_class(0, False, pair_value=POINTS[self.codes[0]])
+        total, soft = hand_total(self.hard_total, self.aces)
+        return hand_class(min(total, 21), soft)
+
+    def to_list(self):
+        return [RANKS[code] for code in self.codes]
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        return RANKS[self.codes[index]]
+
+    def __iter__(self):
+        return (RANKS[code] for code in self.codes)
+
+    def __eq__(self, other):
+        if isinstance(other, Hand):
+            return self.codes == other.codes
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self.to_list())
+
+    def __getstate__(self):
+        return bytes(self.codes)
+
+    def __setstate__(self, state):
+        self.codes = bytearray(state)
+        self.hard_total = sum(map(POINTS.__getitem__, self.codes))
+        self.aces = self.codes.count(ACE)
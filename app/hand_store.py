@@ -0,0 +1,266 @@
+"""Append-only columnar store of hand records, queried through memory maps.
+
+Every field is a fixed-width NumPy array in its own file, so a query touches
+only the columns it selects and opening a store is a memory map, not a parse.
+A record is one round from the player's opening two cards: total, soft flag,
+pair value, dealer upcard, the first decision taken, the true count before the
+deal and the net result per initial bet.
+
+Rows are committed by rewriting meta.json after the column files have been
+appended, so readers never see half a row and the tail of an interrupted
+append is trimmed off by the next one. A store takes one writer at a time.
+"""
+import json
+import os
+from array import array
+
+import numpy as np
+
+from .cards import HARD_MIN, NUM_CLASSES, PAIR_BASE, SOFT_BASE, SOFT_MIN
+from .strategy import DOUBLE_HIT, DOUBLE_STAND, HIT, SPLIT, STAND, SURRENDER_HIT, SURRENDER_STAND
+
+# Field name, dtype and the array typecode HandBuffer collects it in
+COLUMNS = (
+    ('total', np.uint8, 'B'),     # Opening two-card total
+    ('soft', np.bool_, 'B'),
+    ('pair', np.uint8, 'B'),      # Pair value (ace = 1), 0 if not a pair
+    ('upcard', np.uint8, 'B'),    # Dealer upcard value (ace = 1)
+    ('action', np.uint8, 'B'),    # First decision, see ACTIONS
+    ('count', np.float32, 'f'),   # True count before the deal, NaN if nobody was counting
+    ('result', np.float32, 'f'),  # Net result in initial bets
+)
+DTYPES = {name: np.dtype(dtype) for name, dtype, _ in COLUMNS}
+
+# First decisions; "none" when a blackjack settled the round on the deal
+ACTIONS = ('none', 'stand', 'hit', 'double', 'split', 'surrender')
+ACTION_CODES = {name: code for code, name in enumerate(ACTIONS)}
+
+# Strategy action codes (see strategy.py) as first decisions; -1 is a natural
+_FROM_STRATEGY = np.zeros(8, dtype=np.uint8)
+_FROM_STRATEGY[[STAND, HIT, DOUBLE_HIT, DOUBLE_STAND, SURRENDER_HIT, SURRENDER_STAND, SPLIT, -1]] = [
+    ACTION_CODES[name] for name in ('stand', 'hit', 'double', 'double', 'surrender', 'surrender', 'split', 'none')
+]
+
+# Opening total, soft flag and pair value of every hand class
+_CLASS_TOTAL = np.zeros(NUM_CLASSES, dtype=np.uint8)
+_CLASS_SOFT = np.zeros(NUM_CLASSES, dtype=bool)
+_CLASS_PAIR = np.zeros(NUM_CLASSES, dtype=np.uint8)
+_CLASS_TOTAL[:SOFT_BASE] = np.arange(SOFT_BASE) + HARD_MIN
+_CLASS_TOTAL[SOFT_BASE:PAIR_BASE] = np.arange(PAIR_BASE - SOFT_BASE) + SOFT_MIN
+_CLASS_SOFT[SOFT_BASE:PAIR_BASE] = True
+_CLASS_PAIR[PAIR_BASE:] = np.arange(1, 11)
+_CLASS_TOTAL[PAIR_BASE:] = 2 * np.arange(1, 11)
+_CLASS_TOTAL[PAIR_BASE] = 12  # Two aces
+_CLASS_SOFT[PAIR_BASE] = True
+
+# Value range of each field usable in group_by; counts are floored and clamped
+COUNT_LIMIT = 20
+KEY_RANGES = {
+    'total': (0, 31),
+    'soft': (0, 1),
+    'pair': (0, 10),
+    'upcard': (1, 10),
+    'action': (0, len(ACTIONS) - 1),
+    'count': (-COUNT_LIMIT, COUNT_LIMIT),
+}
+CHUNK_ROWS = 1 << 22
+META_FILE = 'meta.json'
+FORMAT_VERSION = 1
+
+
+def records_from_classes(classes):
+    """Opening (total, soft, pair) arrays for an array of hand classes (see cards.py)."""
+    return _CLASS_TOTAL[classes], _CLASS_SOFT[classes], _CLASS_PAIR[classes]
+
+
+def actions_from_strategy(codes):
+    """First-decision codes for an array of strategy action codes, with -1 for a natural."""
+    return _FROM_STRATEGY[codes]
+
+
+class HandStore:
+    """A directory of column files plus meta.json holding the committed row count.
+
+    meta is a dict saved with each append, for writers to keep their own
+    bookkeeping (e.g. how far an export has got).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self._path(META_FILE)):
+            self.refresh()
+        else:
+            self.rows = 0
+            self.meta = {}
+            self._write_meta()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _column_path(self, name):
+        return self._path(f"{name}.bin")
+
+    def refresh(self):
+        """Pick up rows committed since the store was opened (e.g. by another process)."""
+        with open(self._path(META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+        if meta.get('version') != FORMAT_VERSION \
+                or meta.get('columns') != {name: DTYPES[name].str for name, _, _ in COLUMNS}:
+            raise ValueError(f"{self.directory} is not a hand store in this format.")
+        self.rows = meta['rows']
+        self.meta = meta.get('meta', {})
+
+    def _write_meta(self):
+        meta = {
+            'version': FORMAT_VERSION,
+            'rows': self.rows,
+            'columns': {name: DTYPES[name].str for name, _, _ in COLUMNS},
+            'meta': self.meta,
+        }
+        # Write to a temporary name first so readers never see a partial file
+        partial = self._path(f"{META_FILE}.{os.getpid()}.tmp")
+        with open(partial, 'w') as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(partial, self._path(META_FILE))
+
+    def __len__(self):
+        return self.rows
+
+    def append(self, meta=None, **columns):
+        """Append equal-length arrays for every field (count defaults to NaN) and commit them.
+
+        meta updates the store's meta dict in the same commit.
+        """
+        if 'count' not in columns and 'result' in columns:
+            columns['count'] = np.full(len(columns['result']), np.nan, dtype=np.float32)
+        missing = set(DTYPES) - set(columns)
+        unknown = set(columns) - set(DTYPES)
+        if missing or unknown:
+            raise ValueError(f"Hand records need exactly the fields {', '.join(DTYPES)}.")
+        arrays = {name: np.asarray(columns[name], dtype=DTYPES[name]) for name in DTYPES}
+        lengths = {len(values) for values in arrays.values()}
+        if len(lengths) != 1:
+            raise ValueError("Hand record columns must all be the same length.")
+
+        for name, values in arrays.items():
+            path = self._column_path(name)
+            committed = self.rows * values.itemsize
+            with open(path, 'ab') as column:
+                if column.tell() > committed:
+                    column.truncate(committed)  # Left over from an interrupted append
+                column.write(values.tobytes())
+        self.rows += lengths.pop()
+        if meta:
+            self.meta.update(meta)
+        self._write_meta()
+
+    def column(self, name):
+        """Read-only memory map of one field's committed rows."""
+        if name not in DTYPES:
+            raise ValueError(f"Unknown hand record field {name!r}.")
+        if not self.rows:
+            return np.empty(0, dtype=DTYPES[name])
+        return np.memmap(self._column_path(name), dtype=DTYPES[name], mode='r', shape=(self.rows,))
+
+    def group_by(self, by=(), where=None, chunk_rows=CHUNK_ROWS):
+        """Hands, EV and standard deviation of the result per group.
+
+        by names fields from KEY_RANGES; where maps fields to a value, a list
+        of values or an inclusive (low, high) range. Actions may be given by
+        name. Only the columns named here are read, chunk_rows at a time.
+        Returns one dict per non-empty group, in key order.
+        """
+        by = tuple(by)
+        for name in by:
+            if name not in KEY_RANGES:
+                raise ValueError(f"Cannot group by {name!r}; choose from {', '.join(KEY_RANGES)}.")
+        conditions = {name: _condition(name, value) for name, value in (where or {}).items()}
+        columns = {name: self.column(name) for name in set(by) | set(conditions) | {'result'}}
+        sizes = [KEY_RANGES[name][1] - KEY_RANGES[name][0] + 1 for name in by]
+        bins = int(np.prod(sizes)) if by else 1
+        hands = np.zeros(bins, dtype=np.int64)
+        totals = np.zeros(bins)
+        squares = np.zeros(bins)
+
+        for start in range(0, self.rows, chunk_rows):
+            stop = min(start + chunk_rows, self.rows)
+            mask = np.ones(stop - start, dtype=bool)
+            for name, condition in conditions.items():
+                mask &= condition(columns[name][start:stop])
+            keys = np.zeros(stop - start, dtype=np.int64)
+            for name, size in zip(by, sizes):
+                low, high = KEY_RANGES[name]
+                values = columns[name][start:stop]
+                if name == 'count':
+                    mask &= np.isfinite(values)
+                    values = np.floor(np.nan_to_num(values))
+                keys = keys * size + (np.clip(values, low, high).astype(np.int64) - low)
+            keys = keys[mask]
+            results = columns['result'][start:stop][mask].astype(np.float64)
+            hands += np.bincount(keys, minlength=bins)
+            totals += np.bincount(keys, weights=results, minlength=bins)
+            squares += np.bincount(keys, weights=results * results, minlength=bins)
+
+        groups = []
+        for index in np.flatnonzero(hands):
+            count = int(hands[index])
+            mean = totals[index] / count
+            variance = (squares[index] - count * mean * mean) / (count - 1) if count > 1 else 0.0
+            group = {}
+            for name, offset in zip(by, np.unravel_index(index, sizes) if by else ()):
+                value = int(offset) + KEY_RANGES[name][0]
+                group[name] = ACTIONS[value] if name == 'action' else bool(value) if name == 'soft' else value
+            group.update(hands=count, ev=float(mean), std_dev=float(max(variance, 0.0) ** 0.5))
+            groups.append(group)
+        return groups
+
+    def ev(self, **where):
+        """Hands, EV and standard deviation over the records matching where (see group_by)."""
+        groups = self.group_by(where=where)
+        return groups[0] if groups else {'hands': 0, 'ev': 0.0, 'std_dev': 0.0}
+
+
+def _condition(name, value):
+    """A function from a column chunk to a boolean mask."""
+    if name not in DTYPES or name == 'result' and not isinstance(value, tuple):
+        raise ValueError(f"Cannot filter on {name!r} like that.")
+    if name == 'action':
+        if isinstance(value, tuple):
+            raise ValueError("Filter actions by name or a list of names.")
+        names = value if isinstance(value, list) else [value]
+        try:
+            value = [ACTION_CODES[action] if isinstance(action, str) else int(action) for action in names]
+        except KeyError as e:
+            raise ValueError(f"Unknown action {e.args[0]!r}.") from None
+    if isinstance(value, tuple):
+        low, high = value
+        return lambda values: (values >= low) & (values <= high)
+    if isinstance(value, list):
+        return lambda values: np.isin(values, value)
+    return lambda values: values == value
+
+
+class HandBuffer:
+    """Collects records one hand at a time and appends them to a store in blocks."""
+
+    def __init__(self, store, block_rows=1 << 16):
+        self.store = store
+        self.block_rows = block_rows
+        self._columns = [array(typecode) for _, _, typecode in COLUMNS]
+
+    def add(self, total, soft, pair, upcard, action, count, result):
+        for column, value in zip(self._columns, (total, soft, pair, upcard, action, count, result)):
+            column.append(value)
+        if len(self._columns[0]) >= self.block_rows:
+            self.flush()
+
+    def flush(self, meta=None):
+        """Append whatever is buffered (and commit meta even if nothing is)."""
+        if not len(self._columns[0]) and not meta:
+            return
+        self.store.append(meta=meta, **{
+            name: np.frombuffer(column, dtype=np.uint8 if typecode == 'B' else np.float32)
+            for (name, _, typecode), column in zip(COLUMNS, self._columns)
+        })
+        self._columns = [array(typecode) for _, _, typecode in COLUMNS]
@@ -0,0 +1,84 @@
+"""Keyset-paginated and streamed reads of a user's hand history.
+
+Pages are ordered newest first on (timestamp, id) and continue from an opaque
+cursor, so each page is an index range scan however deep the history goes.
+Exports stream from a server-side cursor in fixed-size batches; memory stays
+flat and the first rows go out before the query finishes. Reads cover both
+game_sessions and game_sessions_archive: each table is range-scanned on its
+own (user_id, timestamp, id) index and the two streams are merged.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_, select, union_all
+
+from . import db
+from .models import ArchivedGameSession, GameSession, history_columns, history_row
+
+EXPORT_BATCH_SIZE = 1000
+CSV_FIELDS = ('id', 'timestamp', 'outcome', 'bet', 'final_bankroll', 'doubled_down', 'split_hand')
+
+
+def encode_cursor(row):
+    return f"{row.timestamp.isoformat()}_{row.id}"
+
+
+def decode_cursor(cursor):
+    """Return (timestamp, id) from encode_cursor output, or raise ValueError."""
+    timestamp, _, row_id = cursor.rpartition('_')
+    return datetime.fromisoformat(timestamp), int(row_id)
+
+
+def _history_query(user_id, before=None, limit=None):
+    """Newest-first history over hot and archived sessions; limit applies to each table before merging."""
+    branches = []
+    for model in (GameSession, ArchivedGameSession):
+        query = select(*history_columns(model)).where(model.user_id == user_id)
+        if before is not None:
+            timestamp, row_id = before
+            query = query.where(or_(
+                model.timestamp < timestamp,
+                and_(model.timestamp == timestamp, model.id < row_id),
+            ))
+        query = query.order_by(model.timestamp.desc(), model.id.desc())
+        if limit is not None:
+            query = query.limit(limit)
+        branches.append(select(query.subquery()))
+    merged = union_all(*branches).subquery()
+    query = select(merged).order_by(merged.c.timestamp.desc(), merged.c.id.desc())
+    return query.limit(limit) if limit is not None else query
+
+
+def history_page(user_id, limit, before=None):
+    """Return (rows, next cursor or None) for one page of history."""
+    rows = db.session.execute(_history_query(user_id, before, limit + 1)).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return [history_row(row) for row in rows[:limit]], next_cursor
+
+
+def iter_history(user_id, batch_size=EXPORT_BATCH_SIZE):
+    """Yield lists of history dicts, batch_size rows at a time, from a server-side cursor."""
+    result = db.session.execute(_history_query(user_id).execution_options(yield_per=batch_size))
+    for batch in result.partitions():
+        yield [history_row(row) for row in batch]
+
+
+def export_ndjson(user_id):
+    for batch in iter_history(user_id):
+        yield ''.join(json.dumps(row) + '\n' for row in batch)
+
+
+def export_csv(user_id):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    for batch in iter_history(user_id):
+        buffer.seek(0)
+        buffer.truncate()
+        for row in batch:
+            row['split_hand'] = ' '.join(row['split_hand']) if row['split_hand'] else ''
+            writer.writerow(row)
+        yield buffer.getvalue()
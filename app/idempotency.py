@@ -0,0 +1,83 @@
+"""Idempotency-Key support for mutating endpoints.
+
+The first request with a key claims it in its own small transaction, runs the
+view and stores the response. A retry with the same key gets the stored
+response back instead of running the view again; one that arrives while the
+first is still running gets a 409. Only final answers are stored: a 409, 429
+or 5xx response releases the key like an exception does, so a client that
+retries a transient failure with the same key runs the view again.
+
+Keys are kept for IDEMPOTENCY_KEY_HOURS (24 by default) and then purged by
+the session archiver's loop (see archive.py), so a retry is only safe within
+that window; after it the same key runs the view again.
+"""
+from functools import wraps
+
+from flask import Response, jsonify, make_response, request
+from flask_login import current_user
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 64
+DEFAULT_KEY_HOURS = 24
+# Statuses that may change on a retry: conflicts with an action in flight, rate limits, timeouts
+RETRYABLE_STATUSES = frozenset((408, 409, 425, 429))
+
+
+def idempotent(view):
+    """Replay the stored response for a repeated Idempotency-Key instead of re-running the view."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters.'}), 400
+
+        record = IdempotencyKey(user_id=current_user.id, key=key, endpoint=request.endpoint)
+        db.session.add(record)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return _replay(db.session.get(IdempotencyKey, (current_user.id, key)))
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            _release(record)
+            raise
+        if response.status_code in RETRYABLE_STATUSES or response.status_code >= 500:
+            _release(record)
+            return response
+        record.status_code = response.status_code
+        record.response = response.get_data(as_text=True)
+        db.session.commit()
+        return response
+    return wrapper
+
+
+def purge_keys(older_than):
+    """Delete keys created before older_than (a datetime); returns how many went."""
+    deleted = db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < older_than)).rowcount
+    db.session.commit()
+    return deleted
+
+
+def _release(record):
+    """Drop a claimed key, and anything the view left uncommitted, so the client can retry."""
+    db.session.rollback()
+    db.session.delete(record)
+    db.session.commit()
+
+
+def _replay(record):
+    if record is None or record.status_code is None:
+        return jsonify({'error': f'A request with this {HEADER} is still in progress.'}), 409
+    if record.endpoint != request.endpoint:
+        return jsonify({'error': f'This {HEADER} was already used for a different request.'}), 422
+    return Response(record.response, status=record.status_code, mimetype='application/json')
@@ -0,0 +1,50 @@
+"""Bankroll changes as atomic conditional updates with an append-only ledger.
+
+Every change is a single UPDATE of users.bankroll that only matches while the
+balance covers it, so concurrent requests for one account can neither
+overdraw it nor lose each other's writes, and no lock is held in Python. Each
+change appends a LedgerEntry with the resulting balance, in the caller's
+transaction, so the ledger and the balance commit or roll back together.
+"""
+from sqlalchemy import update
+
+from . import db
+from .models import LedgerEntry, User
+
+
+class InsufficientFunds(ValueError):
+    """Raised when a debit is larger than the current bankroll."""
+
+
+def post(user_id, amount, kind, game_session=None):
+    """Apply a signed change to the bankroll and return the new balance.
+
+    Raises InsufficientFunds if the change would take the balance below zero.
+    """
+    statement = (
+        update(User)
+        .where(User.id == user_id, User.bankroll + amount >= 0)
+        .values(bankroll=User.bankroll + amount)
+        .returning(User.bankroll)
+        .execution_options(synchronize_session='fetch')
+    )
+    balance = db.session.execute(statement).scalar()
+    if balance is None:
+        raise InsufficientFunds("Insufficient bankroll for this bet.")
+    db.session.add(LedgerEntry(
+        user_id=user_id, amount=amount, balance_after=balance, kind=kind, game_session=game_session,
+    ))
+    return balance
+
+
+def debit(user_id, amount, kind, game_session=None):
+    return post(user_id, -amount, kind, game_session)
+
+
+def credit(user_id, amount, kind, game_session=None):
+    return post(user_id, amount, kind, game_session)
+
+
+def open_account(user):
+    """Record a new user's starting bankroll as their first ledger entry."""
+    db.session.add(LedgerEntry(user_id=user.id, amount=user.bankroll, balance_after=user.bankroll, kind='opening'))
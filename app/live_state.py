@@ -0,0 +1,160 @@
+"""In-memory store for live tables so game actions never query GameSession.
+
+Each user has one LiveGame holding their shoe, the hand in progress, the bet,
+the doubled/split flags and the hand's replay log. Only finished hands are written to the database.
+The default store lives in this process; set LIVE_STATE_URL to a redis:// URL
+to share state between workers. Games untouched for LIVE_STATE_TTL seconds
+are evicted.
+
+A request that changes a game first claims it with store.claim(user_id), so
+two actions on one hand (say a double-clicked stand) cannot both settle it:
+the second gets GameBusy while the first holds the claim.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app
+
+from .card_codec import decode_live_game, encode_live_game
+from .shoe import Shoe
+
+DEFAULT_TTL = 30 * 60
+CLAIM_TIMEOUT = 30  # Seconds before a Redis claim left by a dead worker lapses
+
+
+class GameBusy(Exception):
+    """Another request holds the claim on this user's game."""
+
+
+class LiveGame:
+    """Authoritative state of one user's table between requests."""
+
+    __slots__ = ('user_id', 'shoe', 'bet', 'player_hand', 'dealer_hand', 'split_hand', 'doubled_down', 'hand_log')
+
+    def __init__(self, user_id, shoe=None):
+        self.user_id = user_id
+        self.shoe = shoe if shoe is not None else Shoe()
+        self.bet = 0
+        self.reset_hand()
+
+    def reset_hand(self):
+        """Clear the finished hand, keeping the shoe for the next one."""
+        self.bet = 0
+        self.player_hand = None
+        self.dealer_hand = None
+        self.split_hand = None
+        self.doubled_down = False
+        self.hand_log = None  # Shoe seed/position and actions, see game_logic.replay_hand
+
+    @property
+    def in_progress(self):
+        return self.player_hand is not None
+
+
+class MemoryStateStore:
+    """Thread-safe per-process store with TTL eviction."""
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._games = {}
+        self._claims = set()
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + ttl
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._games.get(user_id)
+            if entry is None:
+                return None
+            expires, game = entry
+            if expires <= now:
+                del self._games[user_id]
+                return None
+            return game
+
+    def put(self, game):
+        now = time.monotonic()
+        with self._lock:
+            self._games[game.user_id] = (now + self.ttl, game)
+            if now >= self._next_sweep:
+                self._evict_expired(now)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._games.pop(user_id, None)
+
+    @contextmanager
+    def claim(self, user_id):
+        """Hold the user's game for one request; raises GameBusy if another request holds it."""
+        with self._lock:
+            if user_id in self._claims:
+                raise GameBusy()
+            self._claims.add(user_id)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._claims.discard(user_id)
+
+    def _evict_expired(self, now):
+        expired = [user_id for user_id, (expires, _) in self._games.items() if expires <= now]
+        for user_id in expired:
+            del self._games[user_id]
+        self._next_sweep = now + self.ttl
+
+    def __len__(self):
+        return len(self._games)
+
+
+class RedisStateStore:
+    """Store shared between worker processes through Redis; expiry is Redis's TTL."""
+
+    def __init__(self, url, ttl=DEFAULT_TTL, prefix='blackjack:live:'):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("LIVE_STATE_URL points at Redis but the redis package is not installed.") from e
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, user_id):
+        data = self.client.get(f"{self.prefix}{user_id}")
+        return decode_live_game(data) if data is not None else None
+
+    def put(self, game):
+        self.client.set(f"{self.prefix}{game.user_id}", encode_live_game(game), ex=self.ttl)
+
+    def delete(self, user_id):
+        self.client.delete(f"{self.prefix}{user_id}")
+
+    @contextmanager
+    def claim(self, user_id):
+        """Hold the user's game for one request across workers; raises GameBusy if another request holds it."""
+        from redis.exceptions import LockError
+
+        lock = self.client.lock(f"{self.prefix}{user_id}:claim", timeout=CLAIM_TIMEOUT)
+        if not lock.acquire(blocking=False):
+            raise GameBusy()
+        try:
+            yield
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                pass  # Lapsed after CLAIM_TIMEOUT; nothing left to release
+
+
+def create_state_store(config):
+    """Build the store selected by LIVE_STATE_URL / LIVE_STATE_TTL."""
+    ttl = int(config.get('LIVE_STATE_TTL') or DEFAULT_TTL)
+    url = config.get('LIVE_STATE_URL')
+    if url:
+        return RedisStateStore(url, ttl)
+    return MemoryStateStore(ttl)
+
+
+def get_state_store():
+    return current_app.extensions['live_state']
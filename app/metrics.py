@@ -0,0 +1,243 @@
+"""In-process request, database and simulator metrics in Prometheus text format.
+
+Metrics are plain counters, gauges and fixed-bucket histograms behind one lock
+each, so recording costs a dict lookup and a bisect. Values are per process;
+with several workers, scrape each one (or aggregate in Prometheus).
+"""
+import bisect
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric:
+    """Base for labelled metrics; subclasses define kind and _lines."""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self._snapshot()):
+            lines.extend(self._lines(list(zip(self.labelnames, key)), value))
+        return lines
+
+    def _snapshot(self):
+        with self._lock:
+            return list(self._values.items())
+
+    def _lines(self, labels, value):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (the last is +Inf), then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _snapshot(self):
+        with self._lock:
+            return [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+
+    def _lines(self, labels, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            bucket_labels = labels + [('le', _format_value(bound))]
+            lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by endpoint.', ('endpoint', 'method', 'status')))
+REQUEST_STATEMENTS = REGISTRY.register(Histogram(
+    'http_request_sql_statements', 'SQL statements executed per request, by endpoint.', ('endpoint',),
+    buckets=STATEMENT_BUCKETS))
+REQUEST_SQL_SECONDS = REGISTRY.register(Histogram(
+    'http_request_sql_duration_seconds', 'Time spent in SQL per request, by endpoint.', ('endpoint',)))
+SQL_STATEMENTS = REGISTRY.register(Counter('sql_statements_total', 'SQL statements executed.'))
+SQL_SECONDS = REGISTRY.register(Counter('sql_statement_seconds_total', 'Time spent executing SQL statements.'))
+POOL_CHECKOUTS = REGISTRY.register(Counter('db_pool_checkouts_total', 'Connections checked out of the pool.'))
+POOL_CONNECTS = REGISTRY.register(Counter('db_pool_connects_total', 'New database connections opened.'))
+POOL_CHECKED_OUT = REGISTRY.register(Gauge('db_pool_checked_out', 'Connections currently checked out.'))
+POOL_SIZE = REGISTRY.register(Gauge('db_pool_size', 'Configured pool size.'))
+SIMULATED_HANDS = REGISTRY.register(Counter(
+    'simulator_hands_total', 'Hands played by the simulators.', ('simulator',)))
+SIMULATOR_SECONDS = REGISTRY.register(Counter(
+    'simulator_seconds_total', 'Wall-clock time the simulators spent playing hands.', ('simulator',)))
+
+
+def record_simulation(simulator, hands, seconds):
+    """Count simulated hands; hands/second is rate(simulator_hands_total) or hands over seconds."""
+    SIMULATED_HANDS.inc(hands, simulator=simulator)
+    SIMULATOR_SECONDS.inc(seconds, simulator=simulator)
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_sql = [0, 0.0]
+
+
+def _after_request(response):
+    _observe_request(response.status_code)
+    return response
+
+
+def _teardown_request(exception):
+    if exception is not None:
+        _observe_request(500)
+
+
+def _observe_request(status):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+    endpoint = _endpoint()
+    REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method, status=status)
+    statements, sql_seconds = g.pop('metrics_sql')
+    REQUEST_STATEMENTS.observe(statements, endpoint=endpoint)
+    REQUEST_SQL_SECONDS.observe(sql_seconds, endpoint=endpoint)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['metrics_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop('metrics_start', time.perf_counter())
+    SQL_STATEMENTS.inc()
+    SQL_SECONDS.inc(elapsed)
+    if has_request_context():
+        totals = g.get('metrics_sql')
+        if totals is not None:
+            totals[0] += 1
+            totals[1] += elapsed
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    POOL_CHECKOUTS.inc()
+    POOL_CHECKED_OUT.inc()
+
+
+def _on_checkin(dbapi_connection, connection_record):
+    POOL_CHECKED_OUT.dec()
+
+
+def _on_connect(dbapi_connection, connection_record):
+    POOL_CONNECTS.inc()
+
+
+def init_metrics(app, db):
+    """Hook request timing and SQL/pool events into the app and serve /api/metrics."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine.pool, 'checkout', _on_checkout)
+    event.listen(engine.pool, 'checkin', _on_checkin)
+    event.listen(engine.pool, 'connect', _on_connect)
+
+    @app.route("/api/metrics", methods=["GET"])
+    def metrics():
+        size = getattr(engine.pool, 'size', None)
+        if size is not None:
+            POOL_SIZE.set(size())
+        return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
@@ -1,7 +1,9 @@
+from flask import current_app
 from flask_login import UserMixin
 from datetime import datetime
-from flask_bcrypt import generate_password_hash, check_password_hash
+from sqlalchemy import case, insert, update
 from . import db
+from .card_codec import CardList
 
 class User(db.Model, UserMixin):
     __tablename__ = 'users'
@@ -12,13 +14,16 @@ class User(db.Model, UserMixin):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relationships
-    games = db.relationship('GameSession', backref='user', lazy=True, cascade="all, delete-orphan")
+    # Dynamic so history is always queried in pages, never loaded whole
+    games = db.relationship('GameSession', backref='user', lazy='dynamic', cascade="all, delete-orphan")
+    archived_games = db.relationship('ArchivedGameSession', lazy='dynamic', cascade="all, delete-orphan")
+    stats = db.relationship('UserStats', backref='user', uselist=False, cascade="all, delete-orphan")
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password).decode('utf-8')
+        self.password_hash = current_app.extensions['password_hasher'].hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return current_app.extensions['password_hasher'].check(self.password_hash, password)
 
     def __repr__(self):
         return f"<User {self.username}>"
@@ -27,22 +32,184 @@ class GameSession(db.Model):
     __tablename__ = 'game_sessions'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    outcome = db.Column(db.String(10))  # win/lose/tie
+    outcome = db.Column(db.String(10))  # win/blackjack/lose/surrender/tie
     bet = db.Column(db.Integer)
     final_bankroll = db.Column(db.Integer)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     doubled_down = db.Column(db.Boolean, default=False)  # New column for doubling down
-    split_hand = db.Column(db.PickleType, nullable=True)  # New column to store split hand (if any)
-
-    def record_outcome(self, outcome, user):
-        """Update session and user based on outcome."""
-        self.outcome = outcome
-        if outcome == "win":
-            user.bankroll += self.bet * 2  # Winnings are double the bet
-        elif outcome == "tie":
-            user.bankroll += self.bet  # Bet is refunded on a tie
-        # Save the final bankroll in this session
-        self.final_bankroll = user.bankroll
+    split_hand = db.Column(CardList, nullable=True)  # Split hand (if any), one byte per card
+    hand_log = db.Column(db.LargeBinary, nullable=True)  # Shoe seed/position and actions, see replay_hand
+
+    # History is read newest first per user, paged on (timestamp, id)
+    __table_args__ = (db.Index('ix_game_sessions_user_history', 'user_id', 'timestamp', 'id'),)
+
+    def record_outcome(self, outcome, user, rules=None):
+        """Record the outcome, pay out through the ledger under the table rules and save the final bankroll."""
+        self.record_outcomes([outcome], [self.bet], user, rules)
+
+    def record_outcomes(self, outcomes, stakes, user, rules=None):
+        """Settle a round of one or more hands (after a split), each at its own stake, in one payout.
+
+        bet becomes the total staked; a round of several hands is a win, loss
+        or tie by its net result, as autoplay records it.
+        """
+        from .ledger import credit
+        from .rules import DEFAULT_RULES
+
+        rules = rules or DEFAULT_RULES
+        net = sum(rules.settle(outcome, stake) for outcome, stake in zip(outcomes, stakes))
+        self.bet = sum(stakes)
+        if len(outcomes) == 1:
+            self.outcome = outcomes[0]
+        else:
+            self.outcome = "win" if net > 0 else "lose" if net < 0 else "tie"
+        # The stakes were taken when they were placed, so the payout is the stakes plus the net result
+        self.final_bankroll = credit(user.id, self.bet + net, 'payout', game_session=self)
+        UserStats.add_hands(user.id, [(self.outcome, self.bet, net)])
 
     def __repr__(self):
         return f"<GameSession {self.id} - User {self.user_id} - Outcome {self.outcome}>"
+
+class ArchivedGameSession(db.Model):
+    """A finished GameSession moved out of the hot table by archive.py; same id, same columns."""
+    __tablename__ = 'game_sessions_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    outcome = db.Column(db.String(10))
+    bet = db.Column(db.Integer)
+    final_bankroll = db.Column(db.Integer)
+    timestamp = db.Column(db.DateTime)
+    doubled_down = db.Column(db.Boolean, default=False)
+    split_hand = db.Column(CardList, nullable=True)
+    hand_log = db.Column(db.LargeBinary, nullable=True)
+
+    __table_args__ = (db.Index('ix_game_sessions_archive_user_history', 'user_id', 'timestamp', 'id'),)
+
+    def __repr__(self):
+        return f"<ArchivedGameSession {self.id} - User {self.user_id} - Outcome {self.outcome}>"
+
+# Columns copied as-is when a session is archived
+SESSION_COLUMNS = ('id', 'user_id', 'outcome', 'bet', 'final_bankroll', 'timestamp', 'doubled_down', 'split_hand',
+                   'hand_log')
+
+def history_row(row):
+    """JSON-ready dict for a session or a row selected with history_columns."""
+    return {
+        'id': row.id,
+        'timestamp': row.timestamp.isoformat() if row.timestamp else None,
+        'outcome': row.outcome,
+        'bet': row.bet,
+        'final_bankroll': row.final_bankroll,
+        'doubled_down': bool(row.doubled_down),
+        'split_hand': row.split_hand.to_list() if row.split_hand is not None else None,
+    }
+
+HISTORY_FIELDS = ('id', 'timestamp', 'outcome', 'bet', 'final_bankroll', 'doubled_down', 'split_hand')
+
+def history_columns(model):
+    """The columns history_row reads, from GameSession or ArchivedGameSession."""
+    return tuple(getattr(model, name) for name in HISTORY_FIELDS)
+
+class LedgerEntry(db.Model):
+    """One append-only change to a user's bankroll; amounts are signed."""
+    __tablename__ = 'bankroll_ledger'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    amount = db.Column(db.Integer, nullable=False)
+    balance_after = db.Column(db.Integer, nullable=False)
+    # opening/bet/double/split/payout/autoplay/buyin/cashout/refund/reconcile
+    kind = db.Column(db.String(20), nullable=False)
+    # No foreign key: the session may since have moved to game_sessions_archive under the same id
+    game_session_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    game_session = db.relationship('GameSession', primaryjoin='foreign(LedgerEntry.game_session_id) == GameSession.id')
+
+    __table_args__ = (db.Index('ix_bankroll_ledger_user', 'user_id', 'id'),)
+
+    def __repr__(self):
+        return f"<LedgerEntry {self.id} - User {self.user_id} - {self.kind} {self.amount:+d}>"
+
+class IdempotencyKey(db.Model):
+    """The stored response for a mutating request sent with an Idempotency-Key header."""
+    __tablename__ = 'idempotency_keys'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    key = db.Column(db.String(64), primary_key=True)
+    endpoint = db.Column(db.String(50), nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)  # None while the request is in flight
+    response = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<IdempotencyKey {self.user_id}/{self.key} - {self.status_code}>"
+
+class UserStats(db.Model):
+    """Running per-user totals, updated with every settled hand."""
+    __tablename__ = 'user_stats'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    hands_played = db.Column(db.Integer, nullable=False, default=0)
+    wins = db.Column(db.Integer, nullable=False, default=0)
+    losses = db.Column(db.Integer, nullable=False, default=0)
+    ties = db.Column(db.Integer, nullable=False, default=0)
+    total_wagered = db.Column(db.BigInteger, nullable=False, default=0)
+    net_result = db.Column(db.BigInteger, nullable=False, default=0, index=True)  # Leaderboard order
+    biggest_win = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Column defaults only apply on insert, so new rows start from these in Python
+    ZERO = dict(hands_played=0, wins=0, losses=0, ties=0, total_wagered=0, net_result=0, biggest_win=0)
+
+    @classmethod
+    def add_hands(cls, user_id, hands):
+        """Fold settled hands, (outcome, wagered, net) each, into the user's totals in the caller's transaction.
+
+        The row is created if missing by an insert that ignores a conflict,
+        then updated by one UPDATE computed in SQL, so concurrent writers for
+        the same user neither lose increments nor collide on the insert.
+        """
+        hands = list(hands)
+        if not hands:
+            return
+        outcomes = [outcome for outcome, _, _ in hands]
+        wins = sum(outcome in ("win", "blackjack") for outcome in outcomes)
+        losses = sum(outcome in ("lose", "surrender") for outcome in outcomes)
+        best = max(net for _, _, net in hands)
+        db.session.execute(_insert_ignoring_conflicts(cls).values(user_id=user_id, **cls.ZERO))
+        db.session.execute(
+            update(cls).where(cls.user_id == user_id).values(
+                hands_played=cls.hands_played + len(hands),
+                wins=cls.wins + wins,
+                losses=cls.losses + losses,
+                ties=cls.ties + len(hands) - wins - losses,
+                total_wagered=cls.total_wagered + sum(wagered for _, wagered, _ in hands),
+                net_result=cls.net_result + sum(net for _, _, net in hands),
+                biggest_win=case((cls.biggest_win < best, best), else_=cls.biggest_win),
+                updated_at=datetime.utcnow(),
+            ).execution_options(synchronize_session='fetch')
+        )
+
+    def to_dict(self):
+        return {
+            'hands_played': self.hands_played,
+            'wins': self.wins,
+            'losses': self.losses,
+            'ties': self.ties,
+            'win_rate': self.wins / self.hands_played if self.hands_played else 0.0,
+            'total_wagered': self.total_wagered,
+            'net_result': self.net_result,
+            'biggest_win': self.biggest_win,
+        }
+
+    def __repr__(self):
+        return f"<UserStats {self.user_id} - Net {self.net_result}>"
+
+def _insert_ignoring_conflicts(model):
+    """An INSERT for model that does nothing if the row already exists."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(model).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+        return postgresql_insert(model).on_conflict_do_nothing()
+    return insert(model).prefix_with('IGNORE')  # MySQL and MariaDB
@@ -0,0 +1,82 @@
+"""bcrypt hashing on a bounded process pool, off the request threads.
+
+A request thread waiting on the pool holds no GIL and burns no CPU, so a burst
+of logins cannot starve game actions. Once max_pending hashes are queued,
+further calls raise HashingOverloaded and the caller answers 503.
+"""
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+DEFAULT_ROUNDS = 12
+
+_COST = re.compile(r'^\$2[abxy]?\$(\d\d)\$')
+
+
+class HashingOverloaded(Exception):
+    """Raised when the hashing queue is full."""
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(password_hash, password):
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+
+def hash_cost(password_hash):
+    """Return the bcrypt cost factor stored in a hash, or None if it is not a bcrypt hash."""
+    match = _COST.match(password_hash or '')
+    return int(match.group(1)) if match else None
+
+
+class PasswordHasher:
+    """Hash and verify passwords on worker processes; workers=0 hashes inline."""
+
+    def __init__(self, rounds=DEFAULT_ROUNDS, workers=2, max_pending=16):
+        self.rounds = rounds
+        self.workers = workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingOverloaded("Too many password operations queued.")
+        try:
+            if not self.workers:
+                return function(*args)
+            return self._get_executor().submit(function, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash, password, self.rounds)
+
+    def check(self, password_hash, password):
+        return self._run(_check, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was made with a different cost than the current one."""
+        return hash_cost(password_hash) != self.rounds
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_password_hasher(config):
+    return PasswordHasher(
+        rounds=int(config.get('BCRYPT_LOG_ROUNDS') or DEFAULT_ROUNDS),
+        workers=int(config.get('PASSWORD_HASH_WORKERS', 2)),
+        max_pending=int(config.get('PASSWORD_HASH_MAX_PENDING') or 16),
+    )
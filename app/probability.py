@@ -0,0 +1,161 @@
+"""Exact dealer outcome probabilities and player EVs for a given shoe composition.
+
+A shoe composition is a tuple of ten remaining-card counts indexed by point
+value - 1 (ace first, ten-valued cards last). Every subproblem is memoized on
+(composition, hand state), so evaluating a shoe with one card removed reuses
+almost all of the work done for the full shoe.
+"""
+from functools import lru_cache
+
+from .cards import ONE_DECK_VALUE_COUNTS, hand_total, point_value
+
+# Dealer final totals, in the order of the probability tuples returned below
+OUTCOMES = (17, 18, 19, 20, 21, 'bust')
+
+CACHE_SIZE = 1 << 20
+
+
+def shoe_counts(decks=1):
+    """Return the composition of a full shoe of decks decks."""
+    return tuple(count * decks for count in ONE_DECK_VALUE_COUNTS)
+
+
+def remove_cards(counts, cards):
+    """Return counts with the given rank strings taken out."""
+    counts = list(counts)
+    for card in cards:
+        index = point_value(card) - 1
+        if not counts[index]:
+            raise ValueError(f"No {card} left in the shoe.")
+        counts[index] -= 1
+    return tuple(counts)
+
+
+def _minus(counts, index):
+    return counts[:index] + (counts[index] - 1,) + counts[index + 1:]
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _dealer_finish(counts, hard, ace, dealer_hits_soft_17):
+    """Final-total probabilities for a dealer hand drawing from counts."""
+    total, soft = hand_total(hard, ace)
+    if total > 21:
+        return (0.0, 0.0, 0.0, 0.0, 0.0, 1.0)
+    if total > 17 or (total == 17 and not (soft and dealer_hits_soft_17)):
+        result = [0.0] * 6
+        result[total - 17] = 1.0
+        return tuple(result)
+
+    remaining = sum(counts)
+    if not remaining:
+        raise ValueError("The shoe ran out of cards.")
+    result = [0.0] * 6
+    for index, count in enumerate(counts):
+        if not count:
+            continue
+        p = count / remaining
+        sub = _dealer_finish(_minus(counts, index), hard + index + 1, ace or index == 0, dealer_hits_soft_17)
+        for outcome in range(6):
+            result[outcome] += p * sub[outcome]
+    return tuple(result)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def dealer_probabilities(counts, upcard, dealer_hits_soft_17=False, peek=True):
+    """Probabilities of the dealer finishing on 17-21 or busting (see OUTCOMES).
+
+    counts is the shoe left after the upcard (point value, ace = 1) was dealt.
+    With peek, hole cards that would give the dealer blackjack are excluded.
+    """
+    excluded = None
+    if peek and upcard == 1:
+        excluded = 9
+    elif peek and upcard == 10:
+        excluded = 0
+
+    remaining = sum(counts) - (counts[excluded] if excluded is not None else 0)
+    result = [0.0] * 6
+    for index, count in enumerate(counts):
+        if not count or index == excluded:
+            continue
+        p = count / remaining
+        sub = _dealer_finish(_minus(counts, index), upcard + index + 1, upcard == 1 or index == 0,
+                             dealer_hits_soft_17)
+        for outcome in range(6):
+            result[outcome] += p * sub[outcome]
+    return tuple(result)
+
+
+def _stand_ev(total, dealer):
+    if total > 21:
+        return -1.0
+    ev = dealer[5]
+    for outcome, p in zip(OUTCOMES[:5], dealer):
+        if outcome < total:
+            ev += p
+        elif outcome > total:
+            ev -= p
+    return ev
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _stand(counts, hard, ace, upcard, dealer_hits_soft_17):
+    total = hand_total(hard, ace)[0]
+    if total > 21:
+        return -1.0
+    return _stand_ev(total, dealer_probabilities(counts, upcard, dealer_hits_soft_17))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _hit(counts, hard, ace, upcard, dealer_hits_soft_17):
+    """EV of taking one card and then playing on optimally (hit or stand)."""
+    remaining = sum(counts)
+    ev = 0.0
+    for index, count in enumerate(counts):
+        if not count:
+            continue
+        next_counts = _minus(counts, index)
+        next_hard, next_ace = hard + index + 1, ace or index == 0
+        if next_hard > 21:
+            ev -= count / remaining
+            continue
+        ev += count / remaining * max(
+            _stand(next_counts, next_hard, next_ace, upcard, dealer_hits_soft_17),
+            _hit(next_counts, next_hard, next_ace, upcard, dealer_hits_soft_17),
+        )
+    return ev
+
+
+def _double(counts, hard, ace, upcard, dealer_hits_soft_17):
+    remaining = sum(counts)
+    ev = 0.0
+    for index, count in enumerate(counts):
+        if count:
+            ev += count / remaining * _stand(_minus(counts, index), hard + index + 1, ace or index == 0,
+                                             upcard, dealer_hits_soft_17)
+    return 2 * ev
+
+
+def player_evs(player_cards, upcard, counts, dealer_hits_soft_17=False):
+    """Exact stand/hit/double EVs for a hand of rank strings against an upcard rank.
+
+    counts is the shoe left after the player's cards and the upcard were dealt.
+    EVs are per unit of the initial bet and conditioned on no dealer blackjack.
+    """
+    counts = tuple(counts)
+    values = [point_value(card) for card in player_cards]
+    hard, ace = sum(values), 1 in values
+    dealer_up = point_value(upcard)
+    evs = {
+        'stand': _stand(counts, hard, ace, dealer_up, dealer_hits_soft_17),
+        'hit': _hit(counts, hard, ace, dealer_up, dealer_hits_soft_17) if hard <= 21 else -1.0,
+    }
+    if len(values) == 2:
+        evs['double'] = _double(counts, hard, ace, dealer_up, dealer_hits_soft_17)
+    return evs
+
+
+def clear_cache():
+    """Drop every memoized subproblem."""
+    for cached in (_dealer_finish, dealer_probabilities, _stand, _hit):
+        cached.cache_clear()
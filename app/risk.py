@@ -0,0 +1,152 @@
+"""Vectorized risk-of-ruin and bankroll trajectory analysis.
+
+Many bankroll paths advance together as one numpy array. Each hand's result
+is drawn from a per-hand outcome distribution measured by the game engine
+(simulation.simulate for flat betting, counting.simulate_counting for a bet
+spread), a block of hands at a time. Both engines split pairs under the
+table rules, so a round's result covers all of its hands. Hands are treated
+as independent draws from that distribution; the measured distribution
+carries Monte Carlo error, and for a bet ramp ignoring the run of the count
+from hand to hand is a further approximation.
+"""
+import math
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from .metrics import record_simulation
+from .rules import DEFAULT_RULES, RULES_CACHE_SIZE
+from .simulation import simulate
+
+PERCENTILES = (5, 25, 50, 75, 95)
+# Outcome draws held in memory at once (paths x hands per block)
+BLOCK_CELLS = 2_000_000
+
+
+class OutcomeDistribution:
+    """Per-hand net results in betting units and their probabilities."""
+
+    def __init__(self, values, probabilities):
+        self.values = np.asarray(values, dtype=np.float64)
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        if len(self.values) == 0 or len(self.values) != len(probabilities) or (probabilities < 0).any():
+            raise ValueError("An outcome distribution needs matching values and non-negative probabilities.")
+        self.probabilities = probabilities / probabilities.sum()
+        self._cdf = np.cumsum(self.probabilities)
+
+    @classmethod
+    def from_counts(cls, outcome_counts):
+        """Build from {net result: hands} as kept by SimulationResult and CountingResult."""
+        values = sorted(outcome_counts)
+        return cls(values, [outcome_counts[value] for value in values])
+
+    @property
+    def mean(self):
+        return float(np.dot(self.values, self.probabilities))
+
+    @property
+    def std_dev(self):
+        return float(np.sqrt(np.dot((self.values - self.mean) ** 2, self.probabilities)))
+
+    def sample(self, rng, shape):
+        index = np.searchsorted(self._cdf, rng.random(shape), side='right')
+        return self.values[np.minimum(index, len(self.values) - 1)]
+
+
+@lru_cache(maxsize=RULES_CACHE_SIZE)
+def basic_strategy_distribution(rules=DEFAULT_RULES, hands=1_000_000):
+    """Outcome distribution of flat-bet basic strategy, pairs split as the rules allow, measured once per rule set."""
+    result = simulate(hands, rules=rules, rng=np.random.default_rng(0))
+    return OutcomeDistribution.from_counts(result.outcome_counts)
+
+
+def counting_distribution(hands=1_000_000, seed=0, **options):
+    """Outcome distribution of a counting strategy (options as for counting.simulate_counting)."""
+    from .counting import simulate_counting
+
+    return OutcomeDistribution.from_counts(simulate_counting(hands, seed=seed, **options).outcome_counts)
+
+
+def ruin_formula(distribution, bankroll_units):
+    """Classic infinite-horizon approximation exp(-2 * ev * bankroll / variance)."""
+    mean, variance = distribution.mean, distribution.std_dev ** 2
+    if mean <= 0:
+        return 1.0
+    return math.exp(-2 * mean * bankroll_units / variance)
+
+
+def analyze_bankroll(distribution, bankroll, unit, hands, paths=10_000, checkpoints=10, seed=None):
+    """Simulate paths bankrolls for up to hands hands each.
+
+    A path is ruined once its bankroll drops below one unit (it can no longer
+    cover the minimum bet) and stays there. Returns risk of ruin, percentile
+    bands at evenly spaced checkpoints, and the time taken to double.
+    """
+    if bankroll < unit or unit <= 0 or hands < 1 or paths < 1:
+        raise ValueError("Need a bankroll of at least one positive unit, and at least one hand and path.")
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    balances = np.full(paths, float(bankroll))
+    alive = np.ones(paths, dtype=bool)
+    ruin_at = np.zeros(paths, dtype=np.int64)  # 0 = not ruined
+    doubled_at = np.zeros(paths, dtype=np.int64)  # 0 = not doubled yet
+    target = 2 * bankroll
+
+    step = max(1, hands // max(1, checkpoints))
+    marks = sorted(set(range(step, hands, step)) | {hands})
+    block = max(1, BLOCK_CELLS // paths)
+    bands = {}
+    played = 0
+    for mark in marks:
+        while played < mark:
+            length = min(block, mark - played)
+            rows = np.flatnonzero(alive)
+            if len(rows):
+                results = distribution.sample(rng, (len(rows), length)) * unit
+                paths_now = balances[rows, None] + np.cumsum(results, axis=1)
+                broke = paths_now < unit
+                went_broke = broke.any(axis=1)
+                first_broke = np.where(went_broke, broke.argmax(axis=1), length)
+
+                # Doubling only counts if it happened before the path went broke
+                rich = paths_now >= target
+                first_rich = np.where(rich.any(axis=1), rich.argmax(axis=1), length)
+                newly_doubled = (first_rich < first_broke) & (doubled_at[rows] == 0)
+                doubled_at[rows[newly_doubled]] = played + first_rich[newly_doubled] + 1
+
+                ruined_rows = rows[went_broke]
+                balances[ruined_rows] = paths_now[went_broke, first_broke[went_broke]]
+                ruin_at[ruined_rows] = played + first_broke[went_broke] + 1
+                alive[ruined_rows] = False
+                survivors = ~went_broke
+                balances[rows[survivors]] = paths_now[survivors, -1]
+            played += length
+        bands[mark] = _percentiles(balances)
+
+    record_simulation('risk', paths * hands, time.perf_counter() - started)
+
+    doubled = doubled_at[doubled_at > 0]
+    ruined = ruin_at[ruin_at > 0]
+    return {
+        'paths': paths,
+        'hands': hands,
+        'bankroll': bankroll,
+        'unit': unit,
+        'ev_per_hand': distribution.mean * unit,
+        'std_dev_per_hand': distribution.std_dev * unit,
+        'risk_of_ruin': len(ruined) / paths,
+        'risk_of_ruin_formula': ruin_formula(distribution, bankroll / unit),
+        'median_hands_to_ruin': float(np.median(ruined)) if len(ruined) else None,
+        'doubled': len(doubled) / paths,
+        'median_hands_to_double': float(np.median(doubled)) if len(doubled) else None,
+        'final': {
+            'mean': float(balances.mean()),
+            'percentiles': _percentiles(balances),
+        },
+        'percentile_bands': bands,
+    }
+
+
+def _percentiles(values):
+    return {f"p{p}": float(value) for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
@@ -1,190 +1,670 @@
-from flask import Blueprint, request, jsonify
+import json
+import secrets
+import time
+from functools import wraps
+
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from sqlalchemy import insert
 from . import db
-from .models import User, GameSession
-from .game_logic import create_deck, deal_card, calculate_hand_value, is_bust, is_blackjack, start_game, play_turn, determine_outcome
+from .models import User, GameSession, UserStats
+from .game_logic import (
+    LOG_DOUBLE, LOG_DOUBLE_FIRST, LOG_DOUBLE_SPLIT, LOG_HIT, LOG_HIT_SPLIT, LOG_SPLIT, LOG_STAND, LOG_STAND_FIRST,
+    LOG_SURRENDER, apply_action, auto_play_session, first_hand_done, has_natural, is_bust, replay_hand, settle_game,
+    split_aces, start_hand,
+)
+from .archive import find_session
+from .card_codec import is_table_log
+from .history import decode_cursor, export_csv, export_ndjson, history_page
+from .idempotency import idempotent
+from .ledger import InsufficientFunds, debit, post
+from .live_state import GameBusy, LiveGame, get_state_store
+from .metrics import record_simulation
+from .risk import analyze_bankroll, basic_strategy_distribution
+from .rules import RuleSet, get_rules, strategy_table, summary
+from .shoe import Shoe
+from .sim_jobs import MAX_JOB_HANDS, MAX_PLAYERS, JobsOverloaded, SimulationJob, TooManyJobs
+from .strategy import ACTION_CODES, StrategyTable
+from .tables import replay_table_hand
 from flask_login import current_user, login_required
 
 main = Blueprint('main', __name__)
 
+NO_ACTIVE_GAME = 'No active game session found. Please start a new game.'
+SPLIT_ACES_DONE = 'Split aces get one card each; stand to finish the hand.'
+MAX_AUTOPLAY_HANDS = 10_000
+MAX_RISK_HANDS = 1_000_000
+MAX_RISK_PATHS = 100_000
+MAX_RISK_CELLS = 200_000_000
+JOB_RETRY_AFTER = 10  # Seconds a client is asked to wait when simulation jobs are at their limit
+
+
+def _claims_game(view):
+    """Run the view holding the user's live game, so two actions on one hand cannot both settle it.
+
+    A request that arrives while another holds the game gets a 409; views
+    read the game only after claiming it.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            with get_state_store().claim(current_user.id):
+                return view(*args, **kwargs)
+        except GameBusy:
+            return jsonify({'error': 'Another action on this hand is in progress.'}), 409
+    return wrapper
+
+
+def _active_game():
+    """Return the user's live game if a hand is in progress."""
+    game = get_state_store().get(current_user.id)
+    if game is None or not game.in_progress:
+        return None
+    return game
+
+
+def _advice(hand, upcard):
+    return ACTION_CODES[strategy_table(get_rules()).advise(hand, upcard)]
+
+
+def _request_rules(data):
+    """The table rules with overrides from the request's "rules" object or "decks" (raises ValueError)."""
+    rules = get_rules()
+    if data.get('rules') is not None:
+        rules = RuleSet.from_dict(data['rules'], base=rules)
+    if 'decks' in data:
+        rules = rules.replace(decks=_int_param(data, 'decks', rules.decks, 1, 8))
+    return rules
+
+
+def _settle(game):
+    """Write the finished round to the database and clear it from the table.
+
+    Returns the round's outcome and the outcome of each hand (two after a split).
+    """
+    game_session = GameSession(
+        user_id=current_user.id,
+        doubled_down=game.doubled_down,
+        split_hand=game.split_hand,
+        hand_log=bytes(game.hand_log),
+    )
+    outcomes = settle_game(game, current_user, game_session, get_rules())
+    db.session.add(game_session)
+    db.session.commit()
+
+    game.reset_hand()
+    get_state_store().put(game)
+    return game_session.outcome, outcomes
+
+
+def _split_result(split_hand, dealer_hand, outcomes):
+    """Response fields for a settled round that was split: the split hand, the dealer and each hand's outcome."""
+    if split_hand is None:
+        return {}
+    return {
+        'split_hand': split_hand.to_list(),
+        'split_value': split_hand.value,
+        'dealer_hand': dealer_hand.to_list(),
+        'dealer_value': dealer_hand.value,
+        'outcomes': outcomes,
+    }
+
+
 @main.route('/place-bet', methods=['POST'])
 @login_required
+@idempotent
+@_claims_game
 def place_bet():
     """Allow the player to place a bet for the game."""
     data = request.get_json()
-    print("Received data:", data)  # Debugging line to check incoming data
     bet_amount = data.get('bet')
-    print("Bet amount:", bet_amount)  # Debugging line to check extracted bet amount
 
     # Validate bet amount
     if not isinstance(bet_amount, int) or bet_amount < 10 or bet_amount > 100:
         return jsonify({'error': 'Invalid bet amount. Bet must be between 10 and 100.'}), 400
 
-    # Check if the player has enough bankroll
-    if current_user.bankroll < bet_amount:
-        return jsonify({'error': 'Insufficient bankroll for this bet.'}), 400
+    store = get_state_store()
+    game = store.get(current_user.id) or LiveGame(current_user.id, shoe=Shoe(get_rules().decks))
+    if game.in_progress or game.bet:
+        return jsonify({'error': 'A bet is already in play. Finish the current hand first.'}), 400
 
-    # Deduct bet from user's bankroll and create a new game session
-    current_user.bankroll -= bet_amount
-    game_session = GameSession(user_id=current_user.id, bet=bet_amount, final_bankroll=current_user.bankroll)
-    db.session.add(game_session)
+    # Deduct bet from user's bankroll; the game session is written once the hand is settled
+    try:
+        balance = debit(current_user.id, bet_amount, 'bet')
+    except InsufficientFunds as e:
+        return jsonify({'error': str(e)}), 400
     db.session.commit()
+    game.bet = bet_amount
+    store.put(game)
 
     return jsonify({
         'message': f'Bet of ${bet_amount} placed.',
-        'remaining_bankroll': current_user.bankroll
+        'remaining_bankroll': balance
     })
 
 @main.route('/start-game', methods=['POST'])
 @login_required
+@_claims_game
 def start_game_route():
-    """Start a new game, shuffle deck, deal initial hands."""
-    try:
-        deck, player_hand, dealer_hand, game_session = start_game(current_user, current_user.bankroll)
-        db.session.add(game_session)
-        db.session.commit()
-    except ValueError as e:
-        return jsonify({'error': str(e)}), 400
+    """Start a new game and deal initial hands from the shoe."""
+    store = get_state_store()
+    game = store.get(current_user.id)
+    if game is None or not game.bet:
+        return jsonify({'error': 'Place a bet before starting a game.'}), 400
+    if game.in_progress:
+        return jsonify({'error': 'A hand is already in progress.'}), 400
 
-    # Store deck and hands in game session (can use a database if needed for multiplayer)
-    game_session.deck = deck
-    game_session.player_hand = player_hand
-    game_session.dealer_hand = dealer_hand
-    db.session.commit()
+    start_hand(game, get_rules())
+    if has_natural(game):
+        # The dealer peeks: a blackjack on either side settles the hand on the deal
+        player_hand, dealer_hand = game.player_hand, game.dealer_hand
+        outcome, _ = _settle(game)
+        return jsonify({
+            'message': 'Game started!',
+            'player_hand': player_hand.to_list(),
+            'player_value': player_hand.value,
+            'dealer_hand': dealer_hand.to_list(),
+            'dealer_value': dealer_hand.value,
+            'outcome': outcome,
+            'remaining_bankroll': current_user.bankroll
+        })
+    store.put(game)
 
     return jsonify({
         'message': 'Game started!',
-        'player_hand': player_hand,
-        'dealer_upcard': dealer_hand[0]
+        'player_hand': game.player_hand.to_list(),
+        'dealer_upcard': game.dealer_hand[0],
+        'advice': _advice(game.player_hand, game.dealer_hand[0])
     })
 
 @main.route('/hit', methods=['POST'])
 @login_required
+@idempotent
+@_claims_game
 def hit():
     data = request.get_json()
     hand_type = data.get('hand', 'original')  # Default to original hand if not specified
 
-    game_session = GameSession.query.filter_by(user_id=current_user.id).order_by(GameSession.timestamp.desc()).first()
-    if not game_session:
-        return jsonify({'error': 'No active game session found. Please start a new game.'}), 400
+    game = _active_game()
+    if not game:
+        return jsonify({'error': NO_ACTIVE_GAME}), 400
 
-    # Select the hand to hit
-    hand = game_session.player_hand if hand_type == 'original' else game_session.split_hand
-    hand.append(deal_card(game_session.deck))
-    if hand_type == 'original':
-        game_session.player_hand = hand
-    else:
-        game_session.split_hand = hand
-    db.session.commit()
+    # Select the hand to hit; after a split the original hand plays out first
+    hand = game.player_hand if hand_type == 'original' else game.split_hand
+    if hand is None:
+        return jsonify({'error': 'There is no split hand to hit.'}), 400
+    split_hand, dealer_hand = game.split_hand, game.dealer_hand
+    if split_hand is not None and (hand is split_hand) != first_hand_done(game):
+        return jsonify({'error': f"It is the {'split' if hand is game.player_hand else 'original'} hand's turn."}), 400
+    if split_aces(game):
+        return jsonify({'error': SPLIT_ACES_DONE}), 400
+    apply_action(game, LOG_HIT if hand_type == 'original' else LOG_HIT_SPLIT, get_rules())
 
     if is_bust(hand):
-        return jsonify({
+        # A bust ends the round unless it was the original hand and the split hand is still to play
+        response = {
             'hand_type': hand_type,
-            'hand': hand,
+            'hand': hand.to_list(),
             'outcome': 'bust',
-            'remaining_bankroll': current_user.bankroll
-        })
+        }
+        if split_hand is not None and hand is not split_hand:
+            get_state_store().put(game)
+            response['next_hand'] = 'split'
+        else:
+            _, outcomes = _settle(game)
+            response.update(_split_result(split_hand, dealer_hand, outcomes))
+        response['remaining_bankroll'] = current_user.bankroll
+        return jsonify(response)
 
+    get_state_store().put(game)
     return jsonify({
         'hand_type': hand_type,
-        'hand': hand,
-        'value': calculate_hand_value(hand)
+        'hand': hand.to_list(),
+        'value': hand.value,
+        'advice': _advice(hand, game.dealer_hand[0])
     })
 
 
 @main.route('/stand', methods=['POST'])
 @login_required
+@idempotent
+@_claims_game
 def stand():
-    """Player chooses to stand; let dealer play and determine outcome."""
-    game_session = GameSession.query.filter_by(user_id=current_user.id).order_by(GameSession.timestamp.desc()).first()
-    if not game_session:
-        return jsonify({'error': 'No active game session found. Please start a new game.'}), 400
-
-    # Dealer's turn - dealer hits until reaching 17 or more
-    dealer_hand = game_session.dealer_hand
-    deck = game_session.deck
-    while calculate_hand_value(dealer_hand) < 17:
-        dealer_hand.append(deal_card(deck))
-
-    # Determine outcome
-    outcome = determine_outcome(game_session.player_hand, dealer_hand, current_user, game_session)
-
-    # Update database with final outcome
-    game_session.dealer_hand = dealer_hand
-    game_session.outcome = outcome
-    db.session.commit()
+    """Player chooses to stand; let dealer play and determine outcome.
+
+    After a split, standing on the original hand moves play to the split
+    hand; the dealer plays once the split hand stands too.
+    """
+    game = _active_game()
+    if not game:
+        return jsonify({'error': NO_ACTIVE_GAME}), 400
+
+    player_hand = game.player_hand
+    split_hand = game.split_hand
+    dealer_hand = game.dealer_hand
+    if split_hand is not None and not first_hand_done(game):
+        apply_action(game, LOG_STAND_FIRST, get_rules())
+        get_state_store().put(game)
+        return jsonify({
+            'hand_type': 'original',
+            'hand': player_hand.to_list(),
+            'value': player_hand.value,
+            'next_hand': 'split'
+        })
+
+    apply_action(game, LOG_STAND, get_rules())
+    outcome, outcomes = _settle(game)
 
     return jsonify({
-        'player_hand': game_session.player_hand,
-        'player_value': calculate_hand_value(game_session.player_hand),
-        'dealer_hand': dealer_hand,
-        'dealer_value': calculate_hand_value(dealer_hand),
+        'player_hand': player_hand.to_list(),
+        'player_value': player_hand.value,
+        'dealer_hand': dealer_hand.to_list(),
+        'dealer_value': dealer_hand.value,
         'outcome': outcome,
+        **_split_result(split_hand, dealer_hand, outcomes),
         'remaining_bankroll': current_user.bankroll
     })
 
 @main.route('/double-down', methods=['POST'])
 @login_required
+@idempotent
+@_claims_game
 def double_down():
-    """Double the player's bet and give one card, ending their turn."""
-    game_session = GameSession.query.filter_by(user_id=current_user.id).order_by(GameSession.timestamp.desc()).first()
-    if not game_session or game_session.doubled_down:
-        return jsonify({'error': 'Invalid operation or already doubled down.'}), 400
+    """Double the bet on the hand whose turn it is and give it one card, ending its turn.
 
-    # Double the bet amount and deduct from bankroll
-    game_session.bet *= 2
-    current_user.bankroll -= game_session.bet // 2  # Only deduct the additional bet
-    game_session.doubled_down = True
+    After a split, doubling the original hand moves play to the split hand;
+    doubling the split hand ends the round.
+    """
+    game = _active_game()
+    if not game:
+        return jsonify({'error': 'Invalid operation or already doubled down.'}), 400
+    player_hand = game.player_hand
+    split_hand = game.split_hand
+    dealer_hand = game.dealer_hand
+    playing_split = first_hand_done(game)
+    if not playing_split and game.doubled_down:
+        return jsonify({'error': 'Invalid operation or already doubled down.'}), 400
+    hand = split_hand if playing_split else player_hand
+    if split_aces(game):
+        return jsonify({'error': SPLIT_ACES_DONE}), 400
+    if not get_rules().can_double(hand, after_split=split_hand is not None):
+        return jsonify({'error': 'The table rules do not allow doubling this hand.'}), 400
 
-    # Deal one final card to the player
-    deck = game_session.deck
-    player_hand = game_session.player_hand
-    player_hand.append(deal_card(deck))
-    game_session.player_hand = player_hand
-    db.session.commit()
+    # Deduct the additional bet; each hand's stake is settled from the hand log
+    try:
+        balance = debit(current_user.id, game.bet, 'double')
+    except InsufficientFunds as e:
+        return jsonify({'error': str(e)}), 400
 
-    # Check if the player busts after doubling down
-    if is_bust(player_hand):
+    # Deal one final card to the hand; the dealer only plays out the round if a hand is left standing
+    if split_hand is not None and not playing_split:
+        db.session.commit()
+        apply_action(game, LOG_DOUBLE_FIRST, get_rules())
+        get_state_store().put(game)
+        return jsonify({
+            'hand_type': 'original',
+            'hand': player_hand.to_list(),
+            'value': player_hand.value,
+            'next_hand': 'split',
+            'remaining_bankroll': balance
+        })
+    apply_action(game, LOG_DOUBLE_SPLIT if playing_split else LOG_DOUBLE, get_rules())
+    outcome, outcomes = _settle(game)
+    if split_hand is None and is_bust(player_hand):
         outcome = "bust"
-    else:
-        # If not bust, handle dealer's turn immediately
-        dealer_hand = game_session.dealer_hand
-        while calculate_hand_value(dealer_hand) < 17:
-            dealer_hand.append(deal_card(deck))
-        outcome = determine_outcome(player_hand, dealer_hand, current_user, game_session)
-        game_session.dealer_hand = dealer_hand
-        game_session.outcome = outcome
-
-    db.session.commit()
 
     return jsonify({
-        'player_hand': player_hand,
-        'player_value': calculate_hand_value(player_hand),
-        'dealer_hand': game_session.dealer_hand,
-        'dealer_value': calculate_hand_value(game_session.dealer_hand),
+        'player_hand': player_hand.to_list(),
+        'player_value': player_hand.value,
+        'dealer_hand': dealer_hand.to_list(),
+        'dealer_value': dealer_hand.value,
         'outcome': outcome,
+        **_split_result(split_hand, dealer_hand, outcomes),
         'remaining_bankroll': current_user.bankroll
     })
 
 
 @main.route('/split', methods=['POST'])
 @login_required
+@idempotent
+@_claims_game
 def split():
     """Split the player's hand into two separate hands if possible."""
-    game_session = GameSession.query.filter_by(user_id=current_user.id).order_by(GameSession.timestamp.desc()).first()
-    if not game_session or game_session.split_hand:
+    game = _active_game()
+    if not game or game.split_hand:
         return jsonify({'error': 'Invalid operation or hand already split.'}), 400
 
-    player_hand = game_session.player_hand
-    if len(player_hand) != 2 or player_hand[0] != player_hand[1]:
-        return jsonify({'error': 'Cannot split. Cards must be identical.'}), 400
+    player_hand = game.player_hand
+    if not player_hand.is_pair:
+        return jsonify({'error': 'Cannot split. Cards must have the same value.'}), 400
+    if not get_rules().can_split(player_hand, 0):
+        return jsonify({'error': 'The table rules do not allow splitting.'}), 400
 
-    # Split the hand into two and deduct an additional bet
-    game_session.split_hand = [player_hand.pop()]  # The second hand starts with one of the pair
-    current_user.bankroll -= game_session.bet
+    # Deduct an additional bet and split the hand into two
+    try:
+        balance = debit(current_user.id, game.bet, 'split')
+    except InsufficientFunds as e:
+        return jsonify({'error': str(e)}), 400
     db.session.commit()
+    apply_action(game, LOG_SPLIT)  # Each hand keeps one of the pair and gets a second card
+    get_state_store().put(game)
+
+    return jsonify({
+        'original_hand': player_hand.to_list(),
+        'split_hand': game.split_hand.to_list(),
+        'remaining_bankroll': balance
+    })
+
+
+@main.route('/surrender', methods=['POST'])
+@login_required
+@idempotent
+@_claims_game
+def surrender():
+    """Give up the hand before taking any card for half the bet back, where the table allows it."""
+    game = _active_game()
+    if not game:
+        return jsonify({'error': NO_ACTIVE_GAME}), 400
+    if game.doubled_down or not get_rules().can_surrender(game.player_hand, split=game.split_hand is not None):
+        return jsonify({'error': 'Surrender is not allowed now.'}), 400
+
+    player_hand = game.player_hand
+    dealer_hand = game.dealer_hand
+    apply_action(game, LOG_SURRENDER)
+    outcome, _ = _settle(game)
 
     return jsonify({
-        'original_hand': player_hand,
-        'split_hand': game_session.split_hand,
+        'player_hand': player_hand.to_list(),
+        'dealer_hand': dealer_hand.to_list(),
+        'outcome': outcome,
         'remaining_bankroll': current_user.bankroll
     })
+
+
+@main.route('/rules', methods=['GET'])
+def table_rules():
+    """The table rules with their house edge and dealer outcome probabilities."""
+    return jsonify(summary(get_rules()))
+
+
+@main.route('/autoplay', methods=['POST'])
+@login_required
+@idempotent
+@_claims_game
+def autoplay():
+    """Play a batch of hands server-side by a strategy and settle them in one transaction."""
+    data = request.get_json() or {}
+    hands = data.get('hands')
+    if not isinstance(hands, int) or not 1 <= hands <= MAX_AUTOPLAY_HANDS:
+        return jsonify({'error': f'hands must be between 1 and {MAX_AUTOPLAY_HANDS}.'}), 400
+
+    # A single bet or a schedule of bets that repeats
+    bets = data.get('bets', [data.get('bet', 10)])
+    if not isinstance(bets, list) or not bets or \
+            any(not isinstance(bet, int) or bet < 10 or bet > 100 for bet in bets):
+        return jsonify({'error': 'Invalid bet schedule. Bets must be between 10 and 100.'}), 400
+
+    # Built-in basic strategy, or a submitted table of rows overriding it
+    rules = get_rules()
+    policy = data.get('policy', 'basic_strategy')
+    if policy == 'basic_strategy':
+        table = strategy_table(rules)
+    elif isinstance(policy, dict):
+        try:
+            table = StrategyTable.from_rows(policy, base=strategy_table(rules))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    else:
+        return jsonify({'error': 'policy must be "basic_strategy" or a strategy table.'}), 400
+
+    game = get_state_store().get(current_user.id)
+    if game is not None and (game.in_progress or game.bet):
+        return jsonify({'error': 'A bet is already in play. Finish the current hand first.'}), 400
+
+    started = time.perf_counter()
+    results = auto_play_session(current_user.bankroll, bets, hands, table, Shoe(rules.decks), rules)
+    record_simulation('autoplay', len(results), time.perf_counter() - started)
+
+    # All bankroll changes and game sessions land in one transaction
+    if results:
+        net = sum(result['net'] for result in results)
+        try:
+            balance = post(current_user.id, net, 'autoplay')
+        except InsufficientFunds:
+            db.session.rollback()
+            return jsonify({'error': 'Bankroll changed during autoplay. Please try again.'}), 409
+        # Other requests may have moved the bankroll while the hands were played
+        offset = balance - results[-1]['bankroll']
+        UserStats.add_hands(current_user.id, ((result['outcome'], result['bet'], result['net']) for result in results))
+        db.session.execute(insert(GameSession), [{
+            'user_id': current_user.id,
+            'outcome': result['outcome'],
+            'bet': result['bet'],
+            'final_bankroll': result['bankroll'] + offset,
+            'doubled_down': result['doubled_down'],
+            'split_hand': result['player_hands'][1] if len(result['player_hands']) > 1 else None,
+        } for result in results])
+        db.session.commit()
+
+    response = {
+        'hands_played': len(results),
+        'wins': sum(result['outcome'] == 'win' for result in results),
+        'losses': sum(result['outcome'] == 'lose' for result in results),
+        'ties': sum(result['outcome'] == 'tie' for result in results),
+        'total_wagered': sum(result['bet'] for result in results),
+        'net': sum(result['net'] for result in results),
+        'remaining_bankroll': current_user.bankroll
+    }
+    if data.get('detail'):
+        response['hands'] = [{
+            'player_hands': [hand.to_list() for hand in result['player_hands']],
+            'dealer_hand': result['dealer_hand'].to_list(),
+            'outcomes': result['outcomes'],
+            'bet': result['bet'],
+            'net': result['net'],
+            'bankroll': result['bankroll']
+        } for result in results]
+    return jsonify(response)
+
+
+def _int_param(data, name, default, low, high):
+    value = data.get(name, default)
+    if not isinstance(value, int) or isinstance(value, bool) or not low <= value <= high:
+        raise ValueError(f'{name} must be an integer between {low} and {high}.')
+    return value
+
+
+def _owned_job(job_id):
+    job = current_app.extensions['sim_jobs'].get(job_id)
+    if job is None or job.user_id != current_user.id:
+        return None
+    return job
+
+
+@main.route('/simulations', methods=['POST'])
+@login_required
+def submit_simulation():
+    """Queue a background simulation job and return its id."""
+    data = request.get_json() or {}
+    try:
+        job = SimulationJob(
+            user_id=current_user.id,
+            hands=_int_param(data, 'hands', 1_000_000, 1, MAX_JOB_HANDS),
+            seed=_int_param(data, 'seed', secrets.randbits(63), 0, 2**63 - 1),
+            rules=_request_rules(data),
+            report_every=_int_param(data, 'report_every', 100_000, 10_000, MAX_JOB_HANDS),
+            players=_int_param(data, 'players', 100, 1, MAX_PLAYERS),
+            bankroll=_int_param(data, 'bankroll', 1000, 1, 10**9),
+            bet=_int_param(data, 'bet', 10, 1, 10**6),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Optionally stop as soon as the 95% confidence half-width is this tight
+    target_ci = data.get('target_ci')
+    if target_ci is not None:
+        if not isinstance(target_ci, (int, float)) or target_ci <= 0:
+            return jsonify({'error': 'target_ci must be a positive number.'}), 400
+        job.target_ci = float(target_ci)
+
+    try:
+        current_app.extensions['sim_jobs'].submit(job)
+    except (TooManyJobs, JobsOverloaded) as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = str(JOB_RETRY_AFTER)
+        return response, 429 if isinstance(e, TooManyJobs) else 503
+    return jsonify({'id': job.id, 'seed': job.seed, 'status': job.status}), 202
+
+
+@main.route('/risk-of-ruin', methods=['POST'])
+@login_required
+def risk_of_ruin():
+    """Risk of ruin and bankroll percentile bands for flat-bet basic strategy under the table rules."""
+    data = request.get_json() or {}
+    try:
+        hands = _int_param(data, 'hands', 10_000, 1, MAX_RISK_HANDS)
+        paths = _int_param(data, 'paths', 10_000, 1, MAX_RISK_PATHS)
+        bankroll = _int_param(data, 'bankroll', current_user.bankroll, 1, 10**9)
+        bet = _int_param(data, 'bet', 10, 1, bankroll)
+        rules = _request_rules(data)
+        seed = _int_param(data, 'seed', secrets.randbits(63), 0, 2**63 - 1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if hands * paths > MAX_RISK_CELLS:
+        return jsonify({'error': f'hands x paths must be at most {MAX_RISK_CELLS}.'}), 400
+
+    report = analyze_bankroll(basic_strategy_distribution(rules), bankroll, bet, hands, paths, seed=seed)
+    report['seed'] = seed
+    report['rules'] = rules.label
+    return jsonify(report)
+
+
+@main.route('/simulations/<job_id>', methods=['GET'])
+@login_required
+def simulation_status(job_id):
+    job = _owned_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Simulation not found.'}), 404
+    return jsonify(job.snapshot)
+
+
+@main.route('/simulations/<job_id>/events', methods=['GET'])
+@login_required
+def simulation_events(job_id):
+    """Stream progress snapshots as Server-Sent Events until the job finishes."""
+    job = _owned_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Simulation not found.'}), 404
+
+    def stream():
+        seen = -1
+        while True:
+            version, snapshot = job.wait_for_update(seen, timeout=15)
+            if version == seen:
+                yield ': keep-alive\n\n'
+                continue
+            seen = version
+            yield f"event: progress\ndata: {json.dumps(snapshot)}\n\n"
+            if snapshot['status'] not in ('queued', 'running'):
+                yield f"event: end\ndata: {json.dumps({'status': snapshot['status']})}\n\n"
+                return
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@main.route('/simulations/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_simulation(job_id):
+    job = _owned_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Simulation not found.'}), 404
+    job.cancel()
+    return jsonify({'id': job.id, 'status': job.status}), 202
+
+
+@main.route('/stats', methods=['GET'])
+@login_required
+def stats():
+    """Return the current user's running totals."""
+    user_stats = db.session.get(UserStats, current_user.id) or UserStats(**UserStats.ZERO)
+    data = user_stats.to_dict()
+    data['username'] = current_user.username
+    data['bankroll'] = current_user.bankroll
+    return jsonify(data)
+
+
+@main.route('/leaderboard', methods=['GET'])
+def leaderboard():
+    """Top players by net result, read from the indexed stats table."""
+    limit = request.args.get('limit', 10, type=int)
+    limit = max(1, min(limit, 100))
+    rows = db.session.execute(
+        db.select(User.username, UserStats.net_result, UserStats.hands_played, UserStats.biggest_win)
+        .join(User, User.id == UserStats.user_id)
+        .order_by(UserStats.net_result.desc())
+        .limit(limit)
+    ).all()
+    return jsonify([{
+        'rank': rank,
+        'username': username,
+        'net_result': net_result,
+        'hands_played': hands_played,
+        'biggest_win': biggest_win
+    } for rank, (username, net_result, hands_played, biggest_win) in enumerate(rows, start=1)])
+
+
+@main.route('/history', methods=['GET'])
+@login_required
+def history():
+    """One page of the user's hands, newest first; pass next_cursor back as cursor."""
+    limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+    cursor = request.args.get('cursor')
+    try:
+        before = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor.'}), 400
+
+    items, next_cursor = history_page(current_user.id, limit, before)
+    return jsonify({'items': items, 'next_cursor': next_cursor})
+
+
+@main.route('/history/export', methods=['GET'])
+@login_required
+def export_history():
+    """Stream the user's full history as NDJSON (default) or CSV."""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format == 'ndjson':
+        rows, mimetype = export_ndjson(current_user.id), 'application/x-ndjson'
+    elif export_format == 'csv':
+        rows, mimetype = export_csv(current_user.id), 'text/csv'
+    else:
+        return jsonify({'error': 'format must be ndjson or csv.'}), 400
+
+    return Response(stream_with_context(rows), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=history.{export_format}'
+    })
+
+
+@main.route('/history/<int:session_id>/replay', methods=['GET'])
+@login_required
+def replay_history_hand(session_id):
+    """Re-deal a finished hand from its log, card for card; a table hand comes back on its own.
+
+    The shoe seed stays server-side: it would reveal the rest of a shoe that may still be in play.
+    """
+    game_session = find_session(session_id)
+    if game_session is None or game_session.user_id != current_user.id:
+        return jsonify({'error': 'Hand not found.'}), 404
+    if game_session.hand_log is None:
+        return jsonify({'error': 'This hand has no replay log.'}), 404
+
+    log = game_session.hand_log
+    game = replay_table_hand(log) if is_table_log(log) else replay_hand(log)
+    return jsonify({
+        'id': game_session.id,
+        'player_hand': game.player_hand.to_list(),
+        'split_hand': game.split_hand.to_list() if game.split_hand is not None else None,
+        'dealer_hand': game.dealer_hand.to_list(),
+        'doubled_down': game.doubled_down,
+        'outcome': game_session.outcome,
+    })
@@ -0,0 +1,246 @@
+"""Table rules as one object, and the tables derived from them.
+
+A RuleSet is immutable and hashable, so everything derived from it (strategy
+table, dealer probabilities, house edge) is computed once per rule set and
+kept in a bounded LRU cache. Hosting many table configurations costs one
+precomputation each, not per-hand work. Rules also have a short text form,
+e.g. "6D H17 3:2 DAS LS SP3 D9-11", used by the TABLE_RULES setting and the CLI.
+"""
+from fractions import Fraction
+from functools import lru_cache
+
+from flask import current_app
+
+from . import probability
+from .cards import ONE_DECK_VALUE_COUNTS, VALUE_LABELS
+from .strategy import expected_return, get_strategy_table
+
+# Derived tables kept per rule set, most recently used first
+RULES_CACHE_SIZE = 32
+MAX_DECKS = 8
+MAX_SPLITS = 3
+
+
+class RuleSet:
+    """Decks, dealer rule, blackjack payout, DAS, late surrender, split limit and double restriction.
+
+    max_splits is how many times a round may be split (0 disables splitting).
+    double_on is the (low, high) range of two-card totals that may be doubled,
+    or None for any two cards. The dealer always peeks for blackjack.
+    """
+
+    __slots__ = ('decks', 'dealer_hits_soft_17', 'blackjack_payout', 'double_after_split', 'surrender',
+                 'max_splits', 'double_on')
+
+    def __init__(self, decks=6, dealer_hits_soft_17=False, blackjack_payout=1.5, double_after_split=True,
+                 surrender=False, max_splits=1, double_on=None):
+        if not isinstance(decks, int) or not 1 <= decks <= MAX_DECKS:
+            raise ValueError(f"decks must be between 1 and {MAX_DECKS}.")
+        if not isinstance(blackjack_payout, (int, float)) or not 1 <= blackjack_payout <= 2:
+            raise ValueError("blackjack_payout must be between 1 and 2.")
+        if not isinstance(max_splits, int) or not 0 <= max_splits <= MAX_SPLITS:
+            raise ValueError(f"max_splits must be between 0 and {MAX_SPLITS}.")
+        if double_on is not None:
+            double_on = tuple(double_on)
+            if len(double_on) != 2 or not all(isinstance(total, int) for total in double_on) \
+                    or not 4 <= double_on[0] <= double_on[1] <= 21:
+                raise ValueError("double_on must be a [low, high] range of totals between 4 and 21, or null.")
+        values = (decks, bool(dealer_hits_soft_17), float(blackjack_payout), bool(double_after_split),
+                  bool(surrender), max_splits, double_on)
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RuleSet is immutable; use replace().")
+
+    @property
+    def key(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        if isinstance(other, RuleSet):
+            return self.key == other.key
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __reduce__(self):
+        return (RuleSet, self.key)
+
+    def __repr__(self):
+        return f"<RuleSet {self.label}>"
+
+    def replace(self, **changes):
+        """Return a copy with some rules changed."""
+        return RuleSet(**{**self.to_dict(), **changes})
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data, base=None):
+        """Build from a JSON object; rules it leaves out come from base (the defaults if None)."""
+        if not isinstance(data, dict) or set(data) - set(cls.__slots__):
+            raise ValueError(f"rules must be an object with keys among {', '.join(cls.__slots__)}.")
+        for name, value in data.items():
+            if name in ('dealer_hits_soft_17', 'double_after_split', 'surrender') and not isinstance(value, bool):
+                raise ValueError(f"{name} must be true or false.")
+        return (base or DEFAULT_RULES).replace(**data)
+
+    @property
+    def label(self):
+        payout = Fraction(self.blackjack_payout).limit_denominator(10)
+        parts = [
+            f"{self.decks}D",
+            'H17' if self.dealer_hits_soft_17 else 'S17',
+            f"{payout.numerator}:{payout.denominator}",
+            'DAS' if self.double_after_split else 'NDAS',
+            'LS' if self.surrender else 'NS',
+            f"SP{self.max_splits}",
+            'DA' if self.double_on is None else 'D{}-{}'.format(*self.double_on),
+        ]
+        return ' '.join(parts)
+
+    @classmethod
+    def parse(cls, text, base=None):
+        """Build from the label form; tokens may come in any order and missing ones keep base's rules."""
+        changes = {}
+        for token in text.upper().replace(',', ' ').split():
+            try:
+                if token in ('H17', 'S17'):
+                    changes['dealer_hits_soft_17'] = token == 'H17'
+                elif token in ('DAS', 'NDAS'):
+                    changes['double_after_split'] = token == 'DAS'
+                elif token in ('LS', 'NS'):
+                    changes['surrender'] = token == 'LS'
+                elif token == 'DA':
+                    changes['double_on'] = None
+                elif token.endswith('D') and token[:-1].isdigit():
+                    changes['decks'] = int(token[:-1])
+                elif token.startswith('SP'):
+                    changes['max_splits'] = int(token[2:])
+                elif token.startswith('D') and '-' in token:
+                    changes['double_on'] = tuple(int(total) for total in token[1:].split('-'))
+                elif ':' in token:
+                    numerator, denominator = token.split(':')
+                    changes['blackjack_payout'] = int(numerator) / int(denominator)
+                else:
+                    raise ValueError
+            except (ValueError, ZeroDivisionError):
+                raise ValueError(f"Unknown table rule {token!r}.") from None
+        return (base or DEFAULT_RULES).replace(**changes)
+
+    # Rule checks used by the game engines
+
+    def dealer_hits(self, hand):
+        """True while the dealer must draw to hand."""
+        value = hand.value
+        return value < 17 or (value == 17 and self.dealer_hits_soft_17 and hand.soft)
+
+    def can_double(self, hand, after_split=False):
+        if len(hand) != 2 or (after_split and not self.double_after_split):
+            return False
+        return self.double_on is None or self.double_on[0] <= hand.value <= self.double_on[1]
+
+    def can_split(self, hand, splits):
+        """True if hand may be split when the round has already been split splits times."""
+        return hand.is_pair and splits < self.max_splits
+
+    def can_surrender(self, hand, split=False):
+        return self.surrender and len(hand) == 2 and not split
+
+    def blackjack_pays(self, bet):
+        """Winnings on a blackjack for a whole-unit bet, rounded down as at the table."""
+        return int(bet * self.blackjack_payout)
+
+    def settle(self, outcome, bet):
+        """Net result of a finished hand with outcome win/blackjack/tie/surrender/lose."""
+        if outcome == "win":
+            return bet
+        if outcome == "blackjack":
+            return self.blackjack_pays(bet)
+        if outcome == "tie":
+            return 0
+        if outcome == "surrender":
+            return -(bet - bet // 2)  # Half the bet back, rounded down
+        return -bet
+
+    @property
+    def strategy_options(self):
+        """Keyword arguments for strategy.get_strategy_table."""
+        return {
+            'dealer_hits_soft_17': self.dealer_hits_soft_17,
+            'double_after_split': self.double_after_split,
+            'surrender': self.surrender,
+            'double_on': self.double_on,
+            'max_splits': self.max_splits,
+        }
+
+
+DEFAULT_RULES = RuleSet()
+
+
+@lru_cache(maxsize=RULES_CACHE_SIZE)
+def strategy_table(rules):
+    """The optimal strategy table for rules."""
+    return get_strategy_table(**rules.strategy_options)
+
+
+@lru_cache(maxsize=RULES_CACHE_SIZE)
+def simulation_policy(rules):
+    """strategy_table(rules) as a vectorized-simulation policy table (see simulation.simulate)."""
+    policy = strategy_table(rules).to_policy()
+    policy.flags.writeable = False  # Shared by every caller
+    return policy
+
+
+@lru_cache(maxsize=RULES_CACHE_SIZE)
+def simulation_splits(rules):
+    """The pairs strategy_table(rules) splits, as a vectorized-simulation split table."""
+    splits = strategy_table(rules).to_split_policy()
+    splits.flags.writeable = False
+    return splits
+
+
+@lru_cache(maxsize=RULES_CACHE_SIZE)
+def dealer_probabilities(rules):
+    """Exact dealer final-total probabilities off a full shoe, per upcard value (ace first).
+
+    Each row is ordered as probability.OUTCOMES and assumes the dealer has
+    already peeked and does not have blackjack.
+    """
+    full = tuple(count * rules.decks for count in ONE_DECK_VALUE_COUNTS)
+    rows = []
+    for upcard in range(1, 11):
+        counts = full[:upcard - 1] + (full[upcard - 1] - 1,) + full[upcard:]
+        rows.append(probability.dealer_probabilities(counts, upcard, rules.dealer_hits_soft_17))
+    return tuple(rows)
+
+
+@lru_cache(maxsize=RULES_CACHE_SIZE)
+def house_edge(rules):
+    """Casino advantage per initial bet against optimal basic strategy (infinite-deck)."""
+    return -expected_return(blackjack_payout=rules.blackjack_payout, **rules.strategy_options)
+
+
+def summary(rules):
+    """JSON-ready description of a rule set and its derived numbers."""
+    return {
+        'label': rules.label,
+        'rules': rules.to_dict(),
+        'house_edge': house_edge(rules),
+        'dealer_probabilities': {
+            upcard: dict(zip(map(str, probability.OUTCOMES), row))
+            for upcard, row in zip(VALUE_LABELS, dealer_probabilities(rules))
+        },
+    }
+
+
+def create_rules(config):
+    """The table rules from the TABLE_RULES setting (defaults for anything it leaves out)."""
+    return RuleSet.parse(config.get('TABLE_RULES') or '')
+
+
+def get_rules():
+    return current_app.extensions['rules']
@@ -0,0 +1,127 @@
+"""Multi-deck shoe dealt by index and reshuffled at the cut card."""
+import random
+import secrets
+
+from .cards import POINTS, RANKS
+
+DEFAULT_DECKS = 6
+DEFAULT_PENETRATION = 0.75
+
+
+class Shoe:
+    """A pre-shuffled shoe of rank codes.
+
+    Dealing advances an index, so it is O(1) and allocates nothing. Remaining
+    counts per rank are kept current for counting and exact-EV features. The
+    shoe is only reshuffled between rounds, once the cut card (penetration) has
+    been reached.
+
+    Every shuffle starts from the same sorted order and is driven by its own
+    63-bit seed, so (decks, seed, position) pins down every card still to come
+    and a hand can be replayed from them (see game_logic.replay_hand). Seeds
+    come from the OS unless the shoe itself was built with a seed, which makes
+    the whole sequence of shuffles reproducible.
+    """
+
+    def __init__(self, decks=DEFAULT_DECKS, penetration=DEFAULT_PENETRATION, seed=None):
+        if decks < 1 or not 0 < penetration <= 1:
+            raise ValueError("A shoe needs at least one deck and a penetration in (0, 1].")
+        self.decks = decks
+        self.penetration = penetration
+        self.rng = random.Random(seed) if seed is not None else None
+        self.cards = bytearray(4 * decks * len(RANKS))
+        self.cut_card = int(len(self.cards) * penetration)
+        self.shuffles = 0
+        self.shuffle()
+
+    @classmethod
+    def from_state(cls, decks, cut_card, cards, position, seed=0):
+        """Rebuild a shoe part-way through, e.g. after decoding it from storage."""
+        shoe = cls.__new__(cls)
+        shoe.decks = decks
+        shoe.cards = bytearray(cards)
+        shoe.cut_card = cut_card
+        shoe.penetration = cut_card / len(shoe.cards)
+        shoe.rng = None
+        shoe.seed = seed
+        shoe.shuffles = 1
+        shoe.position = position
+        dealt = shoe.cards[:position]
+        shoe.counts = [4 * decks - dealt.count(code) for code in range(len(RANKS))]
+        return shoe
+
+    @classmethod
+    def from_seed(cls, decks, seed, position=0, penetration=DEFAULT_PENETRATION):
+        """Rebuild the shoe shuffled with seed, with position cards already dealt."""
+        shoe = cls.__new__(cls)
+        shoe.decks = decks
+        shoe.penetration = penetration
+        shoe.rng = None
+        shoe.cards = bytearray(4 * decks * len(RANKS))
+        shoe.cut_card = int(len(shoe.cards) * penetration)
+        shoe.shuffles = 0
+        shoe.shuffle(seed)
+        for code in shoe.cards[:position]:
+            shoe.counts[code] -= 1
+        shoe.position = position
+        return shoe
+
+    def _next_seed(self):
+        if self.rng is not None:
+            return self.rng.getrandbits(63)
+        return secrets.randbits(63)
+
+    def shuffle(self, seed=None):
+        """Return every card to the shoe and shuffle, with a fresh seed unless one is given."""
+        self.seed = self._next_seed() if seed is None else seed
+        cards_per_rank = 4 * self.decks
+        for code in range(len(RANKS)):
+            self.cards[code * cards_per_rank:(code + 1) * cards_per_rank] = bytes([code]) * cards_per_rank
+        random.Random(self.seed).shuffle(self.cards)
+        self.position = 0
+        self.counts = [cards_per_rank] * len(RANKS)
+        self.shuffles += 1
+
+    @property
+    def needs_shuffle(self):
+        return self.position >= self.cut_card
+
+    def reshuffle_if_needed(self):
+        """Shuffle if the cut card has come out; call between rounds. Returns True on a shuffle."""
+        if self.needs_shuffle:
+            self.shuffle()
+            return True
+        return False
+
+    def deal_code(self):
+        """Deal the next card as a rank code."""
+        if self.position >= len(self.cards):
+            # Only reachable with a very deep cut card; finish the round on a fresh shoe whose
+            # seed follows from the current one, so replaying the hand deals the same cards
+            self.shuffle(random.Random(self.seed).getrandbits(63))
+        code = self.cards[self.position]
+        self.position += 1
+        self.counts[code] -= 1
+        return code
+
+    def deal(self):
+        """Deal the next card as a rank string."""
+        return RANKS[self.deal_code()]
+
+    @property
+    def remaining(self):
+        return len(self.cards) - self.position
+
+    @property
+    def decks_remaining(self):
+        return self.remaining / 52
+
+    def value_counts(self):
+        """Remaining cards per point value (ace first), as used by probability.py."""
+        counts = [0] * 10
+        for code, count in enumerate(self.counts):
+            counts[POINTS[code] - 1] += count
+        return tuple(counts)
+
+    def __len__(self):
+        return self.remaining
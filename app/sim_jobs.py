@@ -0,0 +1,211 @@
+"""Background simulation jobs with incremental progress for streaming to clients.
+
+A job runs on one of a few driver threads that feed chunks to a shared
+process pool and merge the results in order (see sim_runner). After every
+report_every hands it publishes a progress snapshot; readers block on the
+job's condition until a newer snapshot exists. Jobs can be cancelled between
+chunks.
+
+At most max_running jobs run at once and the rest wait their turn. A user
+may have max_per_user jobs queued or running and the server max_pending in
+all; past either limit submit raises TooManyJobs or JobsOverloaded and the
+caller answers 429 or 503 with Retry-After.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from .metrics import record_simulation
+from .rules import DEFAULT_RULES
+from .sim_runner import CHUNK_HANDS, iter_chunk_results
+from .simulation import SimulationResult
+
+MAX_JOB_HANDS = 100_000_000
+MAX_PLAYERS = 10_000
+PERCENTILES = (5, 25, 50, 75, 95)
+# Finished jobs kept around for late readers
+KEEP_FINISHED = 100
+DEFAULT_MAX_RUNNING = 2
+DEFAULT_MAX_PENDING = 16
+DEFAULT_MAX_PER_USER = 2
+
+QUEUED, RUNNING, DONE, CANCELLED, FAILED = 'queued', 'running', 'done', 'cancelled', 'failed'
+
+
+class TooManyJobs(Exception):
+    """Raised when a user already has their limit of unfinished jobs."""
+
+
+class JobsOverloaded(Exception):
+    """Raised when the server already holds its limit of unfinished jobs."""
+
+
+class SimulationJob:
+    """One simulation run and its latest progress snapshot."""
+
+    def __init__(self, user_id, hands, seed, rules=DEFAULT_RULES, report_every=100_000, players=100, bankroll=1000, bet=10,
+                 target_ci=None):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.hands = hands
+        self.seed = seed
+        self.rules = rules
+        self.report_every = report_every
+        self.players = players
+        self.bankroll = bankroll
+        self.bet = bet
+        self.target_ci = target_ci
+        self.status = QUEUED
+        self.error = None
+        self.result = SimulationResult(players)
+        self.version = 0
+        self.snapshot = self._snapshot()
+        self._cancel = threading.Event()
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in (DONE, CANCELLED, FAILED)
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def _snapshot(self):
+        result = self.result
+        low, high = result.confidence_interval()
+        snapshot = {
+            'id': self.id,
+            'rules': self.rules.label,
+            'status': self.status,
+            'hands_played': result.hands,
+            'hands_total': self.hands,
+            'ev': result.ev,
+            'ci95': [low, high],
+            'wins': result.wins,
+            'losses': result.losses,
+            'ties': result.ties,
+        }
+        if result.hands and len(result.player_net):
+            bankrolls = self.bankroll + result.player_net * self.bet
+            snapshot['bankroll_percentiles'] = {
+                f"p{p}": float(value) for p, value in zip(PERCENTILES, np.percentile(bankrolls, PERCENTILES))
+            }
+        if self.error:
+            snapshot['error'] = self.error
+        return snapshot
+
+    def publish(self, status=None):
+        with self._changed:
+            if status is not None:
+                self.status = status
+            self.snapshot = self._snapshot()
+            self.version += 1
+            self._changed.notify_all()
+
+    def wait_for_update(self, seen_version, timeout=None):
+        """Block until a snapshot newer than seen_version exists; returns (version, snapshot)."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version > seen_version or self.finished, timeout)
+            return self.version, self.snapshot
+
+    def ci_reached(self):
+        if self.target_ci is None or self.result.hands < 2:
+            return False
+        low, high = self.result.confidence_interval()
+        return (high - low) / 2 <= self.target_ci
+
+
+class SimulationJobManager:
+    """Runs jobs on a bounded set of driver threads over a shared, lazily created process pool."""
+
+    def __init__(self, workers=None, max_running=DEFAULT_MAX_RUNNING, max_pending=DEFAULT_MAX_PENDING,
+                 max_per_user=DEFAULT_MAX_PER_USER):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.max_per_user = max_per_user
+        self._pool = None
+        self._drivers = ThreadPoolExecutor(max_workers=max_running, thread_name_prefix='simulation')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def submit(self, job):
+        """Queue a job; raises TooManyJobs or JobsOverloaded past the per-user or server limit."""
+        with self._lock:
+            unfinished = [other for other in self._jobs.values() if not other.finished]
+            if sum(other.user_id == job.user_id for other in unfinished) >= self.max_per_user:
+                raise TooManyJobs(f"At most {self.max_per_user} simulations may be queued or running at once.")
+            if len(unfinished) >= self.max_pending:
+                raise JobsOverloaded("Too many simulations queued.")
+            self._jobs[job.id] = job
+            self._trim()
+        self._drivers.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - KEEP_FINISHED)]:
+            del self._jobs[job_id]
+
+    def _run(self, job):
+        if job.cancelled:
+            job.publish(CANCELLED)  # Cancelled while waiting for a driver
+            return
+        job.publish(RUNNING)
+        chunk_hands = min(CHUNK_HANDS, job.report_every)
+        next_report = job.report_every
+        try:
+            chunks = iter_chunk_results(
+                self._get_pool(), job.hands, job.seed, chunk_hands,
+                options={'rules': job.rules, 'players': job.players},
+                max_in_flight=2 * self.workers,
+                cancelled=lambda: job.cancelled or job.ci_reached(),
+            )
+            last = time.perf_counter()
+            for result in chunks:
+                now = time.perf_counter()
+                record_simulation('job', result.hands, now - last)
+                last = now
+                job.result.merge(result)
+                if job.result.hands >= next_report:
+                    next_report += job.report_every
+                    job.publish()
+        except Exception as e:
+            job.error = str(e)
+            job.publish(FAILED)
+            return
+        job.publish(CANCELLED if job.cancelled else DONE)
+
+    def shutdown(self):
+        for job in list(self._jobs.values()):
+            job.cancel()
+        self._drivers.shutdown(wait=False, cancel_futures=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def create_job_manager(config):
+    return SimulationJobManager(
+        config.get('SIMULATION_WORKERS'),
+        max_running=int(config.get('SIMULATION_MAX_RUNNING') or DEFAULT_MAX_RUNNING),
+        max_pending=int(config.get('SIMULATION_MAX_PENDING') or DEFAULT_MAX_PENDING),
+        max_per_user=int(config.get('SIMULATION_MAX_PER_USER') or DEFAULT_MAX_PER_USER),
+    )
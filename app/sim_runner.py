@@ -0,0 +1,95 @@
+"""Fan simulation batches out over a process pool with reproducible RNG streams.
+
+Work is cut into fixed-size chunks and chunk i always draws from child i of
+the run's SeedSequence, so the hands played depend only on the seed and the
+chunk size. Partial tallies are merged in chunk order as they arrive, which
+keeps the aggregate bit-identical whatever the number of workers.
+"""
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from .simulation import SimulationResult, simulate
+
+CHUNK_HANDS = 100_000
+
+
+def _chunk_sizes(n_hands, chunk_hands):
+    full, rest = divmod(n_hands, chunk_hands)
+    return [chunk_hands] * full + ([rest] if rest else [])
+
+
+def _run_chunk(size, seed_sequence, options, first_hand):
+    return simulate(size, rng=np.random.default_rng(seed_sequence), batch_size=size, first_hand=first_hand,
+                    **options)
+
+
+def iter_chunk_results(pool, n_hands, seed, chunk_hands=CHUNK_HANDS, options=None, max_in_flight=None,
+                       cancelled=None, runner=None):
+    """Yield each chunk's SimulationResult in chunk order.
+
+    Chunks are submitted to pool (None runs them in this process), keeping at
+    most max_in_flight outstanding. Stops submitting once cancelled() is true.
+    runner(size, seed_sequence, options, first_hand) plays one chunk, whose
+    hands are numbered from first_hand in the whole run; it must be a
+    module-level function so the pool can pickle it (simulate by default).
+    """
+    options = options or {}
+    runner = runner or _run_chunk
+    sizes = _chunk_sizes(n_hands, chunk_hands)
+    starts = [index * chunk_hands for index in range(len(sizes))]
+    streams = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    if pool is None:
+        for size, stream, start in zip(sizes, streams, starts):
+            if cancelled is not None and cancelled():
+                return
+            yield runner(size, stream, options, start)
+        return
+
+    if max_in_flight is None:
+        max_in_flight = len(sizes)
+    # Hold back chunks that finish early so results come out in index order
+    futures = {}
+    pending = {}
+    next_submit = 0
+    next_chunk = 0
+    try:
+        while next_chunk < len(sizes):
+            while (next_submit < len(sizes) and len(futures) + len(pending) < max_in_flight
+                   and not (cancelled is not None and cancelled())):
+                future = pool.submit(runner, sizes[next_submit], streams[next_submit], options, starts[next_submit])
+                futures[future] = next_submit
+                next_submit += 1
+            if not futures:
+                return
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending[futures.pop(future)] = future.result()
+            while next_chunk in pending:
+                yield pending.pop(next_chunk)
+                next_chunk += 1
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def run_simulation(n_hands, seed, workers=None, chunk_hands=CHUNK_HANDS, **options):
+    """Simulate n_hands across worker processes and return the merged SimulationResult.
+
+    options are passed through to simulation.simulate (decks, policy, ...).
+    workers=1 runs every chunk in this process.
+    """
+    total = SimulationResult()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1 or n_hands <= chunk_hands:
+        for result in iter_chunk_results(None, n_hands, seed, chunk_hands, options):
+            total.merge(result)
+        return total
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for result in iter_chunk_results(pool, n_hands, seed, chunk_hands, options):
+            total.merge(result)
+    return total
@@ -0,0 +1,368 @@
+"""Vectorized Monte Carlo engine that plays many blackjack hands at once."""
+import numpy as np
+
+from .cards import (
+    HAND_CLASS_LABELS, NUM_CLASSES, ONE_DECK_VALUE_COUNTS, SOFT_BASE, PAIR_BASE, HARD_MIN, SOFT_MIN,
+)
+from .hand_store import actions_from_strategy, records_from_classes
+from .rules import simulation_policy, simulation_splits
+from .strategy import (
+    DOUBLE_HIT, DOUBLE_STAND, HIT, SPLIT, STAND, SURRENDER_HIT, SURRENDER_STAND, get_strategy_table,
+)
+
+# Doubling and surrendering are only allowed on the first two cards; later
+# decisions use the fallback carried by the action code
+AFTER_FIRST_DECISION = np.array([STAND, HIT, HIT, STAND, HIT, STAND, HIT], dtype=np.int8)
+
+# Number of cards drawn per hand up front; hands that need more get extra columns
+INITIAL_DEPTH = 10
+
+
+def policy_from_function(choose):
+    """Build a policy table from choose(total, soft, upcard_value) -> action.
+
+    The table is indexed by [soft, player total, upcard value - 1].
+    """
+    table = np.full((2, 22, 10), STAND, dtype=np.int8)
+    for soft in (0, 1):
+        for total in range(2, 22):
+            for upcard in range(1, 11):
+                table[soft, total, upcard - 1] = choose(total, bool(soft), upcard)
+    return table
+
+
+def basic_strategy_policy(dealer_hits_soft_17=False, surrender=False):
+    """Policy table from the optimal strategy table for the given rules."""
+    return get_strategy_table(dealer_hits_soft_17=dealer_hits_soft_17, surrender=surrender).to_policy()
+
+
+class SimulationResult:
+    """Win/lose/tie counts and net results (in units of the initial bet)."""
+
+    def __init__(self, players=0):
+        self.hands = 0
+        self.wins = 0
+        self.losses = 0
+        self.ties = 0
+        self.net = 0.0
+        self.net_squares = 0.0
+        # Per (hand class, dealer upcard) hand counts and net results
+        self.class_hands = np.zeros((NUM_CLASSES, 10), dtype=np.int64)
+        self.class_net = np.zeros((NUM_CLASSES, 10), dtype=np.float64)
+        # Optional net result per simulated player; hand i of a run goes to player i % players
+        self.player_net = np.zeros(players, dtype=np.float64)
+        # Hands seen per distinct net result, e.g. {-1.0: ..., 1.5: ...}
+        self.outcome_counts = {}
+
+    @property
+    def ev(self):
+        """Expected value per hand."""
+        return self.net / self.hands if self.hands else 0.0
+
+    @property
+    def std_dev(self):
+        """Standard deviation of the per-hand net result."""
+        if self.hands < 2:
+            return 0.0
+        variance = (self.net_squares - self.net * self.net / self.hands) / (self.hands - 1)
+        return max(variance, 0.0) ** 0.5
+
+    def confidence_interval(self, z=1.96):
+        """Return (low, high) bounds on the EV at the given normal quantile."""
+        margin = z * self.std_dev / self.hands ** 0.5 if self.hands else 0.0
+        return self.ev - margin, self.ev + margin
+
+    def merge(self, other):
+        """Add another result's tallies into this one and return self."""
+        self.hands += other.hands
+        self.wins += other.wins
+        self.losses += other.losses
+        self.ties += other.ties
+        self.net += other.net
+        self.net_squares += other.net_squares
+        self.class_hands += other.class_hands
+        self.class_net += other.class_net
+        for outcome, count in other.outcome_counts.items():
+            self.outcome_counts[outcome] = self.outcome_counts.get(outcome, 0) + count
+        if len(other.player_net):
+            if not len(self.player_net):
+                self.player_net = np.zeros_like(other.player_net)
+            self.player_net += other.player_net
+        return self
+
+    def add_batch(self, net, classes, upcards, first_hand):
+        """Fold one batch of per-hand net results into the totals.
+
+        first_hand is the index of the batch's first hand in the whole run,
+        which picks each hand's player whatever order batches are added in.
+        """
+        players = len(self.player_net)
+        if players:
+            seats = (first_hand + np.arange(len(net))) % players
+            self.player_net += np.bincount(seats, weights=net, minlength=players)
+        self.hands += len(net)
+        self.wins += int(np.count_nonzero(net > 0))
+        self.losses += int(np.count_nonzero(net < 0))
+        self.ties += int(np.count_nonzero(net == 0))
+        self.net += float(net.sum())
+        self.net_squares += float(np.dot(net, net))
+        for outcome, count in zip(*np.unique(net, return_counts=True)):
+            self.outcome_counts[float(outcome)] = self.outcome_counts.get(float(outcome), 0) + int(count)
+        cells = classes.astype(np.int64) * 10 + (upcards - 1)
+        size = NUM_CLASSES * 10
+        self.class_hands += np.bincount(cells, minlength=size).reshape(NUM_CLASSES, 10)
+        self.class_net += np.bincount(cells, weights=net, minlength=size).reshape(NUM_CLASSES, 10)
+
+    def class_ev(self):
+        """Return {"hard 16 vs 10": (hands, ev), ...} for every class seen."""
+        evs = {}
+        for cls, upcard in zip(*np.nonzero(self.class_hands)):
+            hands = int(self.class_hands[cls, upcard])
+            label = f"{HAND_CLASS_LABELS[cls]} vs {'A' if upcard == 0 else upcard + 1}"
+            evs[label] = (hands, float(self.class_net[cls, upcard]) / hands)
+        return evs
+
+    def to_dict(self):
+        return {
+            'hands': self.hands,
+            'wins': self.wins,
+            'losses': self.losses,
+            'ties': self.ties,
+            'ev': self.ev,
+            'std_dev': self.std_dev,
+            'ci95': list(self.confidence_interval()),
+        }
+
+
+def _draw_columns(counts, depth, rng):
+    """Deal depth cards off the top of every row's shoe without replacement."""
+    rows = counts.shape[0]
+    cards = np.empty((rows, depth), dtype=np.int8)
+    index = np.arange(rows)
+    for column in range(depth):
+        cumulative = counts.cumsum(axis=1)
+        target = (rng.random(rows) * cumulative[:, -1]).astype(np.int32)
+        drawn = (cumulative <= target[:, None]).sum(axis=1)
+        counts[index, drawn] -= 1
+        cards[:, column] = drawn + 1
+    return cards
+
+
+def _play_batch(rows, shoe_counts, policy, dealer_hits_soft_17, blackjack_payout, rng, double_on=None,
+                surrender=True, splits=None, max_splits=1, double_after_split=True):
+    """Play one batch of rounds and return (net, hand classes, upcards, first actions).
+
+    First actions are strategy action codes as played, -1 where a natural
+    ended the hand.
+
+    double_on limits doubling to a (low, high) range of totals; without
+    surrender, surrender codes in the policy fall back to their hit/stand play.
+    splits is a [pair value - 1, upcard - 1] table of the pairs to split, up
+    to max_splits times a round; split aces take one card each and are not
+    resplit. Without it pairs are played by their total.
+    """
+    counts = np.tile(np.asarray(shoe_counts, dtype=np.int32), (rows, 1))
+    cards = _draw_columns(counts, INITIAL_DEPTH, rng)
+    position = np.full(rows, 4, dtype=np.int64)
+
+    def next_cards(index):
+        nonlocal cards
+        if len(index) and position[index].max() >= cards.shape[1]:
+            cards = np.concatenate([cards, _draw_columns(counts, 2, rng)], axis=1)
+        drawn = cards[index, position[index]]
+        position[index] += 1
+        return drawn
+
+    # Deal in the same order as the game: two to the player, then two to the dealer
+    first, second, upcard, hole = (cards[:, i].astype(np.int64) for i in range(4))
+    player_hard = first + second
+    player_ace = (first == 1) | (second == 1)
+    dealer_hard = upcard + hole
+    dealer_ace = (upcard == 1) | (hole == 1)
+
+    player_total = player_hard + 10 * (player_ace & (player_hard <= 11))
+    classes = np.where(
+        first == second, PAIR_BASE + first - 1,
+        np.where(player_total != player_hard, SOFT_BASE + player_total - SOFT_MIN, player_hard - HARD_MIN),
+    )
+
+    player_blackjack = player_total == 21
+    dealer_blackjack = dealer_ace & (dealer_hard == 11)
+    live = ~(player_blackjack | dealer_blackjack)
+    surrendered = np.zeros(rows, dtype=bool)
+    first_action = np.full(rows, -1, dtype=np.int8)
+
+    # Each round holds up to slots hands, played in order; slot 0 is the hand as dealt
+    slots = max_splits + 1 if splits is not None else 1
+    hard = np.zeros((rows, slots), dtype=np.int64)
+    ace = np.zeros((rows, slots), dtype=bool)
+    bet = np.zeros((rows, slots))
+    hard[:, 0], ace[:, 0], bet[:, 0] = player_hard, player_ace, 1.0
+    hands = np.ones(rows, dtype=np.int64)
+    split_count = np.zeros(rows, dtype=np.int64)
+
+    if splits is not None:
+        # Split hand by hand as auto_play_hand does: a hand that is split gets
+        # its second card at once and may be split again while splits are left
+        pair = np.zeros((rows, slots), dtype=np.int64)
+        pair[:, 0] = np.where(first == second, first, 0)
+        split_aces = first == 1
+        for slot in range(slots):
+            while True:
+                value = pair[:, slot]
+                splitting = live & (value > 0) & (split_count < max_splits) & ~(split_aces & (split_count > 0))
+                splitting &= splits[np.maximum(value, 1) - 1, upcard - 1]
+                index = np.flatnonzero(splitting)
+                if not len(index):
+                    break
+                value = value[index]
+                for table in (hard, ace, bet, pair):
+                    table[index, slot + 2:] = table[index, slot + 1:-1]
+                for hand in (slot, slot + 1):
+                    drawn = next_cards(index)
+                    hard[index, hand] = value + drawn
+                    ace[index, hand] = (value == 1) | (drawn == 1)
+                    pair[index, hand] = np.where(drawn == value, value, 0)
+                    bet[index, hand] = 1.0
+                hands[index] += 1
+                split_count[index] += 1
+        first_action[split_count > 0] = SPLIT
+    split = split_count > 0
+
+    # Player turn, one hand slot at a time, applied column-wise to every hand still deciding
+    for slot in range(slots):
+        slot_hard, slot_ace, slot_bet = hard[:, slot], ace[:, slot], bet[:, slot]
+        # Split aces get one card each
+        active = live & (hands > slot) & ~(split & split_aces) if splits is not None else live.copy()
+        first_decision = True
+        while True:
+            index = np.flatnonzero(active)
+            if not len(index):
+                break
+            row_hard = slot_hard[index]
+            soft = slot_ace[index] & (row_hard <= 11)
+            action = policy[soft.astype(np.int64), row_hard + 10 * soft, upcard[index] - 1]
+            if not first_decision:
+                action = AFTER_FIRST_DECISION[action]
+            else:
+                # Opening options the table rules do not offer use their fallback
+                doubling = (action == DOUBLE_HIT) | (action == DOUBLE_STAND)
+                surrendering = (action == SURRENDER_HIT) | (action == SURRENDER_STAND)
+                barred = surrendering & split[index]  # Surrender is only offered on the hand as dealt
+                if double_on is not None:
+                    total = row_hard + 10 * soft
+                    barred |= doubling & ((total < double_on[0]) | (total > double_on[1]))
+                if not double_after_split:
+                    barred |= doubling & split[index]
+                if not surrender:
+                    barred |= surrendering
+                action = np.where(barred, AFTER_FIRST_DECISION[action], action)
+                if slot == 0:
+                    first_action[index[~split[index]]] = action[~split[index]]
+            first_decision = False
+
+            surrendering = (action == SURRENDER_HIT) | (action == SURRENDER_STAND)
+            surrendered[index[surrendering]] = True
+            double = (action == DOUBLE_HIT) | (action == DOUBLE_STAND)
+            slot_bet[index[double]] = 2.0
+            draw = double | (action == HIT)
+
+            drawing = index[draw]
+            drawn = next_cards(drawing)
+            slot_hard[drawing] += drawn
+            slot_ace[drawing] |= drawn == 1
+            # Hands keep deciding only after a plain hit that did not bust
+            still = np.zeros(len(index), dtype=bool)
+            still[draw & ~double] = True
+            still &= slot_hard[index] <= 21
+            active[index] = still
+
+    in_round = np.arange(slots) < hands[:, None]
+    totals = hard + 10 * (ace & (hard <= 11))
+    bust = totals > 21
+
+    # Dealer turn for every round with a hand still live against the dealer
+    dealer_active = live & ~surrendered & (in_round & ~bust).any(axis=1)
+    while True:
+        index = np.flatnonzero(dealer_active)
+        if not len(index):
+            break
+        row_hard = dealer_hard[index]
+        soft = dealer_ace[index] & (row_hard <= 11)
+        total = row_hard + 10 * soft
+        drawing_mask = total < 17
+        if dealer_hits_soft_17:
+            drawing_mask |= (total == 17) & soft
+        drawing = index[drawing_mask]
+        dealer_active[index[~drawing_mask]] = False
+        if len(drawing):
+            drawn = next_cards(drawing)
+            dealer_hard[drawing] += drawn
+            dealer_ace[drawing] |= drawn == 1
+
+    dealer_total = (dealer_hard + 10 * (dealer_ace & (dealer_hard <= 11)))[:, None]
+
+    results = np.where(totals > dealer_total, 1.0, np.where(totals < dealer_total, -1.0, 0.0))
+    results[(dealer_total > 21) & ~bust] = 1.0
+    results[bust] = -1.0
+    net = (results * bet * in_round).sum(axis=1)
+    net[surrendered] = -0.5
+    net[dealer_blackjack] = -1.0
+    net[player_blackjack] = blackjack_payout
+    net[player_blackjack & dealer_blackjack] = 0.0
+    return net, classes, upcard, first_action
+
+
+def simulate(n_hands, decks=1, policy=None, dealer_hits_soft_17=False, blackjack_payout=1.5,
+             rng=None, batch_size=250_000, players=0, rules=None, store=None, splits=None, first_hand=0):
+    """Play n_hands independent rounds, each from a freshly shuffled shoe of decks decks.
+
+    policy is a table from policy_from_function or StrategyTable.to_policy
+    (defaults to basic_strategy_policy for the same dealer rule). splits is a
+    table from StrategyTable.to_split_policy of the pairs to split; without
+    it pairs are played by their total. With players, the result also tracks
+    each of that many players' net (see SimulationResult); first_hand is the
+    index of this run's first hand when it is one chunk of a larger run.
+    A RuleSet in rules takes the place of decks, dealer_hits_soft_17 and
+    blackjack_payout, supplies its strategy as the default policy and splits,
+    and holds any policy to its double, surrender and split restrictions.
+    Net results are per round, summed over split hands, in units of the
+    initial bet. Every round is also appended to store (a
+    hand_store.HandStore) if given, with a true count of zero since each
+    shoe is fresh.
+    """
+    double_on, surrender, max_splits, double_after_split = None, True, 1, True
+    if rules is not None:
+        decks, dealer_hits_soft_17, blackjack_payout = rules.decks, rules.dealer_hits_soft_17, rules.blackjack_payout
+        double_on, surrender = rules.double_on, rules.surrender
+        max_splits, double_after_split = rules.max_splits, rules.double_after_split
+        if policy is None:
+            policy = simulation_policy(rules)
+            if splits is None and max_splits:
+                splits = simulation_splits(rules)
+    if not max_splits:
+        splits = None
+    if policy is None:
+        policy = basic_strategy_policy(dealer_hits_soft_17)
+    if rng is None or isinstance(rng, int):
+        rng = np.random.default_rng(rng)
+    shoe_counts = [count * decks for count in ONE_DECK_VALUE_COUNTS]
+
+    result = SimulationResult(players)
+    remaining = n_hands
+    while remaining > 0:
+        rows = min(batch_size, remaining)
+        net, classes, upcards, first_actions = _play_batch(rows, shoe_counts, policy, dealer_hits_soft_17,
+                                                           blackjack_payout, rng, double_on, surrender,
+                                                           splits, max_splits, double_after_split)
+        result.add_batch(net, classes, upcards, first_hand + n_hands - remaining)
+        if store is not None:
+            _record_batch(store, net, classes, upcards, first_actions)
+        remaining -= rows
+    return result
+
+
+def _record_batch(store, net, classes, upcards, first_actions):
+    total, soft, pair = records_from_classes(classes)
+    store.append(total=total, soft=soft, pair=pair, upcard=upcards, action=actions_from_strategy(first_actions),
+                 count=np.zeros(len(net), dtype=np.float32), result=net)
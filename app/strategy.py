@@ -0,0 +1,296 @@
+"""Optimal basic strategy derived from expected values and compiled into a lookup table.
+
+The table is a flat byte array indexed by hand class (see cards.py) and
+dealer upcard value, so advice is a single index operation. Tables are
+computed once per rule set and cached on disk.
+"""
+import os
+import tempfile
+from functools import lru_cache
+
+import numpy as np
+
+from .cards import (
+    HAND_CLASS_LABELS, HARD_MAX, HARD_MIN, NUM_CLASSES, PAIR_BASE, SOFT_BASE, SOFT_MAX, SOFT_MIN,
+    hand_class, hand_total, point_value,
+)
+from .hand import Hand
+
+# Actions; the double and surrender codes carry the play to fall back on
+# when the first-two-cards option is not available
+STAND, HIT, DOUBLE_HIT, DOUBLE_STAND, SURRENDER_HIT, SURRENDER_STAND, SPLIT = range(7)
+ACTION_CODES = ('S', 'H', 'D', 'Ds', 'Rh', 'Rs', 'P')
+ACTION_ADVICE = (
+    "Stand",
+    "Hit",
+    "Double down (if possible), otherwise Hit",
+    "Double down (if possible), otherwise Stand",
+    "Surrender (if possible), otherwise Hit",
+    "Surrender (if possible), otherwise Stand",
+    "Split",
+)
+
+# Infinite-deck draw probabilities by point value (ace = 1)
+DRAW_PROBABILITIES = (1 / 13,) * 9 + (4 / 13,)
+
+CACHE_DIR = os.getenv('STRATEGY_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'blackjack-strategy'))
+
+BUST = 22
+# Strategy tables kept in memory, most recently used first
+TABLE_CACHE_SIZE = 32
+# Part of every disk-cache name; bump it when the way tables are computed changes
+TABLE_VERSION = 2
+
+
+class StrategyTable:
+    """Action codes for every (hand class, dealer upcard) pair."""
+
+    __slots__ = ('actions',)
+
+    def __init__(self, actions):
+        self.actions = bytes(actions)
+        if len(self.actions) != NUM_CLASSES * 10:
+            raise ValueError("Strategy table has the wrong size.")
+        if max(self.actions) >= len(ACTION_CODES):
+            raise ValueError("Strategy table has an unknown action code.")
+
+    def lookup(self, cls, upcard_value):
+        """Return the action code for a hand class against an upcard value (ace = 1)."""
+        return self.actions[cls * 10 + upcard_value - 1]
+
+    def advise(self, cards, upcard):
+        """Return the action code for a Hand or list of rank strings against an upcard rank."""
+        return self.lookup(classify(cards), point_value(upcard))
+
+    def to_policy(self):
+        """Return the hard/soft rows as a simulation policy table [soft, total, upcard - 1]."""
+        table = np.frombuffer(self.actions, dtype=np.int8).reshape(NUM_CLASSES, 10)
+        policy = np.full((2, 22, 10), STAND, dtype=np.int8)
+        policy[0, HARD_MIN:HARD_MAX + 1] = table[:SOFT_BASE]
+        policy[0, :HARD_MIN] = HIT
+        policy[1, SOFT_MIN:SOFT_MAX + 1] = table[SOFT_BASE:PAIR_BASE]
+        return policy
+
+    def to_split_policy(self):
+        """Return where the pair rows split as a simulation split table [pair value - 1, upcard - 1]."""
+        table = np.frombuffer(self.actions, dtype=np.int8).reshape(NUM_CLASSES, 10)
+        return table[PAIR_BASE:] == SPLIT
+
+    def to_rows(self):
+        """Return {"hard 16": ["H", ...], ...} with upcards ordered A, 2, ..., 10."""
+        return {
+            label: [ACTION_CODES[code] for code in self.actions[cls * 10:(cls + 1) * 10]]
+            for cls, label in enumerate(HAND_CLASS_LABELS)
+        }
+
+    @classmethod
+    def from_rows(cls, rows, base=None):
+        """Build a table from to_rows() style data; rows missing from rows come from base."""
+        actions = bytearray(base.actions if base is not None else bytes(NUM_CLASSES * 10))
+        for label, codes in rows.items():
+            if label not in HAND_CLASS_LABELS or len(codes) != 10:
+                raise ValueError(f"Invalid strategy row: {label}")
+            row = HAND_CLASS_LABELS.index(label)
+            for upcard, code in enumerate(codes):
+                if code not in ACTION_CODES:
+                    raise ValueError(f"Invalid action {code!r} in row {label}")
+                actions[row * 10 + upcard] = ACTION_CODES.index(code)
+        return cls(actions)
+
+
+def classify(cards):
+    """Return the hand class of a Hand or a list of rank strings; raises ValueError for fewer than two cards."""
+    if isinstance(cards, Hand):
+        return cards.hand_class()
+    if len(cards) < 2:
+        raise ValueError("A hand needs at least two cards to classify.")
+    values = [point_value(card) for card in cards]
+    if len(values) == 2 and values[0] == values[1]:
+        return hand_class(0, False, pair_value=values[0])
+    total, soft = hand_total(sum(values), 1 in values)
+    return hand_class(min(total, HARD_MAX) if not soft else total, soft)
+
+
+def _dealer_distribution(upcard, dealer_hits_soft_17):
+    """Probabilities of dealer final totals 17-21 and bust, given no dealer blackjack."""
+
+    @lru_cache(maxsize=None)
+    def finish(hard, ace):
+        total, soft = hand_total(hard, ace)
+        if total > 21:
+            return {BUST: 1.0}
+        if total > 17 or (total == 17 and not (soft and dealer_hits_soft_17)):
+            return {total: 1.0}
+        outcome = {}
+        for value, p in enumerate(DRAW_PROBABILITIES, start=1):
+            for final, q in finish(hard + value, ace or value == 1).items():
+                outcome[final] = outcome.get(final, 0.0) + p * q
+        return outcome
+
+    # The dealer peeks, so a hole card completing a blackjack is ruled out
+    hole_cards = [
+        (value, p) for value, p in enumerate(DRAW_PROBABILITIES, start=1)
+        if not ((upcard == 1 and value == 10) or (upcard == 10 and value == 1))
+    ]
+    weight = sum(p for _, p in hole_cards)
+    outcome = {}
+    for value, p in hole_cards:
+        for final, q in finish(upcard + value, upcard == 1 or value == 1).items():
+            outcome[final] = outcome.get(final, 0.0) + p / weight * q
+    return outcome
+
+
+def _player_evs(dealer, double_after_split, surrender, double_on=None):
+    """Return a function giving the EV of each action for a two-card hand.
+
+    double_on is the (low, high) range of totals the player may double on, or
+    None for any two cards.
+    """
+
+    def may_double(hard, ace):
+        if double_on is None:
+            return True
+        return double_on[0] <= hand_total(hard, ace)[0] <= double_on[1]
+
+    def stand(total):
+        if total > 21:
+            return -1.0
+        return sum(p * (1.0 if final == BUST or final < total else -1.0 if final > total else 0.0)
+                   for final, p in dealer.items())
+
+    @lru_cache(maxsize=None)
+    def best(hard, ace):
+        if hard > 21:
+            return -1.0
+        return max(stand(hand_total(hard, ace)[0]), hit(hard, ace))
+
+    @lru_cache(maxsize=None)
+    def hit(hard, ace):
+        return sum(p * best(hard + value, ace or value == 1)
+                   for value, p in enumerate(DRAW_PROBABILITIES, start=1))
+
+    def double(hard, ace):
+        return 2 * sum(p * stand(hand_total(hard + value, ace or value == 1)[0])
+                       for value, p in enumerate(DRAW_PROBABILITIES, start=1))
+
+    def split(pair_value):
+        # One split only; each half is played as a fresh two-card hand
+        hand = 0.0
+        for value, p in enumerate(DRAW_PROBABILITIES, start=1):
+            hard, ace = pair_value + value, pair_value == 1 or value == 1
+            if pair_value == 1:
+                hand += p * stand(hand_total(hard, ace)[0])
+                continue
+            options = [stand(hand_total(hard, ace)[0]), hit(hard, ace)]
+            if double_after_split and may_double(hard, ace):
+                options.append(double(hard, ace))
+            hand += p * max(options)
+        return 2 * hand
+
+    def evs(hard, ace, pair_value=None):
+        options = {STAND: stand(hand_total(hard, ace)[0]), HIT: hit(hard, ace)}
+        if may_double(hard, ace):
+            options[DOUBLE_HIT] = double(hard, ace)
+        if surrender:
+            options[SURRENDER_HIT] = -0.5
+        if pair_value is not None:
+            options[SPLIT] = split(pair_value)
+        return options
+
+    return evs
+
+
+def _choose(options):
+    """Pick the best action, folding in the fallback for doubles and surrenders."""
+    action = max(options, key=options.get)
+    fallback_hit = options[HIT] >= options[STAND]
+    if action == DOUBLE_HIT and not fallback_hit:
+        return DOUBLE_STAND
+    if action == SURRENDER_HIT and not fallback_hit:
+        return SURRENDER_STAND
+    return action
+
+
+def compute_strategy_table(dealer_hits_soft_17=False, double_after_split=True, surrender=False, double_on=None,
+                           max_splits=1):
+    """Derive the optimal infinite-deck strategy table from expected values."""
+    actions = bytearray(NUM_CLASSES * 10)
+    for upcard in range(1, 11):
+        dealer = _dealer_distribution(upcard, dealer_hits_soft_17)
+        evs = _player_evs(dealer, double_after_split, surrender, double_on)
+        for total in range(HARD_MIN, HARD_MAX + 1):
+            actions[hand_class(total, False) * 10 + upcard - 1] = _choose(evs(total, False))
+        for total in range(SOFT_MIN, SOFT_MAX + 1):
+            actions[hand_class(total, True) * 10 + upcard - 1] = _choose(evs(total - 10, True))
+        for pair_value in range(1, 11):
+            # Without splits a pair is played by its total
+            options = evs(2 * pair_value, pair_value == 1, pair_value if max_splits else None)
+            actions[hand_class(0, False, pair_value) * 10 + upcard - 1] = _choose(options)
+    return StrategyTable(actions)
+
+
+def expected_return(dealer_hits_soft_17=False, double_after_split=True, surrender=False, double_on=None,
+                    max_splits=1, blackjack_payout=1.5):
+    """Infinite-deck expected return of one round per initial bet, played by the optimal strategy.
+
+    The dealer peeks, so a dealer blackjack only takes the original bet.
+    Splits are valued as a single split whatever max_splits allows.
+    """
+    ace, ten = DRAW_PROBABILITIES[0], DRAW_PROBABILITIES[9]
+    player_blackjack = 2 * ace * ten
+    total = 0.0
+    for upcard, p_upcard in enumerate(DRAW_PROBABILITIES, start=1):
+        dealer_blackjack = ten if upcard == 1 else ace if upcard == 10 else 0.0
+        evs = _player_evs(_dealer_distribution(upcard, dealer_hits_soft_17), double_after_split, surrender,
+                          double_on)
+        played = player_blackjack * blackjack_payout
+        for first, p_first in enumerate(DRAW_PROBABILITIES, start=1):
+            for second, p_second in enumerate(DRAW_PROBABILITIES, start=1):
+                if first + second == 11 and 1 in (first, second):
+                    continue  # Blackjack, counted above
+                pair_value = first if first == second and max_splits else None
+                played += p_first * p_second * max(evs(first + second, 1 in (first, second), pair_value).values())
+        total += p_upcard * (dealer_blackjack * (player_blackjack - 1) + (1 - dealer_blackjack) * played)
+    return total
+
+
+def _cache_path(key):
+    """The cache file for a rule key; the name also pins the table version and layout, so a stale file is never read."""
+    layout = (f"v{TABLE_VERSION}", f"{NUM_CLASSES}x{len(ACTION_CODES)}")
+    return os.path.join(CACHE_DIR, 'strategy-' + '-'.join(layout + key) + '.bin')
+
+
+@lru_cache(maxsize=TABLE_CACHE_SIZE)
+def get_strategy_table(dealer_hits_soft_17=False, double_after_split=True, surrender=False, double_on=None,
+                       max_splits=1):
+    """Return the strategy table for a rule set, computing it only on a disk-cache miss.
+
+    A cached file of the wrong size or with unknown action codes counts as a
+    miss. The most recently used TABLE_CACHE_SIZE tables stay in memory.
+    """
+    key = ('h17' if dealer_hits_soft_17 else 's17', 'das' if double_after_split else 'nodas',
+           'ls' if surrender else 'nosurr', 'da' if double_on is None else 'd{}-{}'.format(*double_on),
+           'split' if max_splits else 'nosplit')
+    path = _cache_path(key)
+    try:
+        with open(path, 'rb') as cached:
+            return StrategyTable(cached.read())
+    except (OSError, ValueError):
+        pass
+
+    table = compute_strategy_table(dealer_hits_soft_17, double_after_split, surrender, double_on, max_splits)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write to a temporary name first so readers never see a partial table
+        partial = f"{path}.{os.getpid()}.tmp"
+        with open(partial, 'wb') as cached:
+            cached.write(table.actions)
+        os.replace(partial, path)
+    except OSError:
+        pass
+    return table
+
+
+def advise(cards, upcard, **rules):
+    """Return the action code for a hand of rank strings against the dealer upcard."""
+    return get_strategy_table(**rules).advise(cards, upcard)
@@ -0,0 +1,152 @@
+"""Routes for shared multi-seat tables (see tables.py)."""
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from flask import Blueprint, jsonify, request
+from flask_login import current_user, login_required
+
+from . import db
+from .idempotency import idempotent
+from .ledger import InsufficientFunds, debit
+from .rules import RuleSet, get_rules
+from .tables import (
+    COMMAND_TIMEOUT, MAX_SEATS, MAX_WAIT, MIN_BET, TableBusy, TableError, TableLimit, get_table_server,
+)
+
+tables = Blueprint('tables', __name__)
+
+MAX_BUY_IN = 10_000
+
+
+def _table_error(error):
+    """The response for an exception from the table server."""
+    if isinstance(error, LookupError):
+        return jsonify({'error': 'Table not found.'}), 404
+    if isinstance(error, TableBusy):
+        response = jsonify({'error': str(error)})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    if isinstance(error, TableLimit):
+        return jsonify({'error': str(error)}), 429
+    if isinstance(error, TableError):
+        return jsonify({'error': str(error)}), 409
+    return jsonify({'error': 'The table did not respond in time.'}), 504
+
+
+def _command(table_id, name, *args):
+    """Run a table command; returns (result, None) or (None, error response)."""
+    try:
+        return get_table_server().command(table_id, name, *args), None
+    except (LookupError, TableError, FutureTimeout) as e:
+        return None, _table_error(e)
+
+
+@tables.route('', methods=['GET'])
+@login_required
+def list_tables():
+    """Open tables with their rules and how many seats are taken."""
+    return jsonify({
+        'tables': get_table_server().list_tables(),
+        'seated_at': get_table_server().table_of(current_user.id),
+    })
+
+
+@tables.route('', methods=['POST'])
+@login_required
+def create_table():
+    """Open a table under the house rules, or overrides from a "rules" object.
+
+    A table nobody sits at closes after TABLE_IDLE_TIMEOUT seconds.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        rules = RuleSet.from_dict(data['rules'], base=get_rules()) if data.get('rules') is not None else get_rules()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        snapshot = get_table_server().create_table(rules, current_user.id)
+    except (TableError, FutureTimeout) as e:
+        return _table_error(e)
+    return jsonify(snapshot), 201
+
+
+@tables.route('/<table_id>', methods=['GET'])
+@login_required
+def table_state(table_id):
+    """The table's state; with since=<version>, wait up to wait seconds for a newer one (long poll)."""
+    since = request.args.get('since', -1, type=int)
+    wait = max(0.0, min(request.args.get('wait', MAX_WAIT, type=float), MAX_WAIT))
+    try:
+        return jsonify(get_table_server().wait(table_id, since, wait))
+    except (LookupError, FutureTimeout) as e:
+        return _table_error(e)
+
+
+@tables.route('/<table_id>/sit', methods=['POST'])
+@login_required
+@idempotent
+def sit(table_id):
+    """Take a seat with buy_in chips from the bankroll, optionally choosing the seat."""
+    data = request.get_json(silent=True) or {}
+    buy_in = data.get('buy_in')
+    seat = data.get('seat')
+    if not isinstance(buy_in, int) or not MIN_BET <= buy_in <= MAX_BUY_IN:
+        return jsonify({'error': f'buy_in must be between {MIN_BET} and {MAX_BUY_IN}.'}), 400
+    if seat is not None and (not isinstance(seat, int) or not 0 <= seat < MAX_SEATS):
+        return jsonify({'error': f'seat must be between 0 and {MAX_SEATS - 1}.'}), 400
+
+    # The buy-in commits before the table sees the player; a table that refuses refunds it
+    try:
+        balance = debit(current_user.id, buy_in, 'buyin')
+        db.session.commit()
+    except InsufficientFunds as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    try:
+        seat = get_table_server().sit(table_id, current_user.id, current_user.username, buy_in, seat)
+    except (LookupError, TableError) as e:
+        return _table_error(e)
+    except FutureTimeout:
+        # The table either seats the player or refunds the buy-in once it catches up
+        return jsonify({'error': 'The table did not respond in time; check seated_at before sitting again.'}), 504
+    return jsonify({'table': table_id, 'seat': seat, 'stack': buy_in, 'remaining_bankroll': balance})
+
+
+@tables.route('/<table_id>/bet', methods=['POST'])
+@login_required
+def bet(table_id):
+    """Bet for the next round; cards go out when every seat has bet or the bet window closes."""
+    data = request.get_json(silent=True) or {}
+    stack, error = _command(table_id, 'bet', current_user.id, data.get('bet'))
+    if error is not None:
+        return error
+    return jsonify({'bet': data['bet'], 'stack': stack})
+
+
+@tables.route('/<table_id>/action', methods=['POST'])
+@login_required
+def act(table_id):
+    """Hit, stand, double, split or surrender the hand whose turn it is."""
+    data = request.get_json(silent=True) or {}
+    hand, error = _command(table_id, 'act', current_user.id, data.get('action'))
+    if error is not None:
+        return error
+    return jsonify({'action': data['action'], 'hand': hand})
+
+
+@tables.route('/<table_id>/leave', methods=['POST'])
+@login_required
+@idempotent
+def leave(table_id):
+    """Stand up between hands and return the stack to the bankroll.
+
+    bankroll is null if the cash-out has not committed yet; it is retried until it does.
+    """
+    result, error = _command(table_id, 'leave', current_user.id)
+    if error is not None:
+        return error
+    stack, payout = result
+    try:
+        balance = payout.result(COMMAND_TIMEOUT)
+    except FutureTimeout:
+        balance = None
+    return jsonify({'cashed_out': stack, 'bankroll': balance})
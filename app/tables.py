@@ -0,0 +1,876 @@
+"""Shared-shoe multi-seat tables run as actors on one asyncio event loop.
+
+A TableServer owns an event loop on a daemon thread and the authoritative
+state of every open table. Each Table is one coroutine: commands from request
+threads go through the table's bounded queue and are applied one at a time,
+so a table needs no locks, and bet and turn deadlines fire in the same
+coroutine, so a player who walks away cannot stall the others. Every change
+bumps the table's version; long-poll readers wait on one shared future for
+the next version and share one cached snapshot of it.
+
+Chips leave the database when a player sits down with a buy-in and go back
+when they stand up. The buy-in is committed before the table sees the player;
+if the table refuses the seat, or the request expires before the actor gets
+to it, the actor hands the chips back. Standing up and refunds are ledger
+credits queued on the TableRecorder thread by the actor, in the same step
+that frees the seat, and retried until they commit, so chips are never both
+at a table and in the bankroll, nor in neither. The hands in between never
+touch the database: finished hands go to the same thread, which writes them
+as GameSession rows and stats in batches, also retried until they commit
+(final_bankroll is the table stack). Each row's hand_log is a table log of
+its round, so replay_table_hand can deal the hand again. Tables live in the
+process that created them, so run the app with one worker process or route
+each table's requests to its worker.
+
+Seats live only in memory. On shutdown (TableServer.shutdown, run at exit)
+every seat is cashed out, a round in play called off. A process that dies
+without shutting down leaves buy-ins with no cash-out; the next one credits
+them back before its first request (TableRecorder.reconcile_buy_ins).
+"""
+import asyncio
+import atexit
+import concurrent.futures
+import logging
+import queue
+import threading
+import time
+import uuid
+
+from flask import current_app
+from sqlalchemy import func, insert, select
+
+from . import db
+from .card_codec import decode_table_log, encode_table_log, is_table_log
+from .game_logic import hand_outcome
+from .hand import ACE, Hand
+from .ledger import credit
+from .live_state import LiveGame
+from .models import GameSession, LedgerEntry, UserStats
+from .rules import DEFAULT_RULES
+from .shoe import Shoe
+
+MAX_SEATS = 7
+MIN_BET, MAX_BET = 10, 100
+# Commands waiting per table before new ones are turned away
+QUEUE_SIZE = 64
+DEFAULT_TURN_TIMEOUT = 30  # Seconds a player has to act before standing automatically
+DEFAULT_BET_WINDOW = 10  # Seconds after the first bet before the cards go out anyway
+DEFAULT_IDLE_TIMEOUT = 120  # Seconds a table may stand empty before it closes
+DEFAULT_MAX_TABLES = 5000
+DEFAULT_MAX_TABLES_PER_USER = 2  # Open tables one user may have created
+COMMAND_TIMEOUT = 5  # Seconds a request waits for its table to apply a command
+MAX_WAIT = 30  # Longest long-poll, in seconds
+RECORD_BATCH = 500
+RECORD_INTERVAL = 1.0
+# GameSession columns written for each finished table hand
+RECORD_COLUMNS = ('user_id', 'outcome', 'bet', 'final_bankroll', 'doubled_down', 'hand_log')
+
+BETTING, PLAYING, CLOSED = 'betting', 'playing', 'closed'
+ACTIONS = ('hit', 'stand', 'double', 'split', 'surrender')
+
+logger = logging.getLogger(__name__)
+
+
+class TableError(ValueError):
+    """A command the table cannot apply in its current state."""
+
+
+class TableBusy(TableError):
+    """The table's command queue is full."""
+
+
+class TableLimit(TableError):
+    """The user already has as many open tables as they may create."""
+
+
+class Seat:
+    """One player at a table: their chips, bet and hands this round.
+
+    stack is the chips not in play; a bet leaves it as soon as it is placed.
+    """
+
+    __slots__ = ('user_id', 'name', 'stack', 'bet', 'hands', 'stakes', 'done', 'surrendered', 'results')
+
+    def __init__(self, user_id, name, stack):
+        self.user_id = user_id
+        self.name = name
+        self.stack = stack
+        self.bet = 0
+        self.hands = []
+        self.stakes = []
+        self.done = []
+        self.surrendered = False
+        self.results = []  # Outcome and net of each hand last round
+
+    @property
+    def in_round(self):
+        return bool(self.hands)
+
+    def to_dict(self, index):
+        return {
+            'seat': index,
+            'user_id': self.user_id,
+            'name': self.name,
+            'stack': self.stack,
+            'bet': self.bet,
+            'hands': [
+                {'cards': hand.to_list(), 'value': hand.value, 'stake': stake, 'done': done}
+                for hand, stake, done in zip(self.hands, self.stakes, self.done)
+            ],
+            'surrendered': self.surrendered,
+            'results': self.results,
+        }
+
+
+class Table:
+    """Authoritative state of one table, changed only by its own coroutine."""
+
+    def __init__(self, server, table_id, rules, owner_id=None):
+        self.server = server
+        self.id = table_id
+        self.rules = rules
+        self.owner_id = owner_id  # The user who opened it, for the per-user cap
+        self.shoe = Shoe(rules.decks)
+        self.seats = [None] * MAX_SEATS
+        self.dealer = None
+        self.phase = BETTING
+        self.round = 0
+        self.turn = None  # (seat index, hand index) of the hand to act
+        self.deadline = None  # Loop time when the bet window, the current turn or an empty table runs out
+        self.deadline_at = None  # The same moment as a wall-clock timestamp, for clients
+        self.version = 0
+        self.log_start = None  # Shoe seed and position at this round's deal, for its hand logs
+        self.actions = bytearray()  # Every seat's actions this round, as indexes into ACTIONS
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.task = None  # The actor's task, set by the server
+        self._snapshot = None
+        self._waiter = None
+
+    # Running the actor
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while self.phase != CLOSED:
+            timeout = None if self.deadline is None else max(0.0, self.deadline - loop.time())
+            try:
+                name, args, future, expires = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                self._expire()
+                self._changed()
+                continue
+            if future.done():
+                continue  # The request gave up waiting
+            if expires is not None and loop.time() > expires:
+                future.set_exception(TableError("The table did not get to this request in time."))
+                continue
+            try:
+                result = getattr(self, f"_{name}")(*args)
+            except TableError as e:
+                future.set_exception(e)
+                continue
+            except Exception as e:
+                logger.exception("Table %s failed on %s", self.id, name)
+                future.set_exception(e)
+                continue
+            future.set_result(result)
+            self._changed()
+        self._refuse_queued()  # Anything still queued arrived after the last player left
+
+    def _refuse_queued(self):
+        while not self.queue.empty():
+            _, _, future, _ = self.queue.get_nowait()
+            if not future.done():
+                future.set_exception(TableError("This table has closed."))
+
+    async def submit(self, name, *args, expires=None):
+        """Queue a command for the actor and wait for its result.
+
+        A command still queued at loop time expires is refused with TableError.
+        """
+        if self.phase == CLOSED:
+            raise TableError("This table has closed.")
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((name, args, future, expires))
+        except asyncio.QueueFull:
+            raise TableBusy("The table is busy; try again.") from None
+        return await future
+
+    async def wait(self, since, timeout):
+        """The snapshot once the version passes since, or the current one after timeout seconds."""
+        if self.version <= since and self.phase != CLOSED:
+            if self._waiter is None:
+                self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.wait_for(asyncio.shield(self._waiter), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.snapshot()
+
+    def _changed(self):
+        self.version += 1
+        self._snapshot = None
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def _set_deadline(self, seconds):
+        if seconds is None:
+            self.deadline = self.deadline_at = None
+        else:
+            self.deadline = asyncio.get_running_loop().time() + seconds
+            self.deadline_at = time.time() + seconds
+
+    def _expire(self):
+        if self.phase == BETTING:
+            if all(seat is None for seat in self.seats):
+                self._close()  # Nobody sat down in time
+            elif any(seat is not None and seat.bet for seat in self.seats):
+                self._deal()
+            else:
+                self._set_deadline(None)
+        elif self.phase == PLAYING and self.turn is not None:
+            seat_index, hand_index = self.turn
+            self.seats[seat_index].done[hand_index] = True  # Out of time: stand
+            self.actions.append(ACTIONS.index('stand'))
+            self._advance()
+
+    # Commands, applied one at a time by run()
+
+    def _seat_of(self, user_id):
+        for index, seat in enumerate(self.seats):
+            if seat is not None and seat.user_id == user_id:
+                return index, seat
+        raise TableError("You are not seated at this table.")
+
+    def _sit(self, user_id, name, stack, seat_index=None):
+        if user_id in self.server.seated:
+            raise TableError("You already have a seat at a table.")
+        if seat_index is None:
+            free = [index for index, seat in enumerate(self.seats) if seat is None]
+            if not free:
+                raise TableError("The table is full.")
+            seat_index = free[0]
+        elif not 0 <= seat_index < MAX_SEATS or self.seats[seat_index] is not None:
+            raise TableError("That seat is not free.")
+        if all(seat is None for seat in self.seats):
+            self._set_deadline(None)  # No longer empty
+        self.seats[seat_index] = Seat(user_id, name, stack)
+        self.server.seated[user_id] = self.id
+        return seat_index
+
+    def _leave(self, user_id):
+        """Stand up between hands; returns the chips cashed out and a Future for the new bankroll."""
+        index, seat = self._seat_of(user_id)
+        if self.phase == PLAYING and seat.in_round:
+            raise TableError("Finish the hand before leaving the table.")
+        self.seats[index] = None
+        del self.server.seated[user_id]
+        stack = seat.stack + seat.bet  # A bet not yet dealt on comes back
+        payout = self.server.recorder.credit(user_id, stack, 'cashout')
+        if all(seat is None for seat in self.seats):
+            self._close()
+        elif self.phase == BETTING and self._all_bets_in():
+            self._deal()
+        return stack, payout
+
+    def _bet(self, user_id, amount):
+        _, seat = self._seat_of(user_id)
+        if self.phase != BETTING:
+            raise TableError("Bets are closed until this round ends.")
+        if not isinstance(amount, int) or not MIN_BET <= amount <= MAX_BET:
+            raise TableError(f"Bet must be between {MIN_BET} and {MAX_BET}.")
+        if amount > seat.stack + seat.bet:
+            raise TableError("Not enough chips for that bet.")
+        # A new bet replaces the one already down
+        seat.stack += seat.bet - amount
+        seat.bet = amount
+        if self._all_bets_in():
+            self._deal()
+        elif self.deadline is None:
+            self._set_deadline(self.server.bet_window)
+        return seat.stack
+
+    def _act(self, user_id, action):
+        index, seat = self._seat_of(user_id)
+        if self.phase != PLAYING or self.turn is None or self.turn[0] != index:
+            raise TableError("It is not your turn.")
+        hand = _play_action(seat, self.turn[1], action, self.shoe, self.rules)
+        self.actions.append(ACTIONS.index(action))
+        self._advance()
+        return hand.to_list()
+
+    def _cash_out_all(self):
+        """Stand every player up and close the table; a round in play is called off and its stakes returned."""
+        for index, seat in enumerate(self.seats):
+            if seat is None:
+                continue
+            self.seats[index] = None
+            del self.server.seated[seat.user_id]
+            chips = seat.stack + (sum(seat.stakes) if seat.in_round else seat.bet)
+            self.server.recorder.credit(seat.user_id, chips, 'cashout')
+        self._close()
+        self._refuse_queued()
+        self._changed()
+
+    def _close(self):
+        self.phase = CLOSED
+        self._set_deadline(None)
+        self.server.tables.pop(self.id, None)
+
+    # Dealing and settling
+
+    def _all_bets_in(self):
+        seated = [seat for seat in self.seats if seat is not None]
+        return bool(seated) and all(seat.bet for seat in seated)
+
+    def _deal(self):
+        """Take the bets and deal two cards to each betting seat in order, then to the dealer."""
+        self.shoe.reshuffle_if_needed()
+        self.log_start = (self.shoe.seed, self.shoe.position)
+        self.actions = bytearray()
+        for seat in self.seats:
+            if seat is not None:
+                seat.results = []
+        self.dealer = _deal_round([seat for seat in self.seats if seat is not None and seat.bet], self.shoe)
+        self.round += 1
+        self.phase = PLAYING
+        if self.dealer.is_blackjack:
+            self._settle()  # The dealer peeks, so the round ends on the deal
+        else:
+            self._advance()
+
+    def _advance(self):
+        """Give the turn to the first unfinished hand in seat order, or finish the round."""
+        self.turn = _next_turn(self.seats)
+        if self.turn is not None:
+            self._set_deadline(self.server.turn_timeout)
+        else:
+            self._settle()
+
+    def _settle(self):
+        players = [seat for seat in self.seats if seat is not None and seat.in_round]
+        _play_dealer(players, self.dealer, self.shoe, self.rules)
+
+        records = []
+        seed, position = self.log_start
+        for seat_index, seat in enumerate(players):
+            for hand_index, outcome in enumerate(_outcomes(seat, self.dealer)):
+                stake = seat.stakes[hand_index]
+                net = self.rules.settle(outcome, stake)
+                seat.stack += stake + net
+                seat.results.append({'outcome': outcome, 'net': net})
+                records.append({
+                    'user_id': seat.user_id, 'outcome': outcome, 'bet': stake, 'net': net,
+                    'doubled_down': stake > seat.bet,
+                    'hand_log': encode_table_log(
+                        self.shoe.decks, seed, position, self.rules.dealer_hits_soft_17, len(players), seat_index,
+                        hand_index, self.actions,
+                    ),
+                })
+            for record in records[len(records) - len(seat.hands):]:
+                record['final_bankroll'] = seat.stack
+            seat.hands, seat.stakes, seat.done = [], [], []
+            seat.bet = 0
+        self.server.recorder.record(records)
+        self.phase = BETTING
+        self.turn = None
+        self._set_deadline(None)
+
+    def snapshot(self):
+        """JSON-ready table state, built once per version and shared by every reader."""
+        if self._snapshot is None:
+            dealer = None
+            if self.dealer is not None:
+                # The hole card stays face down while players are still acting
+                hidden = self.phase == PLAYING
+                cards = self.dealer.to_list()
+                dealer = {
+                    'cards': cards[:1] + ['?'] if hidden else cards,
+                    'value': None if hidden else self.dealer.value,
+                }
+            self._snapshot = {
+                'id': self.id,
+                'rules': self.rules.label,
+                'version': self.version,
+                'round': self.round,
+                'phase': self.phase,
+                'seats': [seat.to_dict(index) if seat is not None else None for index, seat in enumerate(self.seats)],
+                'dealer': dealer,
+                'turn': {'seat': self.turn[0], 'hand': self.turn[1]} if self.turn is not None else None,
+                'deadline': self.deadline_at,
+                'cards_remaining': self.shoe.remaining,
+            }
+        return self._snapshot
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'rules': self.rules.label,
+            'players': sum(seat is not None for seat in self.seats),
+            'seats': MAX_SEATS,
+            'phase': self.phase,
+        }
+
+
+def _deal_round(players, shoe):
+    """Deal two cards to each of the players' seats in order and to the dealer; returns the dealer's hand."""
+    for seat in players:
+        seat.hands = [Hand()]
+        seat.stakes = [seat.bet]
+        seat.done = [False]
+        seat.surrendered = False
+    dealer = Hand()
+    for _ in range(2):
+        for seat in players:
+            seat.hands[0].add(shoe.deal_code())
+        dealer.add(shoe.deal_code())
+    for seat in players:
+        seat.done[0] = seat.hands[0].is_blackjack
+    return dealer
+
+
+def _next_turn(seats):
+    """(seat index, hand index) of the first unfinished hand in seat order, or None once every hand is done."""
+    for seat_index, seat in enumerate(seats):
+        if seat is None:
+            continue
+        for hand_index, done in enumerate(seat.done):
+            if not done:
+                return seat_index, hand_index
+    return None
+
+
+def _play_action(seat, hand_index, action, shoe, rules):
+    """Apply one action to one of a seat's hands and return the hand.
+
+    Raises TableError if the rules or the seat's chips do not allow it. With
+    rules None nothing is checked, for replaying actions the table accepted.
+    """
+    hand = seat.hands[hand_index]
+    split = len(seat.hands) > 1
+    deal = shoe.deal_code
+
+    if action == 'hit':
+        hand.add(deal())
+        seat.done[hand_index] = hand.is_bust or hand.value == 21
+    elif action == 'stand':
+        seat.done[hand_index] = True
+    elif action == 'double':
+        if rules is not None:
+            if not rules.can_double(hand, after_split=split):
+                raise TableError("You cannot double this hand.")
+            if seat.stack < seat.bet:
+                raise TableError("Not enough chips to double.")
+        seat.stack -= seat.bet
+        seat.stakes[hand_index] += seat.bet
+        hand.add(deal())
+        seat.done[hand_index] = True
+    elif action == 'split':
+        split_aces = hand.codes[0] == ACE
+        if rules is not None:
+            if not rules.can_split(hand, len(seat.hands) - 1) or (split and split_aces):
+                raise TableError("You cannot split this hand.")
+            if seat.stack < seat.bet:
+                raise TableError("Not enough chips to split.")
+        seat.stack -= seat.bet
+        second = Hand.from_codes((hand.codes[-1],))
+        hand.pop()
+        hand.add(deal())
+        second.add(deal())
+        seat.hands.insert(hand_index + 1, second)
+        seat.stakes.insert(hand_index + 1, seat.bet)
+        # Split aces get one card each
+        seat.done[hand_index:hand_index + 1] = [split_aces or hand.value == 21, split_aces or second.value == 21]
+    elif action == 'surrender':
+        if rules is not None and not rules.can_surrender(hand, split):
+            raise TableError("Surrender is not allowed here.")
+        seat.surrendered = True
+        seat.done[hand_index] = True
+    else:
+        raise TableError(f"Unknown action; use one of {', '.join(ACTIONS)}.")
+    return hand
+
+
+def _play_dealer(players, dealer, shoe, rules):
+    """Draw to the dealer's hand unless no player hand is left for it to beat."""
+    live = any(
+        not seat.surrendered and not (hand.is_bust or (len(seat.hands) == 1 and hand.is_blackjack))
+        for seat in players for hand in seat.hands
+    )
+    if live and not dealer.is_blackjack:
+        while rules.dealer_hits(dealer):
+            dealer.add(shoe.deal_code())
+
+
+def _outcomes(seat, dealer):
+    split = len(seat.hands) > 1
+    return ['surrender' if seat.surrendered else hand_outcome(hand, dealer, split) for hand in seat.hands]
+
+
+def _replay_round(decks, seed, position, players):
+    """Deal a logged round again; returns (shoe, seats, dealer hand)."""
+    shoe = Shoe.from_seed(decks, seed, position)
+    seats = [Seat(None, None, 0) for _ in range(players)]
+    for seat in seats:
+        seat.bet = 1  # Stakes only matter as multiples of the bet
+    return shoe, seats, _deal_round(seats, shoe)
+
+
+def _replay_turns(seats, shoe, actions):
+    """Yield (seat index, action) for each logged action, then apply it."""
+    for code in actions:
+        turn = _next_turn(seats)
+        if turn is None or code >= len(ACTIONS):
+            raise ValueError("Table log does not match its round.")
+        yield turn[0], ACTIONS[code]
+        _play_action(seats[turn[0]], turn[1], ACTIONS[code], shoe, None)
+
+
+def replay_table_hand(hand_log):
+    """Rebuild a table hand from its log (see card_codec.encode_table_log), card for card.
+
+    Returns a LiveGame holding that hand as player_hand and the dealer's hand;
+    doubled_down is set if it was doubled.
+    """
+    decks, seed, position, dealer_hits_soft_17, players, seat_index, hand_index, actions = decode_table_log(hand_log)
+    shoe, seats, dealer = _replay_round(decks, seed, position, players)
+    for _ in _replay_turns(seats, shoe, actions):
+        pass
+    seat = seats[seat_index]
+    unfinished = _next_turn(seats) is not None and not dealer.is_blackjack
+    if unfinished or hand_index >= len(seat.hands):
+        raise ValueError("Table log does not match its round.")
+    _play_dealer(seats, dealer, shoe, DEFAULT_RULES.replace(decks=decks, dealer_hits_soft_17=dealer_hits_soft_17))
+
+    game = LiveGame(None, shoe=shoe)
+    game.player_hand, game.dealer_hand = seat.hands[hand_index], dealer
+    game.doubled_down = seat.stakes[hand_index] > seat.bet
+    game.hand_log = bytearray(hand_log)
+    return game
+
+
+def table_opening(hand_log):
+    """The opening two cards of a table hand's seat, the dealer's two cards and the seat's first action.
+
+    The action is one of ACTIONS, or 'none' if the seat never acted (a natural on either side).
+    """
+    decks, seed, position, _, players, seat_index, _, actions = decode_table_log(hand_log)
+    shoe, seats, dealer = _replay_round(decks, seed, position, players)
+    opening = Hand.from_codes(seats[seat_index].hands[0].codes)
+    for acting, action in _replay_turns(seats, shoe, actions):
+        if acting == seat_index:
+            return opening, dealer, action
+    return opening, dealer, 'none'
+
+
+class TableRecorder:
+    """Writes finished table hands and chip credits to the database on its own thread.
+
+    Hands are written in batches. Credits (cash-outs and refused buy-ins) are
+    written as soon as they arrive, each in its own transaction. A credit or a
+    batch of hands that fails to commit is kept and retried every interval
+    seconds until it does; hands that arrive meanwhile join the batch. close
+    writes out everything queued and stops the thread; the next item starts
+    it again.
+    """
+
+    def __init__(self, app, batch=RECORD_BATCH, interval=RECORD_INTERVAL):
+        self.app = app
+        self.batch = batch
+        self.interval = interval
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def record(self, records):
+        if records:
+            self._put(('hands', records))
+
+    def credit(self, user_id, amount, kind):
+        """Queue a ledger credit; returns a Future for the bankroll once it has committed."""
+        future = concurrent.futures.Future()
+        self._put(('credit', (user_id, amount, kind, future)))
+        return future
+
+    def _put(self, item):
+        # Under the lock, so a thread on its way out after close cannot miss the item
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name='table-recorder')
+                self._thread.start()
+            self._queue.put(item)
+
+    def close(self, timeout=None):
+        """Write everything queued so far and stop the thread, waiting at most timeout seconds.
+
+        Writes that keep failing are still retried after the wait gives up.
+        """
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._queue.put(('stop', None))
+        thread.join(timeout)
+
+    def _run(self):
+        hands, credits = [], []
+        stopping = False
+        while True:
+            # With credits or hands still to retry, wake up after interval even if nothing arrives
+            try:
+                item = self._queue.get(timeout=self.interval if credits or hands else None)
+            except queue.Empty:
+                pass
+            else:
+                stopping |= self._take(item, hands, credits)
+            deadline = time.monotonic() + self.interval
+            while not stopping and not credits and len(hands) < self.batch and time.monotonic() < deadline:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                stopping |= self._take(item, hands, credits)
+            credits = self.write_credits(credits)
+            if hands:
+                try:
+                    self.write(hands)
+                except Exception:
+                    self.app.logger.exception("Recording %d table hands failed; retrying", len(hands))
+                else:
+                    hands = []
+            if stopping and not hands and not credits:
+                with self._lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+
+    @staticmethod
+    def _take(item, hands, credits):
+        """File a queued item under hands or credits; returns True for the stop marker close puts."""
+        kind, payload = item
+        if kind == 'hands':
+            hands.extend(payload)
+        elif kind == 'credit':
+            credits.append(payload)
+        return kind == 'stop'
+
+    def write_credits(self, credits):
+        """Commit each queued credit and resolve its Future; returns the ones that failed."""
+        failed = []
+        for user_id, amount, kind, future in credits:
+            try:
+                with self.app.app_context():
+                    balance = credit(user_id, amount, kind)
+                    db.session.commit()
+            except Exception:
+                self.app.logger.exception("Crediting %d chips to user %s failed; retrying", amount, user_id)
+                failed.append((user_id, amount, kind, future))
+            else:
+                future.set_result(balance)
+        return failed
+
+    def write(self, records):
+        """Insert a batch of finished hands as GameSession rows and add them to each player's stats."""
+        with self.app.app_context():
+            db.session.execute(insert(GameSession), [
+                {key: record[key] for key in RECORD_COLUMNS} for record in records
+            ])
+            by_user = {}
+            for record in records:
+                by_user.setdefault(record['user_id'], []).append((record['outcome'], record['bet'], record['net']))
+            for user_id, hands in by_user.items():
+                UserStats.add_hands(user_id, hands)
+            db.session.commit()
+
+    def reconcile_buy_ins(self):
+        """Credit back chips an earlier process left at its tables; returns how many seats it settled.
+
+        A buy-in with no cash-out, refund or reconciliation after it is a seat
+        that process never stood up. The player gets the stack after the last
+        table hand recorded for them since, or the buy-in if there was none.
+        Only safe while no table in any process has a seat.
+        """
+        with self.app.app_context():
+            latest = select(func.max(LedgerEntry.id)).where(
+                LedgerEntry.kind.in_(('buyin', 'cashout', 'refund', 'reconcile')),
+            ).group_by(LedgerEntry.user_id)
+            orphans = db.session.scalars(
+                select(LedgerEntry).where(LedgerEntry.id.in_(latest), LedgerEntry.kind == 'buyin'),
+            ).all()
+            for buy_in in orphans:
+                credit(buy_in.user_id, self._stack_since(buy_in), 'reconcile')
+            db.session.commit()
+            return len(orphans)
+
+    @staticmethod
+    def _stack_since(buy_in):
+        rows = db.session.execute(select(GameSession.final_bankroll, GameSession.hand_log).where(
+            GameSession.user_id == buy_in.user_id, GameSession.timestamp >= buy_in.created_at,
+        ).order_by(GameSession.id.desc()))
+        for final_bankroll, hand_log in rows:
+            if is_table_log(hand_log):
+                return final_bankroll
+        return -buy_in.amount
+
+
+class TableServer:
+    """Runs every table in this process on one event loop, started on first use."""
+
+    def __init__(self, recorder, max_tables=DEFAULT_MAX_TABLES, turn_timeout=DEFAULT_TURN_TIMEOUT,
+                 bet_window=DEFAULT_BET_WINDOW, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 max_tables_per_user=DEFAULT_MAX_TABLES_PER_USER):
+        self.recorder = recorder
+        self.max_tables = max_tables
+        self.max_tables_per_user = max_tables_per_user
+        self.idle_timeout = idle_timeout
+        self.turn_timeout = turn_timeout
+        self.bet_window = bet_window
+        # Only touched on the loop thread
+        self.tables = {}
+        self.seated = {}  # user id -> table id
+        self._loop = None
+        self._lock = threading.Lock()
+        self._reconciled = False
+
+    def ensure_reconciled(self):
+        """Before this process seats anyone, give back the chips a previous one left at its tables."""
+        if self._reconciled:
+            return
+        with self._lock:
+            if not self._reconciled:
+                settled = self.recorder.reconcile_buy_ins()
+                if settled:
+                    logger.warning("Returned chips for %d seats left at tables by an earlier process", settled)
+                self._reconciled = True
+
+    def shutdown(self, timeout=COMMAND_TIMEOUT):
+        """Cash out every seat and close every table, then wait up to timeout seconds for the credits to commit.
+
+        A round in play is called off and its stakes go back with the stacks.
+        """
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result(timeout)
+            except Exception:
+                logger.exception("Cashing out the tables failed")
+            loop.call_soon_threadsafe(loop.stop)
+        self.recorder.close(timeout)
+
+    async def _shutdown(self):
+        tables = list(self.tables.values())
+        for table in tables:
+            table._cash_out_all()
+            table.task.cancel()  # The actor is waiting for a command that will not come
+        await asyncio.gather(*(table.task for table in tables), return_exceptions=True)
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, daemon=True, name='table-server').start()
+                self._loop = loop
+            return self._loop
+
+    def call(self, coroutine, timeout=COMMAND_TIMEOUT):
+        """Run a coroutine on the table loop from a request thread and return its result.
+
+        Raises TimeoutError if it takes longer than timeout seconds.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self._get_loop()).result(timeout)
+
+    def create_table(self, rules, owner_id=None):
+        """Open a table with rules for owner_id; returns its snapshot.
+
+        The table closes if nobody is seated at it for idle_timeout seconds.
+        Raises TableLimit if the owner already has max_tables_per_user open.
+        """
+        return self.call(self._create(rules, owner_id))
+
+    async def _create(self, rules, owner_id):
+        if len(self.tables) >= self.max_tables:
+            raise TableBusy("No more tables can be opened right now.")
+        if owner_id is not None:
+            owned = sum(table.owner_id == owner_id for table in self.tables.values())
+            if owned >= self.max_tables_per_user:
+                raise TableLimit(f"You already have {owned} open tables; sit at one or let it close.")
+        table = Table(self, uuid.uuid4().hex, rules, owner_id)
+        table._set_deadline(self.idle_timeout)
+        self.tables[table.id] = table
+        table.task = asyncio.get_running_loop().create_task(table.run())
+        return table.snapshot()
+
+    def list_tables(self):
+        return self.call(self._list())
+
+    async def _list(self):
+        return [table.summary() for table in self.tables.values()]
+
+    def command(self, table_id, name, *args):
+        """Apply a command on the table's actor and return its result.
+
+        Raises LookupError for an unknown table and TableError if the table refuses.
+        """
+        return self.call(self._command(table_id, name, args))
+
+    async def _command(self, table_id, name, args):
+        table = self.tables.get(table_id)
+        if table is None:
+            raise LookupError("Table not found.")
+        return await table.submit(name, *args)
+
+    def sit(self, table_id, user_id, name, buy_in, seat_index=None):
+        """Seat a player whose buy_in has already left the bankroll; returns the seat index.
+
+        If the table refuses, or has not got to the request within
+        COMMAND_TIMEOUT, the buy-in is queued for refund and the error raised.
+        """
+        return self.call(self._sit(table_id, user_id, name, buy_in, seat_index), COMMAND_TIMEOUT + 1)
+
+    async def _sit(self, table_id, user_id, name, buy_in, seat_index):
+        expires = asyncio.get_running_loop().time() + COMMAND_TIMEOUT
+        try:
+            table = self.tables.get(table_id)
+            if table is None:
+                raise LookupError("Table not found.")
+            return await table.submit('sit', user_id, name, buy_in, seat_index, expires=expires)
+        except Exception:
+            self.recorder.credit(user_id, buy_in, 'refund')
+            raise
+
+    def wait(self, table_id, since, timeout):
+        """Long-poll for a snapshot newer than version since; raises LookupError for an unknown table."""
+        return self.call(self._wait(table_id, since, timeout), timeout + COMMAND_TIMEOUT)
+
+    async def _wait(self, table_id, since, timeout):
+        table = self.tables.get(table_id)
+        if table is None:
+            raise LookupError("Table not found.")
+        return await table.wait(since, timeout)
+
+    def table_of(self, user_id):
+        return self.call(self._table_of(user_id))
+
+    async def _table_of(self, user_id):
+        return self.seated.get(user_id)
+
+
+def create_table_server(app):
+    config = app.config
+    server = TableServer(
+        TableRecorder(app),
+        max_tables=config.get('MAX_TABLES') or DEFAULT_MAX_TABLES,
+        turn_timeout=config.get('TABLE_TURN_TIMEOUT') or DEFAULT_TURN_TIMEOUT,
+        bet_window=config.get('TABLE_BET_WINDOW') or DEFAULT_BET_WINDOW,
+        idle_timeout=config.get('TABLE_IDLE_TIMEOUT') or DEFAULT_IDLE_TIMEOUT,
+        max_tables_per_user=config.get('MAX_TABLES_PER_USER') or DEFAULT_MAX_TABLES_PER_USER,
+    )
+    app.before_request(server.ensure_reconciled)
+    atexit.register(server.shutdown)
+    return server
+
+
+def get_table_server():
+    return current_app.extensions['tables']
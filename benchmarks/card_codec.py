@@ -0,0 +1,37 @@
+"""Compare the card codec with pickle for a 6-deck shoe and a typical hand.
+
+Run from the repository root: python -m benchmarks.card_codec
+"""
+import pickle
+import timeit
+
+from app.card_codec import decode_cards, decode_shoe, encode_cards, encode_shoe
+from app.hand import Hand
+from app.shoe import Shoe
+
+ROUNDS = 20_000
+
+
+def measure(label, encode, decode, value):
+    encoded = encode(value)
+    encode_time = timeit.timeit(lambda: encode(value), number=ROUNDS) / ROUNDS
+    decode_time = timeit.timeit(lambda: decode(encoded), number=ROUNDS) / ROUNDS
+    print(f"{label:<22} {len(encoded):>6} bytes  encode {encode_time * 1e6:7.2f} us  decode {decode_time * 1e6:7.2f} us")
+
+
+def main():
+    shoe = Shoe(decks=6, seed=1)
+    shoe_as_list = [shoe.deal() for _ in range(len(shoe))]
+    shoe = Shoe(decks=6, seed=1)
+    hand = Hand(['10', '6', '3'])
+
+    measure("shoe, pickled Shoe", pickle.dumps, pickle.loads, shoe)
+    measure("shoe, pickled list", pickle.dumps, pickle.loads, shoe_as_list)
+    measure("shoe, card codec", encode_shoe, decode_shoe, shoe)
+    measure("hand, pickled Hand", pickle.dumps, pickle.loads, hand)
+    measure("hand, pickled list", pickle.dumps, pickle.loads, hand.to_list())
+    measure("hand, card codec", encode_cards, decode_cards, hand)
+
+
+if __name__ == '__main__':
+    main()
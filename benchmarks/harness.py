@@ -0,0 +1,111 @@
+"""Shared timing, JSON result storage and baseline comparison for the benchmark suites.
+
+Each suite produces {name: {"value", "unit", "higher_is_better"}}. Results are
+written to benchmarks/results/<suite>.json; --save-baseline also stores them as
+benchmarks/baselines/<suite>.json, and later runs flag any metric that is worse
+than the baseline by more than the tolerance. Baselines are per machine, so
+record one before measuring a change.
+"""
+import argparse
+import json
+import os
+import platform
+import timeit
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(ROOT, 'results')
+BASELINE_DIR = os.path.join(ROOT, 'baselines')
+DEFAULT_TOLERANCE = 0.10
+
+
+def best_time(function, repeat=5, min_time=0.2):
+    """Best per-call time in seconds over repeat runs of an auto-sized loop."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def metric(value, unit, higher_is_better=False):
+    return {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def parser(description):
+    arguments = argparse.ArgumentParser(description=description)
+    arguments.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    arguments.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                           help='relative slowdown that counts as a regression (default 0.10)')
+    arguments.add_argument('--output', help='write results JSON here instead of benchmarks/results/')
+    return arguments
+
+
+def _load(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write(path, document):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(results, baseline, tolerance):
+    """Return (name, baseline value, value, relative change) for every regressed metric."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if not before['value']:
+            # Nothing to scale against; any rise in a lower-is-better count (errors) is a regression
+            if not result['higher_is_better'] and result['value'] > 0:
+                regressions.append((name, before['value'], result['value'], float('inf')))
+            continue
+        change = (result['value'] - before['value']) / before['value']
+        worse = -change if result['higher_is_better'] else change
+        if worse > tolerance:
+            regressions.append((name, before['value'], result['value'], change))
+    return regressions
+
+
+def report(suite, results, args, parameters=None):
+    """Print, save and compare a suite's results; returns the process exit code."""
+    for name, result in results.items():
+        print(f"{name:<44} {result['value']:>14.4f} {result['unit']}")
+
+    document = {
+        'suite': suite,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'parameters': parameters or {},
+        'results': results,
+    }
+    path = args.output or os.path.join(RESULTS_DIR, f'{suite}.json')
+    _write(path, document)
+    print(f"\nResults written to {path}")
+
+    baseline_path = os.path.join(BASELINE_DIR, f'{suite}.json')
+    if args.save_baseline:
+        _write(baseline_path, document)
+        print(f"Baseline saved to {baseline_path}")
+        return 0
+
+    baseline = _load(baseline_path)
+    if baseline is None:
+        print("No baseline yet; run with --save-baseline to record one.")
+        return 0
+    if baseline.get('parameters') != document['parameters']:
+        print("Warning: baseline was recorded with different parameters.")
+    regressions = compare(results, baseline['results'], args.tolerance)
+    for name, before, after, change in regressions:
+        print(f"REGRESSION {name}: {before:.4f} -> {after:.4f} ({change:+.1%})")
+    if not regressions:
+        print(f"No regressions beyond {args.tolerance:.0%} against the baseline.")
+    return 1 if regressions else 0
+
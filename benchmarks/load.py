@@ -0,0 +1,164 @@
+"""In-process load test of the Flask API against a throwaway SQLite database.
+
+Virtual users register, log in, then play hands (bet, deal, follow the advice
+until the round settles, splitting pairs) on concurrent threads through the
+app's test client, so the numbers cover routing, the ORM, the ledger and the
+live state store without network noise. Only settled hands count towards
+throughput.hands. Run from the repository root:
+
+    python -m benchmarks.load --users 16 --concurrency 8 --hands 25 [--save-baseline]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from .harness import metric, parser, report
+
+BASE_URL = 'https://localhost'  # Session cookies are marked Secure
+PASSWORD = 'load-test-password'
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class VirtualUser:
+    """One account playing hands through its own test client (and cookie jar)."""
+
+    def __init__(self, app, name, timings, errors):
+        self.client = app.test_client()
+        self.name = name
+        self.timings = timings
+        self.errors = errors
+
+    def call(self, endpoint, json=None):
+        start = time.perf_counter()
+        response = self.client.post(f'/api/{endpoint}', json=json or {}, base_url=BASE_URL)
+        elapsed = time.perf_counter() - start
+        self.timings[endpoint].append(elapsed)
+        if response.status_code >= 400:
+            self.errors[endpoint] += 1
+        return response.get_json() or {}
+
+    def run(self, hands):
+        self.call('auth/register', {'username': self.name, 'password': PASSWORD})
+        self.call('auth/login', {'username': self.name, 'password': PASSWORD})
+        return sum(self.play_hand() for _ in range(hands))
+
+    def play_hand(self):
+        """Bet, deal and follow the advice until the round settles; returns True if it did."""
+        if 'error' in self.call('main/place-bet', {'bet': 10}):
+            return False
+        state = self.call('main/start-game')  # A natural settles on the deal
+        hand, first = 'original', True
+        # A response with an outcome but a next hand only finished the first hand of a split
+        while 'outcome' not in state or 'next_hand' in state:
+            if 'error' in state:
+                return False
+            if 'next_hand' in state:
+                hand = 'split'
+                state = self.call('main/hit', {'hand': hand})  # The split hand's second card
+                continue
+            action = self._action(state, first)
+            first = False
+            if action == 'split':
+                self.call('main/split')
+                state = self.call('main/hit', {'hand': hand})  # The first hand's second card
+            elif action == 'hit':
+                state = self.call('main/hit', {'hand': hand})
+            else:
+                state = self.call(f'main/{action}')
+        return 'error' not in state
+
+    @staticmethod
+    def _action(state, first):
+        """The endpoint to call for the advice, using only options open after the first decision."""
+        advice = state.get('advice')
+        if advice == 'P':
+            if first:
+                return 'split'
+            # Pairs are not split again: hit small ones, stand on the rest
+            return 'hit' if state.get('value', 0) < 12 else 'stand'
+        if first:
+            return {'H': 'hit', 'S': 'stand', 'D': 'double-down', 'Ds': 'double-down',
+                    'Rh': 'surrender', 'Rs': 'surrender'}[advice]
+        return {'H': 'hit', 'S': 'stand', 'D': 'hit', 'Ds': 'stand', 'Rh': 'hit', 'Rs': 'stand'}[advice]
+
+
+def run_load(users, concurrency, hands, bcrypt_rounds):
+    database = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    database.close()
+    # Config reads the environment at import time
+    os.environ['DATABASE_URI'] = f'sqlite:///{database.name}'
+    os.environ.setdefault('SECRET_KEY', 'load-test')
+    os.environ['BCRYPT_LOG_ROUNDS'] = str(bcrypt_rounds)
+    os.environ['PASSWORD_HASH_MAX_PENDING'] = str(max(16, 2 * concurrency))
+
+    from sqlalchemy import text
+    from app import create_app, db
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.session.execute(text('PRAGMA journal_mode=WAL'))
+        db.session.commit()
+
+    timings = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def play(index):
+        # Per-user buffers, merged at the end so threads never share a list
+        local_timings, local_errors = defaultdict(list), defaultdict(int)
+        played = VirtualUser(app, f'load-{index}', local_timings, local_errors).run(hands)
+        with lock:
+            for endpoint, values in local_timings.items():
+                timings[endpoint].extend(values)
+            for endpoint, count in local_errors.items():
+                errors[endpoint] += count
+        return played
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        hands_played = sum(pool.map(play, range(users)))
+    elapsed = time.perf_counter() - start
+
+    app.extensions['password_hasher'].shutdown()
+    os.unlink(database.name)
+
+    requests = sum(len(values) for values in timings.values())
+    results = {
+        'throughput.requests': metric(requests / elapsed, 'req/s', higher_is_better=True),
+        'throughput.hands': metric(hands_played / elapsed, 'hands/s', higher_is_better=True),
+        'errors': metric(sum(errors.values()), 'count'),
+    }
+    ms = 1e3
+    for endpoint, values in sorted(timings.items()):
+        results[f'{endpoint}.p50'] = metric(_percentile(values, 0.50) * ms, 'ms')
+        results[f'{endpoint}.p95'] = metric(_percentile(values, 0.95) * ms, 'ms')
+        results[f'{endpoint}.p99'] = metric(_percentile(values, 0.99) * ms, 'ms')
+    return results
+
+
+def main():
+    arguments = parser(__doc__.splitlines()[0])
+    arguments.add_argument('--users', type=int, default=16, help='virtual users (default 16)')
+    arguments.add_argument('--concurrency', type=int, default=8, help='threads driving users (default 8)')
+    arguments.add_argument('--hands', type=int, default=25, help='hands per user (default 25)')
+    arguments.add_argument('--bcrypt-rounds', type=int, default=4,
+                           help='bcrypt cost for the test accounts (default 4, the minimum)')
+    args = arguments.parse_args()
+
+    parameters = {'users': args.users, 'concurrency': args.concurrency, 'hands': args.hands,
+                  'bcrypt_rounds': args.bcrypt_rounds}
+    results = run_load(args.users, args.concurrency, args.hands, args.bcrypt_rounds)
+    sys.exit(report('load', results, args, parameters))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Micro-benchmarks for the game_logic hot paths and the simulators.
+
+Run from the repository root: python -m benchmarks.micro [--save-baseline]
+"""
+import random
+import sys
+import time
+
+import numpy as np
+
+from app.game_logic import auto_play_hand, calculate_hand_value, create_deck, deal_card
+from app.hand import Hand
+from app.shoe import Shoe
+from app.simulation import basic_strategy_policy, simulate
+from app.strategy import advise, get_strategy_table
+
+from .harness import best_time, metric, parser, report
+
+SIMULATION_HANDS = 1_000_000
+AUTOPLAY_HANDS = 20_000
+
+
+def bench_deal_card_list():
+    deck = create_deck()
+    random.Random(1).shuffle(deck)
+
+    def deal_all():
+        cards = deck[:]
+        for _ in range(52):
+            deal_card(cards)
+    return best_time(deal_all) / 52
+
+
+def bench_deal_card_shoe():
+    shoe = Shoe(decks=1, penetration=1.0, seed=1)
+    counts = list(shoe.counts)
+
+    def deal_all():
+        shoe.position = 0
+        shoe.counts = counts[:]
+        for _ in range(52):
+            deal_card(shoe)
+    return best_time(deal_all) / 52
+
+
+def bench_autoplay_hands():
+    shoe = Shoe(seed=1)
+    table = get_strategy_table()
+    start = time.perf_counter()
+    for _ in range(AUTOPLAY_HANDS):
+        shoe.reshuffle_if_needed()
+        auto_play_hand(shoe, table, 1)
+    return AUTOPLAY_HANDS / (time.perf_counter() - start)
+
+
+def bench_simulate():
+    policy = basic_strategy_policy()
+    rng = np.random.default_rng(1)
+    simulate(10_000, decks=6, policy=policy, rng=rng)  # Warm up
+    start = time.perf_counter()
+    simulate(SIMULATION_HANDS, decks=6, policy=policy, rng=rng)
+    return SIMULATION_HANDS / (time.perf_counter() - start)
+
+
+def run():
+    list_hand = ['A', '7', '3']
+    hand = Hand(list_hand)
+    get_strategy_table()  # Build or load the table before timing lookups
+    us = 1e6
+    return {
+        'create_deck': metric(best_time(create_deck) * us, 'us'),
+        'deal_card.list': metric(bench_deal_card_list() * us, 'us'),
+        'deal_card.shoe': metric(bench_deal_card_shoe() * us, 'us'),
+        'calculate_hand_value.list': metric(best_time(lambda: calculate_hand_value(list_hand)) * us, 'us'),
+        'calculate_hand_value.hand': metric(best_time(lambda: calculate_hand_value(hand)) * us, 'us'),
+        'basic_strategy.list': metric(best_time(lambda: advise(list_hand, '6')) * us, 'us'),
+        'basic_strategy.hand': metric(best_time(lambda: advise(hand, '6')) * us, 'us'),
+        'full_hand.autoplay': metric(bench_autoplay_hands(), 'hands/s', higher_is_better=True),
+        'full_hand.vectorized_simulate': metric(bench_simulate(), 'hands/s', higher_is_better=True),
+    }
+
+
+def main():
+    args = parser(__doc__.splitlines()[0]).parse_args()
+    parameters = {'simulation_hands': SIMULATION_HANDS, 'autoplay_hands': AUTOPLAY_HANDS}
+    sys.exit(report('micro', run(), args, parameters))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,56 @@
-import random
+"""Console blackjack: an importable game engine plus an interactive and a scripted front end.
+
+    python blackjack.py                          # play at the console
+    python blackjack.py --script hands.txt       # play a script at full speed, one JSON result per hand
+    cat hands.txt | python blackjack.py --script - --seed 42 --rules "H17 6:5 LS"
+
+A script has one hand per line: the bet, then the actions to take, e.g.
+"20 hit stand" or "50 double". "auto" plays the rest of the hand by basic
+strategy; a hand still open when its line runs out stands. Blank lines and
+lines starting with # are skipped. With --seed the shoe is reproducible, so a
+recorded session replays card for card. --rules takes the RuleSet label form
+(see app/rules.py); the console table does not offer splits.
+"""
+import argparse
+import json
+import sys
+
+from app.cards import POINTS, hand_class
+from app.game_logic import hand_outcome, play_dealer
+from app.hand import Hand
+from app.rules import DEFAULT_RULES, RuleSet, strategy_table
+from app.shoe import Shoe
+from app.strategy import (ACTION_ADVICE, DOUBLE_HIT, DOUBLE_STAND, HIT, SPLIT, SURRENDER_HIT, SURRENDER_STAND,
+                          advise)
 
 # Define card values
 card_values = {'2': 2, '3': 3, '4': 4, '5': 5, '6': 6, '7': 7, '8': 8, '9': 9, '10': 10, 'J': 10, 'Q': 10, 'K': 10, 'A': 11}
 
+ALLOWED_BETS = (10, 20, 50, 100)
+STARTING_BANKROLL = 1000
+
+# Accepted spellings of each action
+ACTIONS = {
+    'hit': 'hit', 'h': 'hit',
+    'stand': 'stand', 's': 'stand',
+    'double': 'double', 'double down': 'double', 'd': 'double',
+    'surrender': 'surrender', 'r': 'surrender',
+}
+
 def create_deck():
     """Create a standard 52-card deck."""
     return [rank for rank in card_values.keys()] * 4
 
 def deal_card(deck):
-    """Deal a card from the deck."""
-    return deck.pop(random.randint(0, len(deck) - 1))
+    """Deal a card from a Shoe, or from the end of an already shuffled deck."""
+    if isinstance(deck, Shoe):
+        return deck.deal()
+    return deck.pop()
 
 def calculate_hand_value(hand):
     """Calculate the total value of a hand."""
+    if isinstance(hand, Hand):
+        return hand.value
     value = sum(card_values[card] for card in hand)
     # Adjust for aces
     aces = hand.count('A')
@@ -23,128 +61,312 @@ def calculate_hand_value(hand):
 
 def basic_strategy(player_hand, dealer_upcard):
     """Provide basic strategy advice based on the player's hand and dealer's upcard."""
-    player_value = calculate_hand_value(player_hand)
-    dealer_value = card_values[dealer_upcard]
-
-    if player_value >= 17:
-        return "Stand"
-    elif 13 <= player_value <= 16 and dealer_value < 7:
-        return "Stand"
-    elif 12 <= player_value <= 16 and dealer_value >= 7:
-        return "Hit"
-    elif player_value == 11:
-        return "Double down (if possible), otherwise Hit"
-    elif player_value == 10 and dealer_value < 10:
-        return "Double down (if possible), otherwise Hit"
-    elif player_value == 9 and 3 <= dealer_value <= 6:
-        return "Double down (if possible), otherwise Hit"
-    elif player_value <= 8:
-        return "Hit"
-    else:
-        return "Stand"
-
-def play_blackjack():
-    bankroll = 1000  # Starting bankroll
-    print("Welcome to Blackjack! You start with $1000.")
-    
-    while bankroll > 0:
+    return ACTION_ADVICE[advise(player_hand, dealer_upcard)]
+
+
+class BlackjackGame:
+    """One player's bankroll at a table with a persistent shoe, with no console I/O.
+
+    deal() starts a hand; hit(), stand(), double() and surrender() play it.
+    Each returns the finished hand's result dict once it is settled and None
+    while it is open; a blackjack on either side settles it on the deal.
+    """
+
+    def __init__(self, bankroll=STARTING_BANKROLL, shoe=None, rules=DEFAULT_RULES):
+        self.bankroll = bankroll
+        self.rules = rules
+        self.shoe = shoe if shoe is not None else Shoe(rules.decks)
+        self.hands_played = 0
+        self.player_hand = None
+        self.dealer_hand = None
+        self.bet = 0
+        self.actions = []
+        self.shuffled = False
+
+    @property
+    def in_round(self):
+        return self.player_hand is not None
+
+    def bet_error(self, bet):
+        """Return why a bet is not allowed, or None."""
+        if bet not in ALLOWED_BETS:
+            return f"Bet must be one of {', '.join(f'${amount}' for amount in ALLOWED_BETS)}."
+        if bet > self.bankroll:
+            return "Bet is more than your bankroll."
+        return None
+
+    def deal(self, bet):
+        """Take the bet and deal a new hand, reshuffling first if the cut card is out.
+
+        Returns the result if the dealer's peek or a player blackjack ends the hand at once.
+        """
+        if self.in_round:
+            raise ValueError("Finish the current hand first.")
+        error = self.bet_error(bet)
+        if error:
+            raise ValueError(error)
+        self.bet = bet
+        self.actions = []
+        self.shuffled = self.shoe.reshuffle_if_needed()
+        self.player_hand = Hand([self.shoe.deal_code(), self.shoe.deal_code()])
+        self.dealer_hand = Hand([self.shoe.deal_code(), self.shoe.deal_code()])
+        if self.player_hand.is_blackjack or self.dealer_hand.is_blackjack:
+            return self._settle()
+        return None
+
+    @property
+    def upcard(self):
+        return self.dealer_hand[0]
+
+    def advice(self):
+        return ACTION_ADVICE[strategy_table(self.rules).advise(self.player_hand, self.upcard)]
+
+    def hit(self):
+        self.actions.append('hit')
+        self.player_hand.add(self.shoe.deal_code())
+        if self.player_hand.is_bust:
+            return self._settle()
+        return None
+
+    def stand(self):
+        self.actions.append('stand')
+        return self._settle()
+
+    def double(self):
+        if len(self.player_hand) != 2:
+            raise ValueError("You can only double down on your first two cards.")
+        if not self.rules.can_double(self.player_hand):
+            raise ValueError("The table rules do not allow doubling this hand.")
+        # The bet stays in the bankroll until the hand settles, so doubling needs twice the bet
+        if self.bankroll < 2 * self.bet:
+            raise ValueError("Not enough bankroll to double down.")
+        self.actions.append('double')
+        self.bet *= 2
+        self.player_hand.add(self.shoe.deal_code())
+        return self._settle()
+
+    def surrender(self):
+        if not self.rules.can_surrender(self.player_hand):
+            raise ValueError("Surrender is only allowed on your first two cards, where the table offers it.")
+        self.actions.append('surrender')
+        return self._settle(surrendered=True)
+
+    def act(self, action):
+        """Play an action by name ('hit', 'stand', 'double', 'surrender' or an ACTIONS spelling)."""
+        name = ACTIONS.get(action.strip().lower())
+        if name is None:
+            raise ValueError(f"Unknown action {action!r}.")
+        return getattr(self, name)()
+
+    def auto_action(self):
+        """The basic strategy action for the open hand, as an action name."""
+        hand = self.player_hand
+        if hand.value >= 21:
+            return 'stand'
+        table, upcard_value = strategy_table(self.rules), POINTS[self.dealer_hand.codes[0]]
+        action = table.lookup(hand.hand_class(), upcard_value)
+        if action == SPLIT:
+            # No splitting at the console table; play the pair by its total
+            action = table.lookup(hand_class(hand.value, hand.soft), upcard_value)
+        if action in (DOUBLE_HIT, DOUBLE_STAND) and self.rules.can_double(hand) and self.bankroll >= 2 * self.bet:
+            return 'double'
+        if action in (SURRENDER_HIT, SURRENDER_STAND) and self.rules.can_surrender(hand):
+            return 'surrender'
+        return 'hit' if action in (HIT, DOUBLE_HIT, SURRENDER_HIT) else 'stand'
+
+    def _settle(self, surrendered=False):
+        player_hand, dealer_hand = self.player_hand, self.dealer_hand
+        if surrendered:
+            outcome = "surrender"
+        else:
+            if not (player_hand.is_bust or player_hand.is_blackjack or dealer_hand.is_blackjack):
+                # Dealer's turn
+                play_dealer(dealer_hand, self.shoe, self.rules)
+            outcome = hand_outcome(player_hand, dealer_hand)
+        player_value = player_hand.value
+        dealer_value = dealer_hand.value
+        net = self.rules.settle(outcome, self.bet)
+        self.bankroll += net
+        self.hands_played += 1
+
+        result = {
+            'hand': self.hands_played,
+            'bet': self.bet,
+            'actions': self.actions,
+            'player_hand': player_hand.to_list(),
+            'player_value': player_value,
+            'dealer_hand': dealer_hand.to_list(),
+            'dealer_value': dealer_value,
+            'outcome': outcome,
+            'net': net,
+            'bankroll': self.bankroll,
+            'shuffled': self.shuffled,
+        }
+        self.player_hand = self.dealer_hand = None
+        self.bet = 0
+        return result
+
+
+def parse_script_line(line):
+    """Return (bet, actions) for one script line, or None for blanks and comments."""
+    line = line.split('#', 1)[0].replace(',', ' ').strip()
+    if not line:
+        return None
+    tokens = line.lower().split()
+    try:
+        bet = int(tokens[0])
+    except ValueError:
+        raise ValueError(f"Expected a bet, got {tokens[0]!r}.")
+    actions = []
+    for token in tokens[1:]:
+        if token == 'down' and actions and actions[-1] == 'double':
+            continue  # "double down"
+        if token != 'auto' and token not in ACTIONS:
+            raise ValueError(f"Unknown action {token!r}.")
+        actions.append(ACTIONS.get(token, token))
+    return bet, actions
+
+
+def run_script(lines, game):
+    """Play scripted hands at full speed, yielding one result dict per script line.
+
+    Lines that cannot be played yield {'line': n, 'error': ...} and leave the
+    bankroll untouched.
+    """
+    for number, line in enumerate(lines, start=1):
+        try:
+            parsed = parse_script_line(line)
+            if parsed is None:
+                continue
+            bet, actions = parsed
+            result = game.deal(bet)
+        except ValueError as e:
+            yield {'line': number, 'error': str(e)}
+            continue
+
+        # A natural settles on the deal and the line's actions go unused
+        for action in actions if result is None else ():
+            if action == 'auto':
+                while result is None:
+                    result = game.act(game.auto_action())
+            else:
+                try:
+                    result = game.act(action)
+                except ValueError as e:
+                    result = game.stand()
+                    result['error'] = str(e)
+            if result is not None:
+                break
+        if result is None:
+            result = game.stand()
+        result['line'] = number
+        yield result
+
+
+def play_blackjack(game=None, read=input, write=print):
+    """Interactive console game; read and write default to input() and print()."""
+    if game is None:
+        game = BlackjackGame()
+    write(f"Welcome to Blackjack! You start with ${game.bankroll}.")
+
+    while game.bankroll > 0:
         # Show current bankroll
-        print(f"\nYour current bankroll: ${bankroll}")
-        
+        write(f"\nYour current bankroll: ${game.bankroll}")
+
         # Get the player's bet
         while True:
             try:
-                bet = int(input("Place your bet ($10, $20, $50, $100): "))
-                if bet in [10, 20, 50, 100] and bet <= bankroll:
-                    break
-                else:
-                    print("Invalid bet. Make sure it's one of the allowed amounts and within your bankroll.")
+                bet = int(read(f"Place your bet ({', '.join(f'${amount}' for amount in ALLOWED_BETS)}): "))
             except ValueError:
-                print("Please enter a valid number.")
-        
-        # Create and shuffle the deck
-        deck = create_deck()
-        random.shuffle(deck)
-
-        # Deal initial hands
-        player_hand = [deal_card(deck), deal_card(deck)]
-        dealer_hand = [deal_card(deck), deal_card(deck)]
+                write("Please enter a valid number.")
+                continue
+            if game.bet_error(bet) is None:
+                break
+            write("Invalid bet. Make sure it's one of the allowed amounts and within your bankroll.")
 
-        print(f"Your hand: {player_hand} (Value: {calculate_hand_value(player_hand)})")
-        print(f"Dealer's upcard: {dealer_hand[0]}")
+        result = game.deal(bet)
+        if game.shuffled:
+            write("Shuffling the shoe.")
+        if result is None:
+            player_hand = game.player_hand
+            write(f"Your hand: {player_hand} (Value: {player_hand.value})")
+            write(f"Dealer's upcard: {game.upcard}")
+        prompt = "Choose action: Hit, Stand, Double Down" + (", or Surrender: " if game.rules.surrender else ": ")
 
         # Play the player's hand
-        outcome = play_single_hand(player_hand, dealer_hand, deck, bet)
+        while result is None:
+            write(f"Strategy advice: {game.advice()}")
+            try:
+                result = game.act(read(prompt))
+            except ValueError as e:
+                write(str(e))
+                continue
+            if result is None:
+                write(f"Your hand: {player_hand} (Value: {player_hand.value})")
 
-        # Update bankroll based on outcome
-        if outcome[0] == "win":
-            bankroll += outcome[1]
-            print(f"You won ${outcome[1]}! Your new bankroll is ${bankroll}.")
-        elif outcome[0] == "lose":
-            bankroll -= outcome[1]
-            print(f"You lost ${outcome[1]}. Your new bankroll is ${bankroll}.")
-        elif outcome[0] == "tie":
-            print("It's a tie. Your bankroll remains the same.")
+        if not result['actions'] or result['actions'][-1] not in ('stand', 'surrender'):
+            write(f"Your hand: {result['player_hand']} (Value: {result['player_value']})")
+        if result['player_value'] > 21:
+            write("You bust! Dealer wins.")
+        else:
+            write(f"Dealer's hand: {result['dealer_hand']} (Value: {result['dealer_value']})")
 
-        # Ask if the player wants to continue
-        if bankroll <= 0:
-            print("You ran out of money! Game over.")
-            break
+        # Update bankroll based on outcome
+        if result['outcome'] == "blackjack":
+            write(f"Blackjack! You won ${result['net']}! Your new bankroll is ${game.bankroll}.")
+        elif result['outcome'] == "win":
+            write(f"You won ${result['net']}! Your new bankroll is ${game.bankroll}.")
+        elif result['outcome'] in ("lose", "surrender"):
+            write(f"You lost ${-result['net']}. Your new bankroll is ${game.bankroll}.")
         else:
-            continue_playing = input("Do you want to keep playing? (yes/no): ").lower()
-            if continue_playing != "yes":
-                print(f"You left the game with ${bankroll}.")
-                break
+            write("It's a tie. Your bankroll remains the same.")
 
-def play_single_hand(player_hand, dealer_hand, deck, bet):
-    """Play a single hand of blackjack."""
-    # Player's turn
-    while True:
-        # Give strategy advice
-        advice = basic_strategy(player_hand, dealer_hand[0])
-        print(f"Strategy advice: {advice}")
-
-        # Get player's action
-        action = input("Choose action: Hit, Stand, or Double Down: ").lower()
-        if action == 'hit':
-            player_hand.append(deal_card(deck))
-            print(f"Your hand: {player_hand} (Value: {calculate_hand_value(player_hand)})")
-            if calculate_hand_value(player_hand) > 21:
-                print("You bust! Dealer wins.")
-                return ["lose", bet]
-        elif action == 'stand':
+        # Ask if the player wants to continue
+        if game.bankroll <= 0:
+            write("You ran out of money! Game over.")
             break
-        elif action == 'double down':
-            if len(player_hand) == 2:
-                player_hand.append(deal_card(deck))
-                bet *= 2
-                print(f"Your hand: {player_hand} (Value: {calculate_hand_value(player_hand)})")
-                if calculate_hand_value(player_hand) > 21:
-                    print("You bust! Dealer wins.")
-                    return ["lose", bet]
-                
+        if read("Do you want to keep playing? (yes/no): ").lower() != "yes":
+            write(f"You left the game with ${game.bankroll}.")
             break
 
-    # Dealer's turn
-    print(f"Dealer's hand: {dealer_hand} (Value: {calculate_hand_value(dealer_hand)})")
-    while calculate_hand_value(dealer_hand) < 17:
-        dealer_hand.append(deal_card(deck))
-        print(f"Dealer's hand: {dealer_hand} (Value: {calculate_hand_value(dealer_hand)})")
-
-    # Determine winner
-    player_value = calculate_hand_value(player_hand)
-    dealer_value = calculate_hand_value(dealer_hand)
 
-    rlist = []
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play blackjack at the console or from a script.")
+    parser.add_argument('--script', help="file of scripted hands, or - for stdin; plays without prompts")
+    parser.add_argument('--output', help="write JSON results here instead of stdout (scripted mode)")
+    parser.add_argument('--bankroll', type=int, default=STARTING_BANKROLL)
+    parser.add_argument('--rules', default='', help='table rules, e.g. "6D H17 6:5 LS" (see app/rules.py)')
+    parser.add_argument('--decks', type=int, help="shorthand for the decks rule")
+    parser.add_argument('--seed', type=int, help="seed the shoe so a session can be replayed")
+    args = parser.parse_args(argv)
 
-    if dealer_value > 21 or player_value > dealer_value:
-        return ["win", bet]
-    elif player_value < dealer_value:
-        return ["lose", bet]
-    else:
-        return ["tie", 0]
+    try:
+        rules = RuleSet.parse(args.rules)
+        if args.decks is not None:
+            rules = rules.replace(decks=args.decks)
+    except ValueError as e:
+        parser.error(str(e))
+    game = BlackjackGame(args.bankroll, Shoe(decks=rules.decks, seed=args.seed), rules)
+    if args.script is None:
+        play_blackjack(game)
+        return 0
 
+    source = sys.stdin if args.script == '-' else open(args.script)
+    output = open(args.output, 'w') if args.output else sys.stdout
+    errors = 0
+    try:
+        for result in run_script(source, game):
+            errors += 'error' in result and 'outcome' not in result
+            output.write(json.dumps(result) + '\n')
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    print(f"{game.hands_played} hands, final bankroll ${game.bankroll}, {errors} unplayable lines",
+          file=sys.stderr)
+    return 1 if errors else 0
 
 
-# Run the game
-play_blackjack()
+if __name__ == '__main__':
+    sys.exit(main())
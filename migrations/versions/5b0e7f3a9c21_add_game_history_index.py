@@ -0,0 +1,26 @@
+"""index game_sessions on (user_id, timestamp, id) for keyset history reads
+
+Revision ID: 5b0e7f3a9c21
+Revises: c72d9e4b1a05
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b0e7f3a9c21'
+down_revision = 'c72d9e4b1a05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('game_sessions', schema=None) as batch_op:
+        batch_op.create_index('ix_game_sessions_user_history', ['user_id', 'timestamp', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('game_sessions', schema=None) as batch_op:
+        batch_op.drop_index('ix_game_sessions_user_history')
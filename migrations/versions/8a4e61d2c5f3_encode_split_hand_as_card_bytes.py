@@ -0,0 +1,78 @@
+"""encode split_hand as card bytes instead of a pickle
+
+Revision ID: 8a4e61d2c5f3
+Revises: 3f1c2a9d0b7e
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+import pickle
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4e61d2c5f3'
+down_revision = '3f1c2a9d0b7e'
+branch_labels = None
+depends_on = None
+
+# Rank codes as in app/cards.py, frozen here so the migration never changes
+RANKS = ('2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A')
+
+game_sessions = sa.table(
+    'game_sessions',
+    sa.column('id', sa.Integer),
+    sa.column('split_hand', sa.LargeBinary),
+    sa.column('split_hand_cards', sa.LargeBinary),
+)
+
+
+def _to_ranks(hand):
+    # Stored split hands are lists of rank strings or app.hand.Hand objects
+    return [str(card) for card in hand]
+
+
+def upgrade():
+    with op.batch_alter_table('game_sessions') as batch_op:
+        batch_op.add_column(sa.Column('split_hand_cards', sa.LargeBinary(), nullable=True))
+
+    # The legacy pickles were written by this application, so loading them here is safe
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select(game_sessions.c.id, game_sessions.c.split_hand).where(game_sessions.c.split_hand.isnot(None))
+    ).fetchall()
+    for session_id, data in rows:
+        encoded = bytes(RANKS.index(card) for card in _to_ranks(pickle.loads(data)))
+        connection.execute(
+            game_sessions.update().where(game_sessions.c.id == session_id).values(split_hand_cards=encoded)
+        )
+
+    with op.batch_alter_table('game_sessions') as batch_op:
+        batch_op.drop_column('split_hand')
+        batch_op.alter_column('split_hand_cards', new_column_name='split_hand')
+
+
+def downgrade():
+    legacy = sa.table(
+        'game_sessions',
+        sa.column('id', sa.Integer),
+        sa.column('split_hand', sa.LargeBinary),
+        sa.column('split_hand_pickle', sa.LargeBinary),
+    )
+    with op.batch_alter_table('game_sessions') as batch_op:
+        batch_op.add_column(sa.Column('split_hand_pickle', sa.PickleType(), nullable=True))
+
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select(legacy.c.id, legacy.c.split_hand).where(legacy.c.split_hand.isnot(None))
+    ).fetchall()
+    for session_id, data in rows:
+        connection.execute(
+            legacy.update().where(legacy.c.id == session_id)
+            .values(split_hand_pickle=pickle.dumps([RANKS[code] for code in data]))
+        )
+
+    with op.batch_alter_table('game_sessions') as batch_op:
+        batch_op.drop_column('split_hand')
+        batch_op.alter_column('split_hand_pickle', new_column_name='split_hand')
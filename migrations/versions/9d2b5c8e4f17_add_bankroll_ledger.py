@@ -0,0 +1,64 @@
+"""add bankroll_ledger and idempotency_keys tables
+
+Revision ID: 9d2b5c8e4f17
+Revises: 5b0e7f3a9c21
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2b5c8e4f17'
+down_revision = '5b0e7f3a9c21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('bankroll_ledger',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.Column('balance_after', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('game_session_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['game_session_id'], ['game_sessions.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('bankroll_ledger', schema=None) as batch_op:
+        batch_op.create_index('ix_bankroll_ledger_user', ['user_id', 'id'], unique=False)
+
+    op.create_table('idempotency_keys',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('endpoint', sa.String(length=50), nullable=False),
+    sa.Column('status_code', sa.Integer(), nullable=True),
+    sa.Column('response', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'key')
+    )
+    with op.batch_alter_table('idempotency_keys', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_idempotency_keys_created_at'), ['created_at'], unique=False)
+
+    # Existing balances become each user's opening entry
+    op.execute("""
+        INSERT INTO bankroll_ledger (user_id, amount, balance_after, kind)
+        SELECT id, COALESCE(bankroll, 0), COALESCE(bankroll, 0), 'opening'
+        FROM users
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('idempotency_keys', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_idempotency_keys_created_at'))
+
+    op.drop_table('idempotency_keys')
+    with op.batch_alter_table('bankroll_ledger', schema=None) as batch_op:
+        batch_op.drop_index('ix_bankroll_ledger_user')
+
+    op.drop_table('bankroll_ledger')
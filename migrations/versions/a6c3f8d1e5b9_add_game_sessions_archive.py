@@ -0,0 +1,64 @@
+"""add game_sessions_archive for old finished sessions
+
+Revision ID: a6c3f8d1e5b9
+Revises: e41a7c3f9b62
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6c3f8d1e5b9'
+down_revision = 'e41a7c3f9b62'
+branch_labels = None
+depends_on = None
+
+# SQLite reflects the ledger's foreign key without a name; batch mode names it by this convention
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+LEDGER_SESSION_FK = 'fk_bankroll_ledger_game_session_id_game_sessions'
+SESSION_COLUMNS = 'id, user_id, outcome, bet, final_bankroll, timestamp, doubled_down, split_hand, hand_log'
+
+
+def _ledger_session_fk():
+    for foreign_key in sa.inspect(op.get_bind()).get_foreign_keys('bankroll_ledger'):
+        if foreign_key['referred_table'] == 'game_sessions':
+            return foreign_key['name'] or LEDGER_SESSION_FK
+    return None
+
+
+def upgrade():
+    op.create_table('game_sessions_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('outcome', sa.String(length=10), nullable=True),
+    sa.Column('bet', sa.Integer(), nullable=True),
+    sa.Column('final_bankroll', sa.Integer(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.Column('doubled_down', sa.Boolean(), nullable=True),
+    sa.Column('split_hand', sa.LargeBinary(), nullable=True),
+    sa.Column('hand_log', sa.LargeBinary(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('game_sessions_archive', schema=None) as batch_op:
+        batch_op.create_index('ix_game_sessions_archive_user_history', ['user_id', 'timestamp', 'id'], unique=False)
+
+    # Payout entries keep their session id after the session moves to the archive
+    foreign_key = _ledger_session_fk()
+    if foreign_key is not None:
+        with op.batch_alter_table('bankroll_ledger', schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+            batch_op.drop_constraint(foreign_key, type_='foreignkey')
+
+
+def downgrade():
+    op.execute(f"INSERT INTO game_sessions ({SESSION_COLUMNS}) SELECT {SESSION_COLUMNS} FROM game_sessions_archive")
+
+    with op.batch_alter_table('bankroll_ledger', schema=None) as batch_op:
+        batch_op.create_foreign_key(LEDGER_SESSION_FK, 'game_sessions', ['game_session_id'], ['id'])
+
+    with op.batch_alter_table('game_sessions_archive', schema=None) as batch_op:
+        batch_op.drop_index('ix_game_sessions_archive_user_history')
+
+    op.drop_table('game_sessions_archive')
@@ -0,0 +1,57 @@
+"""add user_stats table with running per-user totals
+
+Revision ID: c72d9e4b1a05
+Revises: 8a4e61d2c5f3
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c72d9e4b1a05'
+down_revision = '8a4e61d2c5f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('hands_played', sa.Integer(), nullable=False),
+    sa.Column('wins', sa.Integer(), nullable=False),
+    sa.Column('losses', sa.Integer(), nullable=False),
+    sa.Column('ties', sa.Integer(), nullable=False),
+    sa.Column('total_wagered', sa.BigInteger(), nullable=False),
+    sa.Column('net_result', sa.BigInteger(), nullable=False),
+    sa.Column('biggest_win', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    with op.batch_alter_table('user_stats', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_stats_net_result'), ['net_result'], unique=False)
+
+    # Backfill from existing history once, so the counters start out correct
+    op.execute("""
+        INSERT INTO user_stats (user_id, hands_played, wins, losses, ties, total_wagered, net_result, biggest_win)
+        SELECT user_id,
+               COUNT(*),
+               SUM(CASE WHEN outcome = 'win' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN outcome = 'lose' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN outcome = 'tie' THEN 1 ELSE 0 END),
+               COALESCE(SUM(bet), 0),
+               COALESCE(SUM(CASE WHEN outcome = 'win' THEN bet WHEN outcome = 'lose' THEN -bet ELSE 0 END), 0),
+               COALESCE(MAX(CASE WHEN outcome = 'win' THEN bet ELSE 0 END), 0)
+        FROM game_sessions
+        WHERE outcome IS NOT NULL
+        GROUP BY user_id
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('user_stats', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_stats_net_result'))
+
+    op.drop_table('user_stats')
@@ -0,0 +1,26 @@
+"""add game_sessions.hand_log for deterministic replay
+
+Revision ID: e41a7c3f9b62
+Revises: 9d2b5c8e4f17
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41a7c3f9b62'
+down_revision = '9d2b5c8e4f17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('game_sessions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('hand_log', sa.LargeBinary(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('game_sessions', schema=None) as batch_op:
+        batch_op.drop_column('hand_log')
@@ -1,5 +1,5 @@
 from app import create_app, db
-from app.models import User, GameSession
+from app.models import User, GameSession, ArchivedGameSession, UserStats, LedgerEntry
 from flask_migrate import Migrate
 
 app = create_app()
@@ -8,7 +8,8 @@ migrate = Migrate(app, db)  # Initialize Flask-Migrate with the app and db
 # For CLI access to the database models
 @app.shell_context_processor
 def make_shell_context():
-    return {'db': db, 'User': User, 'GameSession': GameSession}
+    return {'db': db, 'User': User, 'GameSession': GameSession,
+            'ArchivedGameSession': ArchivedGameSession, 'UserStats': UserStats, 'LedgerEntry': LedgerEntry}
 
 if __name__ == '__main__':
     app.run(debug=True)
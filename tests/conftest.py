@@ -0,0 +1,130 @@
+"""Shared fixtures: one app on a throwaway SQLite database and logged-in players."""
+import itertools
+import os
+import tempfile
+
+import pytest
+
+# Config reads the environment when app is imported, so it is set first
+_db_dir = tempfile.mkdtemp(prefix='blackjack-tests-')
+os.environ.update({
+    'SECRET_KEY': 'test',
+    'DATABASE_URI': 'sqlite:///' + os.path.join(_db_dir, 'test.db'),
+    'BCRYPT_LOG_ROUNDS': '4',
+    'PASSWORD_HASH_WORKERS': '0',
+    'ARCHIVE_INTERVAL': '0',
+    'TABLE_RULES': '6D S17 3:2 DAS LS SP1',
+})
+os.environ.pop('LIVE_STATE_URL', None)
+
+from app import create_app, db  # noqa: E402
+from app.hand import Hand  # noqa: E402
+from app.live_state import LiveGame, get_state_store  # noqa: E402
+from app.models import GameSession, LedgerEntry, User, UserStats  # noqa: E402
+from app.shoe import Shoe  # noqa: E402
+
+BASE_URL = 'https://localhost'  # Session cookies are Secure
+DECKS = 6
+_names = itertools.count()
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def no_natural(player_hand, dealer_hand):
+    return not player_hand.is_blackjack and not dealer_hand.is_blackjack
+
+
+class Player:
+    """A registered, logged-in user with a test client; request helpers return (status, JSON)."""
+
+    def __init__(self, app):
+        self.app = app
+        self.name = f"player{next(_names)}"
+        response = app.test_client().post('/api/auth/register', json={'username': self.name, 'password': 'pw'},
+                                          base_url=BASE_URL)
+        assert response.status_code == 201
+        self.client = self.login()
+        with app.app_context():
+            self.id = User.query.filter_by(username=self.name).one().id
+
+    def login(self):
+        """A fresh client with its own session for this user."""
+        client = self.app.test_client()
+        response = client.post('/api/auth/login', json={'username': self.name, 'password': 'pw'}, base_url=BASE_URL)
+        assert response.status_code == 200
+        return client
+
+    def post(self, path, json=None, client=None, headers=None):
+        response = (client or self.client).post(path, json=json if json is not None else {}, headers=headers,
+                                                base_url=BASE_URL)
+        return response.status_code, response.get_json()
+
+    def get(self, path):
+        response = self.client.get(path, base_url=BASE_URL)
+        return response.status_code, response.get_json()
+
+    def deal_next(self, wanted, first_seed=0):
+        """Give this user a shoe whose next round opens with a deal wanted(player_hand, dealer_hand) accepts.
+
+        Seeds are tried from first_seed up. The shoe is shuffled from a seed
+        like any other, so the hand replays.
+        """
+        for seed in itertools.count(first_seed):
+            shoe = Shoe.from_seed(DECKS, seed)
+            player_hand = Hand.from_codes(shoe.cards[0:2])
+            dealer_hand = Hand.from_codes(shoe.cards[2:4])
+            if wanted(player_hand, dealer_hand):
+                break
+        with self.app.app_context():
+            get_state_store().put(LiveGame(self.id, shoe=shoe))
+        return player_hand, dealer_hand
+
+    def start_round(self, bet, wanted=no_natural, first_seed=0):
+        """Bet and deal a round that opens the way wanted says; returns the start-game response."""
+        self.deal_next(wanted, first_seed)
+        assert self.post('/api/main/place-bet', {'bet': bet})[0] == 200
+        status, state = self.post('/api/main/start-game')
+        assert status == 200
+        return state
+
+    def last_session(self):
+        with self.app.app_context():
+            return GameSession.query.filter_by(user_id=self.id).order_by(GameSession.id.desc()).first()
+
+    def bankroll(self):
+        with self.app.app_context():
+            return db.session.get(User, self.id).bankroll
+
+    def ledger(self):
+        """(kind, amount) of every ledger entry, oldest first."""
+        with self.app.app_context():
+            entries = LedgerEntry.query.filter_by(user_id=self.id).order_by(LedgerEntry.id)
+            return [(entry.kind, entry.amount) for entry in entries]
+
+    def stats(self):
+        with self.app.app_context():
+            return (db.session.get(UserStats, self.id) or UserStats(**UserStats.ZERO)).to_dict()
+
+    def assert_books_balance(self):
+        """The bankroll is the sum of the ledger, and the starting bankroll plus the net of every hand."""
+        ledger = self.ledger()
+        assert ledger[0][0] == 'opening'
+        assert self.bankroll() == sum(amount for _, amount in ledger)
+        assert self.bankroll() == ledger[0][1] + self.stats()['net_result']
+
+
+@pytest.fixture
+def player(app):
+    return Player(app)
+
+
+@pytest.fixture
+def make_player(app):
+    return lambda: Player(app)
@@ -0,0 +1,96 @@
+"""The headless console engine and its scripted batch mode."""
+import json
+
+import pytest
+
+from blackjack import BlackjackGame, main, parse_script_line, run_script
+from app.rules import RuleSet
+from app.shoe import Shoe
+
+SCRIPT = """\
+# bet, then actions
+20 hit stand
+50 double
+10 auto
+100 surrender
+20
+10 h h h s
+"""
+
+
+def run_main(tmp_path, *args):
+    script = tmp_path / 'hands.txt'
+    script.write_text(SCRIPT)
+    output = tmp_path / f'out{len(list(tmp_path.iterdir()))}.jsonl'
+    status = main(['--script', str(script), '--output', str(output), *args])
+    return status, output.read_text()
+
+
+def test_seeded_script_replays_to_the_same_output(tmp_path):
+    status, first = run_main(tmp_path, '--seed', '42', '--rules', '6D LS')
+    assert status == 0
+    assert run_main(tmp_path, '--seed', '42', '--rules', '6D LS') == (status, first)
+    assert run_main(tmp_path, '--seed', '43', '--rules', '6D LS')[1] != first
+
+    results = [json.loads(line) for line in first.splitlines()]
+    assert [result['line'] for result in results] == [2, 3, 4, 5, 6, 7]
+    bankroll = 1000
+    for result in results:
+        bankroll += result['net']
+        assert result['bankroll'] == bankroll
+
+
+@pytest.mark.parametrize('line, parsed', [
+    ('', None),
+    ('   # only a comment', None),
+    ('20 hit, stand', (20, ['hit', 'stand'])),
+    ('50 Double Down', (50, ['double'])),
+    ('10 h s auto', (10, ['hit', 'stand', 'auto'])),
+])
+def test_parse_script_line(line, parsed):
+    assert parse_script_line(line) == parsed
+
+
+@pytest.mark.parametrize('line', ['twenty hit', '20 jump', '20 hit fly'])
+def test_parse_script_line_rejects_bad_lines(line):
+    with pytest.raises(ValueError):
+        parse_script_line(line)
+
+
+def test_bad_lines_are_reported_and_cost_nothing():
+    game = BlackjackGame(shoe=Shoe(seed=1), rules=RuleSet.parse('6D'))
+    results = list(run_script(['20 jump', '15 stand', '10 stand'], game))
+    assert [('error' in result, result['line']) for result in results] == [(True, 1), (True, 2), (False, 3)]
+    assert game.bankroll == 1000 + results[2]['net']
+    assert game.hands_played == 1
+
+
+def test_unplayable_lines_fail_the_run(tmp_path):
+    script = tmp_path / 'bad.txt'
+    script.write_text('20 stand\n20 dance\n')
+    assert main(['--script', str(script), '--output', str(tmp_path / 'out.jsonl'), '--seed', '1']) == 1
+
+
+@pytest.mark.parametrize('rules', ['7X', '6D SP9', '3:0'])
+def test_bad_rules_are_rejected(tmp_path, capsys, rules):
+    with pytest.raises(SystemExit) as exit_info:
+        main(['--script', str(tmp_path / 'missing.txt'), '--rules', rules])
+    assert exit_info.value.code == 2
+    assert 'rule' in capsys.readouterr().err.lower()
+
+
+def test_double_needs_the_bankroll_to_cover_it():
+    game = BlackjackGame(bankroll=30, shoe=Shoe(seed=3), rules=RuleSet.parse('6D'))
+    while game.deal(20) is not None:
+        pass  # A natural settled on the deal
+    with pytest.raises(ValueError):
+        game.double()
+    assert game.in_round and game.bet == 20
+
+
+def test_auto_play_does_not_double_past_the_bankroll():
+    rules = RuleSet.parse('6D')
+    for seed in range(200):
+        game = BlackjackGame(bankroll=150, shoe=Shoe(seed=seed), rules=rules)
+        for result in run_script(['100 auto'], game):
+            assert 'error' not in result and result['bet'] == 100
@@ -0,0 +1,43 @@
+"""Index plays and surrender indices in the counting simulator."""
+import pytest
+
+from app.cards import HAND_CLASS_LABELS
+from app.counting import FAB_4, _surrenders, simulate_counting, surrender_table
+from app.rules import RuleSet, strategy_table
+
+LATE_SURRENDER = RuleSet.parse('6D S17 3:2 DAS LS SP1')
+CLASSES = {label: cls for cls, label in enumerate(HAND_CLASS_LABELS)}
+
+
+def surrenders(label, upcard, count, indices=FAB_4):
+    table = strategy_table(LATE_SURRENDER)
+    return _surrenders(table, surrender_table(indices), CLASSES[label], upcard, count)
+
+
+def test_hard_16_against_a_ten_surrenders_at_any_count():
+    assert surrenders('hard 16', 10, -6)
+    assert surrenders('hard 16', 10, 6)
+
+
+@pytest.mark.parametrize('label, upcard, index', FAB_4)
+def test_fab_4_surrenders_from_its_index(label, upcard, index):
+    assert not surrenders(label, upcard, index - 1)
+    assert surrenders(label, upcard, index)
+
+
+def test_basic_strategy_surrenders_without_indices():
+    assert surrenders('hard 15', 10, -3, indices=())
+    assert not surrenders('hard 14', 10, 5, indices=())
+
+
+def test_systems_without_indices_play_basic_strategy():
+    ramp = {-100: 1, 2: 4}
+    with_indices = simulate_counting(20_000, system='ko', ramp=ramp, seed=5, rules=LATE_SURRENDER)
+    basic = simulate_counting(20_000, system='ko', ramp=ramp, deviations=False, seed=5, rules=LATE_SURRENDER)
+    assert with_indices.to_dict() == basic.to_dict()
+
+
+def test_hi_lo_indices_change_play():
+    with_indices = simulate_counting(20_000, seed=5, rules=LATE_SURRENDER)
+    basic = simulate_counting(20_000, deviations=False, seed=5, rules=LATE_SURRENDER)
+    assert with_indices.net != basic.net
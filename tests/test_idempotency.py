@@ -0,0 +1,29 @@
+"""Idempotency-Key replays of final answers and retries of transient ones."""
+from app.idempotency import HEADER
+from app.live_state import get_state_store
+
+
+def test_a_retried_bet_is_taken_once(player):
+    key = {HEADER: 'bet-1'}
+    first = player.post('/api/main/place-bet', {'bet': 10}, headers=key)
+    assert first[0] == 200
+    assert player.post('/api/main/place-bet', {'bet': 10}, headers=key) == first
+    assert [kind for kind, _ in player.ledger()].count('bet') == 1
+
+
+def test_a_rejected_request_replays_its_rejection(player):
+    key = {HEADER: 'bad-bet'}
+    status, body = player.post('/api/main/place-bet', {'bet': 5}, headers=key)
+    assert status == 400
+    # Same key, now a valid body: the stored answer comes back and nothing is debited
+    assert player.post('/api/main/place-bet', {'bet': 10}, headers=key) == (status, body)
+    assert player.bankroll() == 1000
+
+
+def test_a_transient_conflict_is_not_stored(app, player):
+    key = {HEADER: 'busy-bet'}
+    with app.app_context(), get_state_store().claim(player.id):
+        assert player.post('/api/main/place-bet', {'bet': 10}, headers=key)[0] == 409
+    # The retry runs the view instead of replaying the 409
+    assert player.post('/api/main/place-bet', {'bet': 10}, headers=key)[0] == 200
+    assert player.bankroll() == 990
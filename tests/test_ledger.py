@@ -0,0 +1,148 @@
+"""Settling the single-player game through the API against the ledger."""
+import threading
+import time
+
+import pytest
+
+from app import db, routes
+from app.models import UserStats
+from app.rules import get_rules
+
+from .conftest import no_natural
+
+BET = 20
+
+
+def test_stand_pays_the_outcome(app, player):
+    before = player.bankroll()
+    player.start_round(BET)
+    status, result = player.post('/api/main/stand')
+    assert status == 200
+    with app.app_context():
+        net = get_rules().settle(result['outcome'], BET)
+    assert player.bankroll() == before + net
+    assert player.ledger()[-2:] == [('bet', -BET), ('payout', BET + net)]
+    assert player.last_session().bet == BET
+    player.assert_books_balance()
+
+
+def test_double_pays_twice_the_bet(app, player):
+    before = player.bankroll()
+    player.start_round(BET, lambda hand, dealer: no_natural(hand, dealer) and not hand.soft and 9 <= hand.value <= 11)
+    status, result = player.post('/api/main/double-down')
+    assert status == 200
+    assert len(result['player_hand']) == 3
+    outcome = 'lose' if result['outcome'] == 'bust' else result['outcome']
+    with app.app_context():
+        net = get_rules().settle(outcome, 2 * BET)
+    assert player.bankroll() == before + net
+    assert player.ledger()[-3:] == [('bet', -BET), ('double', -BET), ('payout', 2 * BET + net)]
+    session = player.last_session()
+    assert session.bet == 2 * BET and session.doubled_down
+    player.assert_books_balance()
+
+
+def test_surrender_returns_half_the_bet(player):
+    before = player.bankroll()
+    player.start_round(BET)
+    status, result = player.post('/api/main/surrender')
+    assert status == 200
+    assert result['outcome'] == 'surrender'
+    assert player.bankroll() == before - BET // 2
+    assert player.ledger()[-1] == ('payout', BET // 2)
+    player.assert_books_balance()
+
+
+@pytest.mark.parametrize('double_split', [False, True])
+def test_split_settles_both_hands(app, player, double_split):
+    def pair(hand, dealer):
+        return no_natural(hand, dealer) and hand.is_pair and hand[0] != 'A'
+
+    before = player.bankroll()
+    player.start_round(BET, pair)
+    status, response = player.post('/api/main/split')
+    assert status == 200
+    # Each hand is dealt its second card, and the original hand plays first
+    assert len(response['original_hand']) == len(response['split_hand']) == 2
+    assert player.post('/api/main/hit', {'hand': 'split'})[0] == 400  # Not its turn yet
+    assert player.post('/api/main/stand')[1]['next_hand'] == 'split'
+    status, result = player.post('/api/main/double-down' if double_split else '/api/main/stand')
+    assert status == 200 and len(result['outcomes']) == 2
+
+    session = player.last_session()
+    stakes = [BET, 2 * BET if double_split else BET]
+    assert session.bet == sum(stakes)
+    with app.app_context():
+        net = sum(get_rules().settle(outcome, stake) for outcome, stake in zip(result['outcomes'], stakes))
+    assert player.bankroll() == before + net
+    assert player.ledger()[-1] == ('payout', session.bet + net)
+    assert sum(amount for kind, amount in player.ledger() if kind != 'opening') == net
+    player.assert_books_balance()
+
+
+def test_concurrent_stands_settle_once(app, player, monkeypatch):
+    # Slow the action down so both requests are in flight at once
+    apply_action = routes.apply_action
+
+    def slow_apply_action(*args, **kwargs):
+        time.sleep(0.2)
+        return apply_action(*args, **kwargs)
+
+    monkeypatch.setattr(routes, 'apply_action', slow_apply_action)
+    second = player.login()
+    player.start_round(BET)
+    statuses = []
+
+    def stand(client):
+        statuses.append(player.post('/api/main/stand', client=client)[0])
+
+    threads = [threading.Thread(target=stand, args=(client,)) for client in (player.client, second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(statuses) == [200, 409]
+    assert [kind for kind, _ in player.ledger()].count('payout') == 1
+    player.assert_books_balance()
+
+
+def test_concurrent_stats_updates_all_count(app, player):
+    def add_hands():
+        for _ in range(20):
+            with app.app_context():
+                UserStats.add_hands(player.id, [('win', 10, 10), ('lose', 10, -10), ('blackjack', 10, 15)])
+                db.session.commit()
+
+    threads = [threading.Thread(target=add_hands) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = player.stats()
+    assert stats['hands_played'] == 360
+    assert (stats['wins'], stats['losses'], stats['ties']) == (240, 120, 0)
+    assert stats['net_result'] == 6 * 20 * 15 and stats['biggest_win'] == 15
+
+
+def test_split_pairs_by_value(player):
+    player.start_round(BET, lambda hand, dealer: no_natural(hand, dealer) and hand.is_pair and hand[0] != hand[1])
+    status, response = player.post('/api/main/split')
+    assert status == 200
+    assert len(response['original_hand']) == len(response['split_hand']) == 2
+
+
+def test_split_aces_get_one_card_each(player):
+    before = player.bankroll()
+    player.start_round(BET, lambda hand, dealer: no_natural(hand, dealer) and hand[0] == hand[1] == 'A')
+    assert player.post('/api/main/split')[0] == 200
+    assert player.post('/api/main/hit', {'hand': 'original'})[0] == 400
+    assert player.post('/api/main/double-down')[0] == 400
+    assert player.post('/api/main/stand')[1]['next_hand'] == 'split'
+    assert player.post('/api/main/hit', {'hand': 'split'})[0] == 400
+    status, result = player.post('/api/main/stand')
+    assert status == 200 and len(result['outcomes']) == 2
+    assert [len(result['player_hand']), len(result['split_hand'])] == [2, 2]
+    assert player.last_session().bet == 2 * BET
+    assert player.ledger()[-3:-1] == [('bet', -BET), ('split', -BET)]
+    assert player.bankroll() == before - 2 * BET + player.ledger()[-1][1]
+    player.assert_books_balance()
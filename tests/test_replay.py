@@ -0,0 +1,118 @@
+"""Rebuilding settled hands from their logs and checking them against what was paid."""
+import random
+
+import pytest
+from sqlalchemy import update
+
+from app import db
+from app.game_logic import (
+    LOG_DOUBLE_SPLIT, LOG_HIT, LOG_HIT_SPLIT, LOG_SPLIT, LOG_STAND, LOG_STAND_FIRST, LOG_SURRENDER, hand_outcome,
+    hand_stakes, logged_actions, replay_hand, surrendered,
+)
+from app.models import GameSession, LedgerEntry, User
+from app.rules import get_rules
+
+from .conftest import no_natural
+
+BET = 20
+ROUNDS = 60
+
+
+def pair(hand, dealer):
+    return no_natural(hand, dealer) and hand.is_pair
+
+
+def play_random_round(player, rng):
+    """Deal from a random seed and play random actions until the round settles."""
+    wanted = rng.choice([pair, pair, no_natural, lambda hand, dealer: True])
+    state = player.start_round(BET, wanted, first_seed=rng.randrange(2 ** 32))
+    if 'outcome' in state:
+        return
+    cards = 2
+    if rng.random() < 0.15:
+        status, result = player.post('/api/main/surrender')
+        assert status == 200
+        return
+    if rng.random() < 0.8:
+        status, result = player.post('/api/main/split')
+        assert status in (200, 400)  # Refused unless the hand is a pair
+    hand = 'original'
+    for _ in range(20):
+        choice = rng.choice(['hit', 'stand', 'double-down', 'double-down'] if cards == 2 else ['hit', 'stand'])
+        if choice == 'hit':
+            status, result = player.post('/api/main/hit', {'hand': hand})
+        else:
+            status, result = player.post(f'/api/main/{choice}')
+        if status != 200:
+            cards = 3  # A double the rules refused, or a card for split aces: play on with hit or stand
+            continue
+        if result.get('next_hand') == 'split':
+            hand, cards = 'split', 2
+        elif 'outcome' in result:
+            return
+        else:
+            cards = len(result['hand'])
+    raise AssertionError("The round did not settle.")
+
+
+def test_replay_rebuilds_settled_hands(app, player):
+    with app.app_context():
+        db.session.execute(update(User).where(User.id == player.id).values(bankroll=100_000))
+        db.session.commit()
+    rng = random.Random(7)
+    for _ in range(ROUNDS):
+        play_random_round(player, rng)
+
+    with app.app_context():
+        rules = get_rules()
+        sessions = GameSession.query.filter_by(user_id=player.id).all()
+        assert len(sessions) == ROUNDS
+        seen = set()
+        for session in sessions:
+            game = replay_hand(session.hand_log)
+            assert bytes(game.hand_log) == session.hand_log
+            if game.split_hand is None:
+                assert session.split_hand is None
+            else:
+                assert game.split_hand.to_list() == session.split_hand.to_list()
+            # Score the replayed hands the way settle_game does and check them against what was paid
+            game.bet = BET
+            stakes = hand_stakes(game)
+            if surrendered(game):
+                outcomes = ['surrender']
+            else:
+                hands = [game.player_hand] + ([game.split_hand] if game.split_hand is not None else [])
+                outcomes = [hand_outcome(hand, game.dealer_hand, len(hands) > 1) for hand in hands]
+            net = sum(rules.settle(outcome, stake) for outcome, stake in zip(outcomes, stakes))
+            payout = LedgerEntry.query.filter_by(game_session_id=session.id, kind='payout').one()
+            assert sum(stakes) == session.bet
+            assert payout.amount == session.bet + net
+            if len(outcomes) == 1:
+                assert outcomes[0] == session.outcome
+            seen.update(logged_actions(game))
+    # The rounds covered the harder paths
+    assert {LOG_SPLIT, LOG_DOUBLE_SPLIT, LOG_SURRENDER} <= seen
+
+
+def test_replay_rejects_a_split_code_without_a_split(player):
+    player.start_round(BET)
+    player.post('/api/main/stand')
+    log = player.last_session().hand_log
+    assert replay_hand(log).split_hand is None
+    with pytest.raises(ValueError):
+        replay_hand(log[:-1] + bytes([LOG_HIT_SPLIT]))
+
+
+def test_replay_reads_logs_that_split_without_dealing(player):
+    player.start_round(BET, lambda hand, dealer: no_natural(hand, dealer) and hand.is_pair)
+    player.post('/api/main/split')
+    player.post('/api/main/stand')
+    player.post('/api/main/stand')
+    log = player.last_session().hand_log
+    assert log[-3:] == bytes([LOG_SPLIT, LOG_STAND_FIRST, LOG_STAND])
+    # The same round as an older log recorded it: each hand's second card was a hit
+    old_log = bytes([3]) + log[1:-3] + bytes([LOG_SPLIT, LOG_HIT, LOG_STAND_FIRST, LOG_HIT_SPLIT, LOG_STAND])
+    game, old_game = replay_hand(log), replay_hand(old_log)
+    assert old_game.player_hand.to_list() == game.player_hand.to_list()
+    assert old_game.split_hand.to_list() == game.split_hand.to_list()
+    assert old_game.dealer_hand.to_list() == game.dealer_hand.to_list()
@@ -0,0 +1,36 @@
+"""RuleSet's label form and its JSON form."""
+import itertools
+
+import pytest
+
+from app.rules import DEFAULT_RULES, RuleSet
+
+
+@pytest.mark.parametrize('label', [
+    '6D S17 3:2 DAS NS SP1 DA',
+    '1D H17 6:5 NDAS LS SP3 D10-11',
+    '8D H17 1:1 DAS LS SP0 D9-11',
+    '2D S17 2:1 NDAS NS SP2 DA',
+])
+def test_label_parses_back_to_itself(label):
+    assert RuleSet.parse(label).label == label
+
+
+def test_every_rule_set_survives_a_round_trip():
+    for decks, h17, payout, das, surrender, splits, double_on in itertools.product(
+            (1, 6), (False, True), (1.2, 1.5), (False, True), (False, True), (0, 3), (None, (10, 11))):
+        rules = RuleSet(decks, h17, payout, das, surrender, splits, double_on)
+        assert RuleSet.parse(rules.label) == rules
+        assert RuleSet.from_dict(rules.to_dict()) == rules
+
+
+def test_parse_keeps_the_base_rules_it_does_not_mention():
+    base = RuleSet.parse('2D H17 LS')
+    assert RuleSet.parse('ndas, sp3', base=base) == base.replace(double_after_split=False, max_splits=3)
+    assert RuleSet.parse('') == DEFAULT_RULES
+
+
+@pytest.mark.parametrize('label', ['7X', 'SP', '3:0', 'D11', '6D SP9'])
+def test_parse_rejects_unknown_rules(label):
+    with pytest.raises(ValueError):
+        RuleSet.parse(label)
@@ -0,0 +1,23 @@
+"""The on-disk strategy table cache."""
+import os
+
+from app import strategy
+from app.cards import NUM_CLASSES
+
+
+def test_stale_or_damaged_cache_files_are_recomputed(tmp_path, monkeypatch):
+    monkeypatch.setattr(strategy, 'CACHE_DIR', str(tmp_path))
+    compute = strategy.get_strategy_table.__wrapped__
+    table = compute()
+    (path,) = tmp_path.iterdir()
+    assert f"v{strategy.TABLE_VERSION}" in path.name
+
+    for damaged in (table.actions[:-10], bytes([len(strategy.ACTION_CODES)]) * NUM_CLASSES * 10):
+        path.write_bytes(damaged)
+        assert compute().actions == table.actions
+        assert path.read_bytes() == table.actions  # Rewritten
+
+    # A file from another table version is never looked at
+    monkeypatch.setattr(strategy, 'TABLE_VERSION', strategy.TABLE_VERSION + 1)
+    compute()
+    assert len(os.listdir(tmp_path)) == 2
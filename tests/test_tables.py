@@ -0,0 +1,232 @@
+"""Chips moving between bankrolls and a shared table, played through the API."""
+import time
+
+import pytest
+
+from app import db
+from app.card_codec import decode_table_log, encode_table_log
+from app.game_logic import hand_outcome
+from app.ledger import debit
+from app.models import GameSession
+from app.rules import get_rules
+from app.tables import BETTING, PLAYING, TableRecorder, TableServer, replay_table_hand, table_opening
+
+BUY_IN = 500
+
+
+def wait_for(condition, timeout=5):
+    """Poll until condition() is true; the recorder writes table hands on its own thread."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out waiting for the table recorder."
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def table(player):
+    status, snapshot = player.post('/api/tables')
+    assert status == 201
+    return snapshot['id']
+
+
+def hit_to_12(hand, seat):
+    return 'hit' if hand['value'] < 12 else 'stand'
+
+
+def play_round(players, table_id, choose=hit_to_12):
+    """Every player bets, then plays choose(hand, seat) by turn until the round settles."""
+    for bettor in players:
+        assert bettor.post(f'/api/tables/{table_id}/bet', {'bet': 20})[0] == 200
+    by_seat = {}
+    for _ in range(50):
+        snapshot = players[0].get(f'/api/tables/{table_id}')[1]
+        if snapshot['phase'] == BETTING:
+            return snapshot
+        assert snapshot['phase'] == PLAYING
+        for seat in snapshot['seats']:
+            if seat is not None:
+                by_seat[seat['seat']] = next(p for p in players if p.id == seat['user_id'])
+        turn = snapshot['turn']
+        seat = snapshot['seats'][turn['seat']]
+        action = choose(seat['hands'][turn['hand']], seat)
+        assert by_seat[turn['seat']].post(f'/api/tables/{table_id}/action', {'action': action})[0] == 200
+    raise AssertionError("The round did not settle.")
+
+
+def test_chips_come_back_with_the_table_results(player, make_player, table):
+    other = make_player()
+    players = [player, other]
+    for seated in players:
+        status, result = seated.post(f'/api/tables/{table}/sit', {'buy_in': BUY_IN})
+        assert status == 200 and result['remaining_bankroll'] == 1000 - BUY_IN
+
+    rounds = 5
+    for _ in range(rounds):
+        snapshot = play_round(players, table)
+    stacks = {seat['user_id']: seat['stack'] for seat in snapshot['seats'] if seat is not None}
+
+    for seated in players:
+        status, result = seated.post(f'/api/tables/{table}/leave')
+        assert status == 200
+        assert result['cashed_out'] == stacks[seated.id]
+        assert result['bankroll'] == 1000 - BUY_IN + stacks[seated.id]
+        assert seated.ledger()[-2:] == [('buyin', -BUY_IN), ('cashout', stacks[seated.id])]
+        wait_for(lambda: seated.stats()['hands_played'] == rounds)
+        seated.assert_books_balance()
+    assert player.get('/api/tables')[1]['tables'] == []  # The last player out closes the table
+
+
+def test_refused_seat_refunds_the_buy_in(player, make_player, table):
+    other = make_player()
+    assert player.post(f'/api/tables/{table}/sit', {'buy_in': BUY_IN, 'seat': 0})[0] == 200
+    status, _ = other.post(f'/api/tables/{table}/sit', {'buy_in': 300, 'seat': 0})
+    assert status == 409
+    wait_for(lambda: other.bankroll() == 1000)  # Refunds are written on the recorder's thread
+    assert other.post('/api/tables/no-such-table/sit', {'buy_in': 300})[0] == 404
+    wait_for(lambda: other.bankroll() == 1000)
+    assert other.ledger()[1:] == [('buyin', -300), ('refund', 300)] * 2
+    player.post(f'/api/tables/{table}/leave')
+
+
+def test_leaving_returns_an_unplayed_bet(player, table):
+    player.post(f'/api/tables/{table}/sit', {'buy_in': BUY_IN})
+    assert player.post(f'/api/tables/{table}/bet', {'bet': 20})[0] == 200  # Deals at once: the only seat
+    snapshot = player.get(f'/api/tables/{table}')[1]
+    if snapshot['phase'] == PLAYING:
+        assert player.post(f'/api/tables/{table}/leave')[0] == 409  # Not mid-hand
+        while snapshot['phase'] == PLAYING:
+            player.post(f'/api/tables/{table}/action', {'action': 'stand'})
+            snapshot = player.get(f'/api/tables/{table}')[1]
+    stack = snapshot['seats'][0]['stack']
+    assert player.post(f'/api/tables/{table}/leave')[1]['bankroll'] == 1000 - BUY_IN + stack
+    wait_for(lambda: player.stats()['hands_played'] == 1)
+    player.assert_books_balance()
+
+
+def test_empty_tables_close_and_are_capped_per_user(app, player, monkeypatch):
+    server = app.extensions['tables']
+    monkeypatch.setattr(server, 'idle_timeout', 0.2)
+    statuses = [player.post('/api/tables')[0] for _ in range(server.max_tables_per_user + 1)]
+    assert statuses[-1] == 429 and set(statuses[:-1]) == {201}
+
+    # Nobody sat down, so the tables close and free the user's allowance
+    wait_for(lambda: not any(table['players'] == 0 for table in player.get('/api/tables')[1]['tables']))
+    assert player.post('/api/tables')[0] == 201
+
+
+def split_and_double(hand, seat):
+    cards = hand['cards']
+    if len(cards) == 2 and cards[0] == cards[1] and len(seat['hands']) == 1:
+        return 'split'
+    if len(cards) == 2 and 9 <= hand['value'] <= 11:
+        return 'double'
+    return hit_to_12(hand, seat)
+
+
+def test_table_hands_replay_from_their_logs(app, player, make_player, table):
+    players = [player, make_player(), make_player()]
+    for seated in players:
+        assert seated.post(f'/api/tables/{table}/sit', {'buy_in': BUY_IN})[0] == 200
+    dealers = []
+    for _ in range(12):
+        dealers.append(play_round(players, table, split_and_double)['dealer']['cards'])
+    for seated in players:
+        wait_for(lambda: seated.stats()['hands_played'] >= 12)
+        seated.post(f'/api/tables/{table}/leave')
+
+    with app.app_context():
+        for seated in players:
+            sessions = db.session.query(GameSession).filter_by(user_id=seated.id).order_by(GameSession.id).all()
+            rounds = iter(dealers)
+            for session in sessions:
+                game = replay_table_hand(session.hand_log)
+                opening, _, action = table_opening(session.hand_log)
+                if decode_table_log(session.hand_log)[6] == 0:
+                    dealer = next(rounds)  # A split seat writes a row per hand of the same round
+                assert game.dealer_hand.to_list() == dealer
+                assert game.doubled_down == session.doubled_down
+                outcome = hand_outcome(game.player_hand, game.dealer_hand, action == 'split')
+                assert outcome == session.outcome
+                if action != 'split':
+                    assert game.player_hand.to_list()[:2] == opening.to_list()
+            assert next(rounds, None) is None
+
+
+def test_replay_route_deals_a_table_hand_again(player, table):
+    player.post(f'/api/tables/{table}/sit', {'buy_in': BUY_IN})
+    snapshot = play_round([player], table)
+    wait_for(lambda: player.stats()['hands_played'] == 1)
+    status, replayed = player.get(f'/api/main/history/{player.last_session().id}/replay')
+    assert status == 200
+    assert replayed['dealer_hand'] == snapshot['dealer']['cards']
+    assert replayed['outcome'] == snapshot['seats'][0]['results'][0]['outcome']
+    player.post(f'/api/tables/{table}/leave')
+
+
+def test_recorder_retries_a_failed_batch(app, player, monkeypatch):
+    recorder = TableRecorder(app, interval=0.05)
+    write = recorder.write
+    failures = []
+
+    def flaky_write(records):
+        if not failures:
+            failures.append(records)
+            raise RuntimeError("database unavailable")
+        write(records)
+
+    monkeypatch.setattr(recorder, 'write', flaky_write)
+    recorder.record([{
+        'user_id': player.id, 'outcome': 'win', 'bet': 20, 'net': 20, 'final_bankroll': 540, 'doubled_down': False,
+        'hand_log': None,
+    }])
+    wait_for(lambda: player.stats()['hands_played'] == 1)
+    assert failures and player.last_session().outcome == 'win'
+
+
+def buy_in(app, seated, amount=BUY_IN):
+    with app.app_context():
+        debit(seated.id, amount, 'buyin')
+        db.session.commit()
+
+
+def test_shutdown_cashes_out_every_seat(app, player, make_player):
+    server = TableServer(TableRecorder(app, interval=0.05))
+    with app.app_context():
+        table = server.create_table(get_rules())['id']
+    other, dealt = make_player(), make_player()
+    for seated in (player, other):
+        buy_in(app, seated)
+        server.sit(table, seated.id, 'player', BUY_IN)
+    server.command(table, 'bet', player.id, 20)  # Waits for the other seat to bet
+
+    with app.app_context():
+        second = server.create_table(get_rules())['id']
+    buy_in(app, dealt)
+    server.sit(second, dealt.id, 'dealt', BUY_IN)
+    server.command(second, 'bet', dealt.id, 20)  # The only seat, so the round is dealt at once
+
+    server.shutdown()
+    assert server.tables == {} and server.seated == {}
+    for seated in (player, other):
+        assert seated.bankroll() == 1000
+        assert seated.ledger()[-2:] == [('buyin', -BUY_IN), ('cashout', BUY_IN)]
+    # A round still in play is called off; one a natural settled on the deal was recorded
+    assert dealt.ledger()[-1][0] == 'cashout'
+    dealt.assert_books_balance()
+
+
+def test_startup_returns_orphaned_buy_ins(app, player, make_player):
+    app.extensions['tables'].recorder.close()  # Cash-outs from earlier tests are written, not orphaned
+    recorder = TableRecorder(app)
+    played = make_player()
+    buy_in(app, player, 300)
+    buy_in(app, played, 300)
+    with app.app_context():
+        # A table hand recorded after the buy-in leaves the stack it ended on
+        db.session.add(GameSession(user_id=played.id, outcome='win', bet=20, final_bankroll=320,
+                                   hand_log=encode_table_log(6, 1, 0, False, 1, 0, 0, b'')))
+        db.session.commit()
+    assert recorder.reconcile_buy_ins() == 2
+    assert player.ledger()[-1] == ('reconcile', 300)
+    assert played.ledger()[-1] == ('reconcile', 320)
+    assert recorder.reconcile_buy_ins() == 0